@@ -1,8 +1,23 @@
+import os
+import sys
+import glob
 import json
+import math
+import time
+import heapq
+import tempfile
+import hashlib
+import logging
+import threading
+import multiprocessing
 import numpy as np
 import scipy
-from itertools import combinations
-from scipy.interpolate import interp1d
+import scipy.sparse
+import scipy.spatial
+import scipy.cluster.hierarchy
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations, chain, product
 
 
 class Spectrum:
@@ -14,13 +29,9 @@ class Spectrum:
         if type( rhs ) is Spectrum:
             combined_wavelengths = np.union1d(self.wavelengths, rhs.wavelengths)
     
-            # Interpolate values of both spectra onto the combined wavelength array
-            interp_lhs = interp1d(self.wavelengths if len( self.wavelengths ) > 0 else [ 0.0 ], self.values if len( self.wavelengths ) > 0 else [ 0.0 ], bounds_error=False, fill_value=0)
-            interp_rhs = interp1d(rhs.wavelengths if len(rhs.wavelengths ) > 0 else [ 0.0 ], rhs.values if len(rhs.wavelengths ) > 0 else [ 0.0 ], bounds_error=False, fill_value=0)
-    
-            # Interpolated values
-            lhs_interpolated_values = interp_lhs(combined_wavelengths)
-            rhs_interpolated_values = interp_rhs(combined_wavelengths)
+            # Interpolated values of both spectra on the combined wavelength array (an empty spectrum is all zeros)
+            lhs_interpolated_values = self.resample( combined_wavelengths ).values
+            rhs_interpolated_values = rhs.resample( combined_wavelengths ).values
     
             # add the interpolated values
             result_values = lhs_interpolated_values + rhs_interpolated_values
@@ -33,13 +44,9 @@ class Spectrum:
         if type( rhs ) is Spectrum:
             combined_wavelengths = np.union1d(self.wavelengths, rhs.wavelengths)
     
-            # Interpolate values of both spectra onto the combined wavelength array
-            interp_lhs = interp1d(self.wavelengths if len( self.wavelengths ) > 0 else [ 0.0 ], self.values if len( self.wavelengths ) > 0 else [ 0.0 ], bounds_error=False, fill_value=0)
-            interp_rhs = interp1d(rhs.wavelengths if len(rhs.wavelengths ) > 0 else [ 0.0 ], rhs.values if len(rhs.wavelengths ) > 0 else [ 0.0 ], bounds_error=False, fill_value=0)
-    
-            # Interpolated values
-            lhs_interpolated_values = interp_lhs(combined_wavelengths)
-            rhs_interpolated_values = interp_rhs(combined_wavelengths)
+            # Interpolated values of both spectra on the combined wavelength array (an empty spectrum is all zeros)
+            lhs_interpolated_values = self.resample( combined_wavelengths ).values
+            rhs_interpolated_values = rhs.resample( combined_wavelengths ).values
     
             # Multiply the interpolated values
             result_values = lhs_interpolated_values * rhs_interpolated_values
@@ -54,8 +61,7 @@ class Spectrum:
         return np.interp( wavelength, self.wavelengths, self.values )
 
     def resample( self, wavelengths ):
-        interp = interp1d( self.wavelengths, self.values, bounds_error=False, fill_value=0 )
-        resampled_values = interp( wavelengths )
+        resampled_values = resampling_operator( self.wavelengths, wavelengths ) @ self.values
         return Spectrum( wavelengths, resampled_values )
 
     def integrate( self, range_min = 380, range_max = 730 ):
@@ -69,6 +75,82 @@ class Spectrum:
         return integrated_value
 
 
+# resampling between wavelength grids is linear: precomputed sparse operators, kept for the grid pairs that keep coming up
+# (measurement grid to the CMF grid, K/S grids to a combined grid, ...)
+RESAMPLING_CACHE_SIZE = 256
+resampling_operators = OrderedDict()
+resampling_operators_lock = threading.Lock()
+
+
+def resampling_operator( source_wavelengths, target_wavelengths ):
+    # ( target, source ) sparse matrix equivalent to linear interp1d with fill_value=0: each row has (at most) two
+    # non-zero weights, rows outside of the source range are zero
+    source_wavelengths = np.ascontiguousarray( source_wavelengths, dtype = float )
+    target_wavelengths = np.ascontiguousarray( target_wavelengths, dtype = float )
+    key = ( source_wavelengths.tobytes(), target_wavelengths.tobytes() )
+
+    with resampling_operators_lock:
+        operator = resampling_operators.get( key )
+        if operator is not None:
+            resampling_operators.move_to_end( key )
+            return operator
+
+    num_sources = len( source_wavelengths )
+    rows = np.zeros( 0, dtype = np.int64 )
+    columns = np.zeros( 0, dtype = np.int64 )
+    weights = np.zeros( 0 )
+
+    if num_sources > 1:
+        order = np.argsort( source_wavelengths, kind = "stable" )
+        sorted_wavelengths = source_wavelengths[order]
+
+        inside = np.nonzero( ( target_wavelengths >= sorted_wavelengths[0] ) & ( target_wavelengths <= sorted_wavelengths[-1] ) )[0]
+        left = np.clip( np.searchsorted( sorted_wavelengths, target_wavelengths[inside], side = "right" ) - 1, 0, num_sources - 2 )
+        t = ( target_wavelengths[inside] - sorted_wavelengths[left] ) / ( sorted_wavelengths[left + 1] - sorted_wavelengths[left] )
+
+        rows = np.concatenate( ( inside, inside ) )
+        columns = np.concatenate( ( order[left], order[left + 1] ) )
+        weights = np.concatenate( ( 1.0 - t, t ) )
+    elif num_sources == 1:
+        inside = np.nonzero( target_wavelengths == source_wavelengths[0] )[0]
+        rows, columns, weights = inside, np.zeros_like( inside ), np.ones( len( inside ) )
+
+    operator = scipy.sparse.csr_matrix( ( weights, ( rows, columns ) ), shape = ( len( target_wavelengths ), num_sources ) )
+
+    with resampling_operators_lock:
+        resampling_operators[key] = operator
+        while len( resampling_operators ) > RESAMPLING_CACHE_SIZE:
+            resampling_operators.popitem( last = False )
+
+    return operator
+
+
+def resample_stack( values, source_wavelengths, target_wavelengths ):
+    # ( N, source ) -> ( N, target ) in one sparse product
+    return np.asarray( ( resampling_operator( source_wavelengths, target_wavelengths ) @ np.asarray( values ).T ).T )
+
+
+def resample_spectra( spectra, wavelengths ):
+    # list of Spectrum onto one grid, ( N, λ ); spectra sharing a grid are resampled together
+    resampled = np.zeros( ( len( spectra ), len( wavelengths ) ) )
+
+    grids = {}
+    for i, spectrum in enumerate( spectra ):
+        grids.setdefault( np.ascontiguousarray( spectrum.wavelengths, dtype = float ).tobytes(), [] ).append( i )
+
+    for indices in grids.values():
+        resampled[indices] = resample_stack( np.stack( [ spectra[i].values for i in indices ] ), spectra[indices[0]].wavelengths, wavelengths )
+
+    return resampled
+
+
+# Colorimetry.illuminant_weights, for every stack of illuminants and wavelength grid that comes up (the libraries' grids,
+# the coarse band grids, ...)
+ILLUMINANT_WEIGHTS_CACHE_SIZE = 64
+illuminant_weights_cache = OrderedDict()
+illuminant_weights_cache_lock = threading.Lock()
+
+
 class Colorimetry:
     predefined_spectra = {
         "X" : Spectrum( [ 380.0,385.0,390.0,395.0,400.0,405.0,410.0,415.0,420.0,425.0,430.0,435.0,440.0,445.0,
@@ -114,7 +196,51 @@ class Colorimetry:
                             117.41,117.812,116.336,114.861,115.392,115.923,112.367,108.811,109.082,109.354,108.578,107.802,106.296,104.79,106.239,
                             107.689,106.047,104.405,104.225,104.046,102.023,100.0,98.1671,96.3342,96.0611,95.788,92.2368,88.6856,89.3459,90.0062,
                             89.8026,89.5991,88.6489,87.6987,85.4936,83.2886,83.4939,83.6992,81.863,80.0268,80.1207,80.2146,81.2462,82.2778,80.281,
-                            78.2842,74.0027,69.7213,70.6652,71.6091,72.979,74.349,67.9765,61.604,65.7448,69.8856  ] )
+                            78.2842,74.0027,69.7213,70.6652,71.6091,72.979,74.349,67.9765,61.604,65.7448,69.8856  ] ),
+
+        "A" : Spectrum( [ 380.0,385.0,390.0,395.0,400.0,405.0,410.0,415.0,420.0,425.0,430.0,435.0,440.0,445.0,
+                          450.0,455.0,460.0,465.0,470.0,475.0,480.0,485.0,490.0,495.0,500.0,505.0,510.0,515.0,
+                          520.0,525.0,530.0,535.0,540.0,545.0,550.0,555.0,560.0,565.0,570.0,575.0,580.0,585.0,
+                          590.0,595.0,600.0,605.0,610.0,615.0,620.0,625.0,630.0,635.0,640.0,645.0,650.0,655.0,
+                          660.0,665.0,670.0,675.0,680.0,685.0,690.0,695.0,700.0,705.0,710.0,715.0,720.0,725.0,730.0 ],
+                        [ 9.7951,10.8996,12.0853,13.3543,14.708,16.148,17.6753,19.2907,20.995,22.7883,24.6709,26.6425,28.7027,30.8508,33.0859,
+                          35.4068,37.8121,40.3002,42.8693,45.5174,48.2423,51.0418,53.9132,56.8539,59.8611,62.932,66.0635,69.2525,72.4959,75.7903,
+                          79.1326,82.5193,85.947,89.4124,92.912,96.4423,100,103.582,107.184,110.803,114.436,118.08,121.731,125.386,129.043,
+                          132.697,136.346,139.988,143.618,147.235,150.836,154.418,157.979,161.516,165.028,168.51,171.963,175.383,178.769,182.118,
+                          185.429,188.701,191.931,195.118,198.261,201.359,204.409,207.411,210.365,213.268,216.12 ] ),
+
+        "F2" : Spectrum( [ 380.0,385.0,390.0,395.0,400.0,405.0,410.0,415.0,420.0,425.0,430.0,435.0,440.0,445.0,
+                           450.0,455.0,460.0,465.0,470.0,475.0,480.0,485.0,490.0,495.0,500.0,505.0,510.0,515.0,
+                           520.0,525.0,530.0,535.0,540.0,545.0,550.0,555.0,560.0,565.0,570.0,575.0,580.0,585.0,
+                           590.0,595.0,600.0,605.0,610.0,615.0,620.0,625.0,630.0,635.0,640.0,645.0,650.0,655.0,
+                           660.0,665.0,670.0,675.0,680.0,685.0,690.0,695.0,700.0,705.0,710.0,715.0,720.0,725.0,730.0 ],
+                         [ 1.18,1.48,1.84,2.15,3.44,15.69,3.85,3.74,4.19,4.62,5.06,34.98,11.81,6.27,6.63,
+                           6.93,7.19,7.4,7.54,7.62,7.65,7.62,7.62,7.45,7.28,7.15,7.05,7.04,7.16,7.47,
+                           8.04,8.88,10.01,24.88,16.64,14.59,16.16,17.56,18.62,21.47,22.79,19.29,18.66,17.73,16.54,
+                           15.21,13.8,12.36,10.95,9.65,8.4,7.32,6.31,5.43,4.68,4.02,3.45,2.96,2.55,2.19,
+                           1.89,1.64,1.53,1.27,1.1,0.99,0.88,0.76,0.68,0.61,0.56 ] ),
+
+        "F7" : Spectrum( [ 380.0,385.0,390.0,395.0,400.0,405.0,410.0,415.0,420.0,425.0,430.0,435.0,440.0,445.0,
+                           450.0,455.0,460.0,465.0,470.0,475.0,480.0,485.0,490.0,495.0,500.0,505.0,510.0,515.0,
+                           520.0,525.0,530.0,535.0,540.0,545.0,550.0,555.0,560.0,565.0,570.0,575.0,580.0,585.0,
+                           590.0,595.0,600.0,605.0,610.0,615.0,620.0,625.0,630.0,635.0,640.0,645.0,650.0,655.0,
+                           660.0,665.0,670.0,675.0,680.0,685.0,690.0,695.0,700.0,705.0,710.0,715.0,720.0,725.0,730.0 ],
+                         [ 2.56,3.18,3.84,4.53,6.15,19.37,7.37,7.05,7.71,8.41,9.15,44.14,17.52,11.35,12,
+                           12.58,13.08,13.45,13.71,13.88,13.95,13.93,13.82,13.64,13.43,13.25,13.08,12.93,12.78,12.6,
+                           12.44,12.33,12.26,29.52,17.05,12.44,12.58,12.72,12.83,15.46,16.75,12.83,12.67,12.45,12.19,
+                           11.89,11.6,11.35,11.12,10.95,10.76,10.42,10.11,10.04,10.02,10.11,9.87,8.65,7.27,6.44,
+                           5.83,5.41,5.04,4.57,4.12,3.77,3.46,3.08,2.73,2.47,2.25 ] ),
+
+        "F11" : Spectrum( [ 380.0,385.0,390.0,395.0,400.0,405.0,410.0,415.0,420.0,425.0,430.0,435.0,440.0,445.0,
+                            450.0,455.0,460.0,465.0,470.0,475.0,480.0,485.0,490.0,495.0,500.0,505.0,510.0,515.0,
+                            520.0,525.0,530.0,535.0,540.0,545.0,550.0,555.0,560.0,565.0,570.0,575.0,580.0,585.0,
+                            590.0,595.0,600.0,605.0,610.0,615.0,620.0,625.0,630.0,635.0,640.0,645.0,650.0,655.0,
+                            660.0,665.0,670.0,675.0,680.0,685.0,690.0,695.0,700.0,705.0,710.0,715.0,720.0,725.0,730.0 ],
+                          [ 0.91,0.63,0.46,0.37,1.29,12.68,1.59,1.79,2.46,3.33,4.49,33.94,12.13,6.95,7.19,
+                            7.12,6.72,6.13,5.46,4.79,5.66,14.29,14.96,8.97,4.72,2.33,1.47,1.1,0.89,0.83,
+                            1.18,4.9,39.59,72.84,32.61,7.52,2.83,1.96,1.67,4.43,11.28,14.76,12.73,9.74,7.33,
+                            9.72,55.27,42.58,13.18,13.16,12.26,5.11,2.07,2.34,3.58,3.01,2.48,2.14,1.54,1.33,
+                            1.46,1.94,2,1.2,1.35,4.1,5.58,2.51,0.57,0.27,0.23 ] )
     }
 
     def gamma( x ):
@@ -134,6 +260,17 @@ class Colorimetry:
         var_z = np.where( var_z > 0.008856, var_z ** ( 1.0 / 3.0 ), ( 7.787 * var_z ) + ( 16 / 116 ) )
 
         return ( 116 * var_y ) - 16, 500 * ( var_x - var_y ), 200 * ( var_y - var_z )
+
+    def Lab_to_xyz( L, a, b, ref_x = 95.047, ref_y = 100.0, ref_z = 108.883 ):
+        var_y = ( L + 16 ) / 116
+        var_x = a / 500 + var_y
+        var_z = var_y - b / 200
+
+        var_x = np.where( var_x ** 3 > 0.008856, var_x ** 3, ( var_x - 16 / 116 ) / 7.787 )
+        var_y = np.where( var_y ** 3 > 0.008856, var_y ** 3, ( var_y - 16 / 116 ) / 7.787 )
+        var_z = np.where( var_z ** 3 > 0.008856, var_z ** 3, ( var_z - 16 / 116 ) / 7.787 )
+
+        return var_x * ref_x, var_y * ref_y, var_z * ref_z
         
     def xyz_to_rgb( x, y, z ):
         r =  3.2406 * x + -1.5372 * y + -0.4986 * z
@@ -170,6 +307,85 @@ class Colorimetry:
         r, g, b = Colorimetry.xyz_to_rgb( x, y, z )
         return saturate( Colorimetry.gamma(r) ), saturate( Colorimetry.gamma(g) ), saturate( Colorimetry.gamma(b) )
 
+    # batched colorimetry:
+    # for a stack of illuminants we precompute a single ( I, λ, 3 ) tensor, so a whole stack of
+    # reflectances can be turned into XYZ under all the illuminants with one contraction
+    def illuminant_weights( illuminants = ( "D65", ), wavelengths = None ):
+        illuminants = tuple( illuminants )
+        wavelengths = Colorimetry.predefined_spectra["X"].wavelengths if wavelengths is None else np.ascontiguousarray( wavelengths, dtype = float )
+
+        key = ( illuminants, wavelengths.tobytes() )
+        with illuminant_weights_cache_lock:
+            weights = illuminant_weights_cache.get( key )
+            if weights is not None:
+                illuminant_weights_cache.move_to_end( key )
+                return weights
+
+        cmf_wavelengths = Colorimetry.predefined_spectra["X"].wavelengths
+        cmfs = resample_spectra( [ Colorimetry.predefined_spectra[channel] for channel in ( "X", "Y", "Z" ) ], cmf_wavelengths ).T
+        lights = resample_spectra( [ Colorimetry.predefined_spectra[illuminant] for illuminant in illuminants ], cmf_wavelengths )
+
+        # trapezoidal rule, folded into the weights
+        steps = np.diff( cmf_wavelengths )
+        trapezoid = np.zeros_like( cmf_wavelengths )
+        trapezoid[:-1] = trapezoid[:-1] + 0.5 * steps
+        trapezoid[1:] = trapezoid[1:] + 0.5 * steps
+
+        cmf_weights = lights[:, :, None] * cmfs[None, :, :] * trapezoid[None, :, None]
+
+        # same normalization as reflectance_to_xyz: perfect white has Y = 1 under every illuminant
+        cmf_weights = cmf_weights / cmf_weights[:, :, 1].sum( -1 )[:, None, None]
+
+        # fold resampling from the requested grid onto the CMF grid into the weights too
+        resampling = resampling_operator( wavelengths, cmf_wavelengths ).T
+        weights = np.ascontiguousarray( np.stack( [ resampling @ illuminant_weights for illuminant_weights in cmf_weights ] ) )
+
+        with illuminant_weights_cache_lock:
+            illuminant_weights_cache[key] = weights
+            while len( illuminant_weights_cache ) > ILLUMINANT_WEIGHTS_CACHE_SIZE:
+                illuminant_weights_cache.popitem( last = False )
+
+        return weights
+
+    def illuminant_white_points( illuminants = ( "D65", ) ):
+        # XYZ of a perfect white under every illuminant, ( I, 3 )
+        return Colorimetry.illuminant_weights( illuminants ).sum( 1 )
+
+    def reflectances_to_xyz( reflectances, wavelengths = None, illuminants = ( "D65", ) ):
+        # reflectances: ( ..., λ ) sampled at wavelengths (CMF grid by default), returns ( ..., I, 3 )
+        weights = Colorimetry.illuminant_weights( illuminants, wavelengths )
+        return np.tensordot( reflectances, weights, axes = ( [ -1 ], [ 1 ] ) )
+
+    def reflectances_to_Lab( reflectances, wavelengths = None, illuminants = ( "D65", ) ):
+        # Lab relative to the white of each illuminant, ie. assuming the viewer adapts to the light, ( ..., I, 3 )
+        xyz = Colorimetry.reflectances_to_xyz( reflectances, wavelengths, illuminants ) * 100.0
+        white = Colorimetry.illuminant_white_points( illuminants ) * 100.0
+        return np.stack( Colorimetry.xyz_to_Lab( xyz[..., 0], xyz[..., 1], xyz[..., 2], white[:, 0], white[:, 1], white[:, 2] ), -1 )
+
+    def xyz_to_rgb_saturated( xyz ):
+        # batched version of the tail of reflectance_to_rgb: ( ..., 3 ) XYZ to gamma corrected, clipped sRGB
+        rgb = np.stack( Colorimetry.xyz_to_rgb( xyz[..., 0], xyz[..., 1], xyz[..., 2] ), -1 )
+        return np.clip( Colorimetry.gamma( np.maximum( rgb, 0.0 ) ), 0.0, 1.0 )
+
+    def rgb_to_reflectance( rgb, wavelengths ):
+        # the smoothest reflectance (least squared slope) with the given sRGB colour under D65, sampled at wavelengths;
+        # just one of infinitely many metamers, but a reasonable stand-in wherever the solver needs a target spectrum
+        xyz = np.array( Colorimetry.rgb_to_xyz( *Colorimetry.degamma( np.asarray( rgb, dtype = float ) ) ) )
+        weights = Colorimetry.illuminant_weights( ( "D65", ), wavelengths )[0].T
+
+        num_wavelengths = len( wavelengths )
+        slope = np.diff( np.eye( num_wavelengths ), axis = 0 )
+
+        # minimize |slope R|^2 subject to weights R = xyz
+        kkt = np.zeros( ( num_wavelengths + 3, num_wavelengths + 3 ) )
+        kkt[:num_wavelengths, :num_wavelengths] = 2.0 * slope.T @ slope
+        kkt[:num_wavelengths, num_wavelengths:] = weights.T
+        kkt[num_wavelengths:, :num_wavelengths] = weights
+
+        reflectance = np.linalg.lstsq( kkt, np.concatenate( ( np.zeros( num_wavelengths ), xyz ) ), rcond = None )[0][:num_wavelengths]
+
+        return np.clip( reflectance, 0.001, 0.999 )
+
 
 class TwoDiffuseFluxesModel:    
     def K_S_ratio_from_reflectance( reflectance ):
@@ -178,35 +394,73 @@ class TwoDiffuseFluxesModel:
     def K_from_S( reflectance, S ):
         return TwoDiffuseFluxesModel.K_S_ratio_from_reflectance( reflectance ) * S 
 
+    def reflectance_from_K_S( K, S ):
+        omega = S / ( K + S )
+        return omega / ( 2.0 - omega + 2.0 * np.sqrt( 1.0 - omega ) )
+
+    def mix_arrays( K, S, weights ):
+        # batched mix: K and S are ( ..., k, λ ), weights ( ..., k ); returns reflectances ( ..., λ )
+        total_weight = weights.sum( -1, keepdims = True )
+        weights = weights / np.where( total_weight == 0, 1.0, total_weight )
+
+        mixed_K = np.einsum( "...k,...kl->...l", weights, K )
+        mixed_S = np.einsum( "...k,...kl->...l", weights, S )
+
+        return TwoDiffuseFluxesModel.reflectance_from_K_S( mixed_K, mixed_S )
+
     def __init__( self ):
         self.paint_parameters = {}
+        self.parameter_arrays_cache = {}
+
+    def __getstate__( self ):
+        # caches are cheap to rebuild, no need to ship them to the worker processes
+        state = dict( self.__dict__ )
+        state["parameter_arrays_cache"] = {}
+        return state
 
     def init_paints( self, measurements, white_name ):
         # todo:
         # add cache instead of computing that all the time on startup
         self.compute_K_S( measurements, white_name )
     
-    def compute_K_S( self, measurments, white_name ):
-        self.paint_parameters = {}
-
-        # pre-set S term for white to 1.0, derive K from that
-        white_sample = measurments[white_name]
-        self.paint_parameters[white_name] = {}
-        self.paint_parameters[white_name]["S"] = Spectrum( white_sample["reflectance"].wavelengths, np.ones_like( white_sample["reflectance"].values ) )        
-        self.paint_parameters[white_name]["K"] = TwoDiffuseFluxesModel.K_from_S( white_sample["reflectance"], self.paint_parameters[white_name]["S"] )
-
-        # todo:
-        # generate graph of dependencies, so they can be computed in proper order
-        # atm, we only have mixes with white, so whatever
+    def find_masstone_mixes( measurments ):
+        # { masstone : [ samples its K and S are fitted from ] }, the masstone itself and every mix it's in;
+        # mixes of paints that weren't measured on their own can't be fitted and are left out
         masstone_mixes = {}
 
         for sample_name in measurments:    
             if measurments[sample_name]["type"] == "masstone":
                 masstone_mixes.setdefault( sample_name, [] ).append( sample_name )
             elif measurments[sample_name]["type"] == "mix":
+                if any( component not in measurments for component in measurments[sample_name]["components"] ):
+                    continue
                 for component in measurments[sample_name]["components"]:            
                     masstone_mixes.setdefault( component, [] ).append( sample_name )
 
+        return masstone_mixes
+
+    def compute_K_S( self, measurments, white_name, names = None ):
+        # fits the given paints (all of them by default), the others keep the parameters they have
+        if names is None:
+            self.paint_parameters = {}
+            self.parameter_arrays_cache = {}
+        else:
+            for name in names:
+                self.paint_parameters.pop( name, None )
+            self.parameter_arrays_cache = { cached_names : arrays for cached_names, arrays in self.parameter_arrays_cache.items() if set( names ).isdisjoint( cached_names ) }
+
+        # pre-set S term for white to 1.0, derive K from that
+        if white_name not in self.paint_parameters:
+            white_sample = measurments[white_name]
+            self.paint_parameters[white_name] = {}
+            self.paint_parameters[white_name]["S"] = Spectrum( white_sample["reflectance"].wavelengths, np.ones_like( white_sample["reflectance"].values ) )        
+            self.paint_parameters[white_name]["K"] = TwoDiffuseFluxesModel.K_from_S( white_sample["reflectance"], self.paint_parameters[white_name]["S"] )
+
+        # todo:
+        # generate graph of dependencies, so they can be computed in proper order
+        # atm, we only have mixes with white, so whatever
+        masstone_mixes = TwoDiffuseFluxesModel.find_masstone_mixes( measurments )
+
         for masstone in masstone_mixes:
             sample = measurments[masstone]
 
@@ -270,6 +524,9 @@ class TwoDiffuseFluxesModel:
             self.paint_parameters[sample_name]["S"] = Spectrum( combined_wavelengths, x[:,1] )
 
         for masstone in masstone_mixes:
+            if names is not None and masstone not in names:
+                continue
+
             mixes = masstone_mixes[masstone]
 
             for i, mix in enumerate( mixes ):
@@ -294,6 +551,53 @@ class TwoDiffuseFluxesModel:
 
                 assert diff.sum() < 0.001   # there should only be some numerical differences, given we only have a masstone and a single mix
 
+    def update_K_S( self, measurments, white_name, changed_samples ):
+        # refits only the paints fitted from one of the changed (added, replaced or removed) samples, directly or
+        # through another paint that gets refitted (when white changes, everything mixed with it); paints that
+        # are gone are dropped; returns the names of the refitted and the dropped paints
+        masstone_mixes = TwoDiffuseFluxesModel.find_masstone_mixes( measurments )
+        changed_samples = set( changed_samples )
+
+        affected = { name for name in self.paint_parameters if name not in masstone_mixes }
+        if white_name in changed_samples:
+            affected.add( white_name )
+
+        grown = True
+        while grown:
+            grown = False
+            for masstone, mixes in masstone_mixes.items():
+                if masstone in affected or masstone == white_name:
+                    continue
+
+                components = { component for mix in mixes if measurments[mix]["type"] == "mix" for component in measurments[mix]["components"] }
+                if masstone not in self.paint_parameters or not changed_samples.isdisjoint( mixes ) or not affected.isdisjoint( components ):
+                    affected.add( masstone )
+                    grown = True
+
+        if affected:
+            self.compute_K_S( measurments, white_name, affected )
+
+        return affected
+
+    def get_parameter_arrays( self, names ):
+        # K and S of the given paints on one common wavelength grid, ( N, λ ) each, for the batched code paths
+        names = tuple( names )
+        arrays = self.parameter_arrays_cache.get( names )
+
+        if arrays is None:
+            wavelengths = np.array( [] )
+            for name in names:
+                wavelengths = np.union1d( wavelengths, self.paint_parameters[name]["K"].wavelengths )
+                wavelengths = np.union1d( wavelengths, self.paint_parameters[name]["S"].wavelengths )
+
+            K = resample_spectra( [ self.paint_parameters[name]["K"] for name in names ], wavelengths )
+            S = resample_spectra( [ self.paint_parameters[name]["S"] for name in names ], wavelengths )
+
+            arrays = ( wavelengths, K, S )
+            self.parameter_arrays_cache[names] = arrays
+
+        return arrays
+
     def mix( self, components ):
         combined_wavelengths = np.array( [] )
 
@@ -322,103 +626,1692 @@ class TwoDiffuseFluxesModel:
 
         return Spectrum( combined_wavelengths, mixed_R )
 
+# optional reduced spectral resolution for the batched paths (prescreen, sparse search, gamut, robustness): K and S
+# resampled onto evenly spaced bands, the coarsest of these levels whose colours stay within a delta E bound
+SPECTRAL_LEVELS = ( 8, 12, 16, 24, 32, 48, 64, 96 )
+SPECTRAL_CACHE_SIZE = 32
+spectral_cache = OrderedDict()
+spectral_cache_lock = threading.Lock()
+
+def band_parameter_arrays( wavelengths, K, S, num_bands ):
+    # K and S resampled onto num_bands evenly spaced wavelengths over the same range
+    band_wavelengths = np.linspace( wavelengths[0], wavelengths[-1], num_bands )
+    return band_wavelengths, resample_stack( K, wavelengths, band_wavelengths ), resample_stack( S, wavelengths, band_wavelengths )
+
+def spectral_probe_weights( num_paints, num_probes = 256, seed = 0 ):
+    # ( P, num_paints ) mixes a spectral resolution gets checked on: the masstones, pairs at a few ratios and sparse random mixes
+    rng = np.random.default_rng( seed )
+    probes = [ np.eye( num_paints ) ]
+
+    if num_paints > 1:
+        pairs = combination_indices( num_paints, 2 )
+        pairs = pairs[rng.permutation( len( pairs ) )[:num_probes // 3]]
+        for ratio in ( 0.1, 0.5, 0.9 ):
+            pair_weights = np.zeros( ( len( pairs ), num_paints ) )
+            pair_weights[np.arange( len( pairs ) ), pairs[:, 0]] = ratio
+            pair_weights[np.arange( len( pairs ) ), pairs[:, 1]] = 1.0 - ratio
+            probes.append( pair_weights )
+
+    if num_paints > 2:
+        probes.append( rng.dirichlet( np.full( num_paints, 0.3 ), num_probes ) )
+
+    return np.concatenate( probes )
+
+def band_delta_e( wavelengths, K, S, num_bands, illuminants = ( "D65", ), weights = None ):
+    # delta E (CIE76, under every illuminant) between the probe mixes on the full grid and on num_bands samples
+    weights = spectral_probe_weights( len( K ) ) if weights is None else weights
+    full_lab = Colorimetry.reflectances_to_Lab( TwoDiffuseFluxesModel.mix_arrays( K, S, weights ), wavelengths, illuminants )
+
+    band_wavelengths, band_K, band_S = band_parameter_arrays( wavelengths, K, S, num_bands )
+    band_lab = Colorimetry.reflectances_to_Lab( TwoDiffuseFluxesModel.mix_arrays( band_K, band_S, weights ), band_wavelengths, illuminants )
+
+    return np.sqrt( ( ( band_lab - full_lab ) ** 2 ).sum( -1 ) )
+
+def reduced_parameter_arrays( pigment_model, names, max_delta_e = None, illuminants = ( "D65", ) ):
+    # get_parameter_arrays on the coarsest SPECTRAL_LEVELS grid that keeps every probe mix of the paints within
+    # max_delta_e; the full grid when max_delta_e is None or no level is good enough (or coarser than the full grid)
+    wavelengths, K, S = pigment_model.get_parameter_arrays( names )
+    if max_delta_e is None:
+        return wavelengths, K, S
+
+    key = ( hashlib.sha1( np.ascontiguousarray( K ).tobytes() + np.ascontiguousarray( S ).tobytes() + wavelengths.tobytes() ).hexdigest(), max_delta_e, tuple( illuminants ) )
+    with spectral_cache_lock:
+        arrays = spectral_cache.get( key )
+        if arrays is not None:
+            spectral_cache.move_to_end( key )
+            return arrays
+
+    arrays = ( wavelengths, K, S )
+    probe_weights = spectral_probe_weights( len( K ) )
+    for num_bands in SPECTRAL_LEVELS:
+        if num_bands >= len( wavelengths ):
+            break
+        if band_delta_e( wavelengths, K, S, num_bands, illuminants, probe_weights ).max() <= max_delta_e:
+            arrays = band_parameter_arrays( wavelengths, K, S, num_bands )
+            break
+
+    with spectral_cache_lock:
+        spectral_cache[key] = arrays
+        while len( spectral_cache ) > SPECTRAL_CACHE_SIZE:
+            spectral_cache.popitem( last = False )
+
+    return arrays
+
+
 class RecipeOptimizer:
-    def __init__( self, base_paints, target_rgb, pigment_model ):
+    MIN_WEIGHT_RATIO = 0.001
+    SEED_LATTICE_SIZE = 64
+
+    def __init__( self, base_paints, target_rgb, pigment_model, illuminants = None, illuminant_error = "mean" ):
         self.base_paints = base_paints
         self.target_rgb = target_rgb
-        self.target_lab = np.array( Colorimetry.xyz_to_Lab( *Colorimetry.rgb_to_xyz( *Colorimetry.rgb_int_to_float( *( target_rgb * 255 ) ) ) ) )
+        self.target_lab = np.array( Colorimetry.xyz_to_Lab( *( np.array( Colorimetry.rgb_to_xyz( *Colorimetry.rgb_int_to_float( *( target_rgb * 255 ) ) ) ) * 100.0 ) ) )
         self.pigment_model = pigment_model
+
+        # optional metamerism-aware mode: when a list of illuminants is given, the mix is scored by
+        # its Lab difference under each of them, combined as the "mean" or the "max" (worst case)
+        self.illuminants = illuminants
+        self.illuminant_error = illuminant_error
         
     def mix_current_set( self, paint_set, weights ):
         components = [ ( pigment, amount ) for pigment, amount in zip( [self.base_paints[paint] for paint in paint_set], weights ) ]
         mixed_paint = self.pigment_model.mix( components )
         return mixed_paint
 
-    def __call__( self, paint_set ):
-        def func( weights ):
-            mixed_paint = self.mix_current_set( paint_set, weights )
-
+    def mix_error( self, mixed_paint ):
+        if self.illuminants is None:
             # in sRGB
             mixed_rgb = np.array( Colorimetry.reflectance_to_rgb( mixed_paint ) )
             diff = mixed_rgb - self.target_rgb
-
-            # in Lab
-            #mixed_lab = np.array( Colorimetry.xyz_to_Lab( *Colorimetry.reflectance_to_xyz( mixed_paint ) ) ) 
-            #diff = mixed_lab - self.target_lab
-            
             return np.dot( diff, diff )
 
-        #optimized_weights = scipy.optimize.minimize( func, np.array( [ 0.5 ] * len( paint_set ) ), method = "Nelder-Mead",  bounds = [(0.001, 1)] )        
-        optimized_weights = scipy.optimize.minimize( func, np.array( [ 0.5 ] * len( paint_set ) ), bounds = [(0.001, 1)] )        
-        mixed_rgb = np.array( Colorimetry.reflectance_to_rgb( self.mix_current_set( paint_set, optimized_weights["x"] ) ) )
-        diff = np.dot( mixed_rgb - self.target_rgb, mixed_rgb - self.target_rgb )
+        # in Lab, under all the illuminants at once
+        mixed_lab = Colorimetry.reflectances_to_Lab( mixed_paint.values, mixed_paint.wavelengths, self.illuminants )
+        delta_e = np.sqrt( ( ( mixed_lab - self.target_lab ) ** 2 ).sum( -1 ) )
+        return delta_e.max() if self.illuminant_error == "max" else delta_e.mean()
+
+    def mix_residuals( self, reflectances, wavelengths ):
+        # batched differences to the target, ( ..., 3 ) in sRGB or ( ..., I, 3 ) in Lab
+        if self.illuminants is None:
+            mixed_rgb = Colorimetry.xyz_to_rgb_saturated( Colorimetry.reflectances_to_xyz( reflectances, wavelengths )[..., 0, :] )
+            return mixed_rgb - self.target_rgb
+
+        return Colorimetry.reflectances_to_Lab( reflectances, wavelengths, self.illuminants ) - self.target_lab
+
+    def mix_errors( self, reflectances, wavelengths ):
+        # batched mix_error for a stack of reflectances ( ..., λ )
+        diff = self.mix_residuals( reflectances, wavelengths )
+
+        if self.illuminants is None:
+            return ( diff * diff ).sum( -1 )
+
+        delta_e = np.sqrt( ( diff * diff ).sum( -1 ) )
+        return delta_e.max( -1 ) if self.illuminant_error == "max" else delta_e.mean( -1 )
+
+    def initial_weights( self, evaluator ):
+        # the best proportions on a coarse lattice (whole parts, as many as fit in SEED_LATTICE_SIZE proportions), mixed
+        # in one batch; the objective has kinks and flat spots where the mix leaves the sRGB gamut, and starting next to
+        # the best of the local minima keeps L-BFGS-B from settling in another one
+        num_paints = len( evaluator.K )
+        total_parts = num_paints
+        while scipy.special.comb( total_parts + 1, num_paints, exact = True ) <= RecipeOptimizer.SEED_LATTICE_SIZE:
+            total_parts = total_parts + 1
+
+        parts = integer_lattice( num_paints, total_parts ).astype( float )
+        errors = self.mix_errors( TwoDiffuseFluxesModel.mix_arrays( evaluator.K, evaluator.S, parts ), evaluator.wavelengths )
+        return parts[np.argmin( errors )]
+
+    def optimize_weights( self, evaluator ):
+        # returns ( normalized weights, scipy's result ); the mix only depends on the normalized weights, so the k raw
+        # weights would leave a flat scaling direction - instead the seed's largest paint is pinned at 1 and the other
+        # k - 1 are optimized as ratios to it (MixEvaluator.pinned), each within MIN_WEIGHT_RATIO either way
+        seed = self.initial_weights( evaluator )
+        pivot = int( np.argmax( seed ) )
+        evaluator.pin( pivot )
+
+        result = scipy.optimize.minimize( evaluator.pinned, np.delete( seed, pivot ) / seed[pivot], jac = True,
+                                          bounds = [ ( RecipeOptimizer.MIN_WEIGHT_RATIO, 1.0 / RecipeOptimizer.MIN_WEIGHT_RATIO ) ] )
+        weights = np.insert( result["x"], pivot, 1.0 )
+
+        # with strong pigments a ratio can be tiny next to the pivot, and L-BFGS-B sometimes stops on a flat step
+        # (relative reduction of f) instead of at a stationary point; a few box-method steps from there get it unstuck
+        if not str( result["message"] ).startswith( "CONVERGENCE: NORM" ):
+            polished = scipy.optimize.minimize( evaluator, weights / weights.max(), jac = True, bounds = [ ( RecipeOptimizer.MIN_WEIGHT_RATIO, 1.0 ) ] )
+            if polished["fun"] < result["fun"]:
+                polished["nit"] += result["nit"]
+                polished["nfev"] += result["nfev"]
+                weights, result = polished["x"], polished
+
+        return weights / weights.sum(), result
 
-        return mixed_rgb, diff, paint_set, optimized_weights["x"]
+    def __call__( self, paint_set ):
+        evaluator = MixEvaluator( self, paint_set )
+
+        if len( paint_set ) > 1:
+            weights, _ = self.optimize_weights( evaluator )
+        else:
+            weights = np.array( [ 1.0 ] )
+
+        mixed_paint = self.mix_current_set( paint_set, weights )
+        mixed_rgb = np.array( Colorimetry.reflectance_to_rgb( mixed_paint ) )
+        diff = self.mix_error( mixed_paint )
+
+        return mixed_rgb, diff, paint_set, weights
+
+
+class MixEvaluator:
+    # RecipeOptimizer's objective for one paint_set, with its analytic gradient; K, S and the colorimetry weights
+    # are sliced once, and every evaluation runs in buffers preallocated here, so the optimizer's inner loop
+    # doesn't allocate (see PaintMixingBenchmarks.py evaluator)
+    XYZ_TO_RGB = np.array( [ [ 3.2406, -1.5372, -0.4986 ], [ -0.9689, 1.8758, 0.0415 ], [ 0.0557, -0.2040, 1.0570 ] ] )
+
+    # Lab = F_TO_LAB f - ( 16, 0, 0 ) for f = ( f( x / xn ), f( y / yn ), f( z / zn ) )
+    F_TO_LAB = np.array( [ [ 0.0, 116.0, 0.0 ], [ 500.0, -500.0, 0.0 ], [ 0.0, 200.0, -200.0 ] ] )
+
+    def __init__( self, optimizer, paint_set ):
+        names = [ optimizer.base_paints[paint]["name"] for paint in paint_set ]
+        self.wavelengths, self.K, self.S = optimizer.pigment_model.get_parameter_arrays( names )
+
+        self.srgb = optimizer.illuminants is None
+        illuminants = ( "D65", ) if self.srgb else tuple( optimizer.illuminants )
+        num_illuminants = len( illuminants )
+        num_wavelengths = len( self.wavelengths )
+
+        # ( λ, I * 3 ), so XYZ under all the illuminants is a single matrix-vector product
+        colour_weights = Colorimetry.illuminant_weights( illuminants, self.wavelengths )
+        self.colour_weights = np.ascontiguousarray( colour_weights.transpose( 1, 0, 2 ).reshape( num_wavelengths, -1 ) )
+
+        self.objective = np.zeros( () )
+        self.gradient = np.zeros( len( paint_set ) )
+        self.gradient_part = np.zeros( len( paint_set ) )
+
+        self.mixed_K = np.zeros( num_wavelengths )
+        self.mixed_S = np.zeros( num_wavelengths )
+        self.total = np.zeros( num_wavelengths )
+        self.omega = np.zeros( num_wavelengths )
+        self.root = np.zeros( num_wavelengths )
+        self.denominator = np.zeros( num_wavelengths )
+        self.reflectance = np.zeros( num_wavelengths )
+        self.d_reflectance = np.zeros( num_wavelengths )
+        self.spectral_temp = np.zeros( num_wavelengths )
+        self.spectral_temp2 = np.zeros( num_wavelengths )
+
+        self.xyz = np.zeros( 3 * num_illuminants )
+        self.d_xyz = np.zeros( 3 * num_illuminants )
+
+        if self.srgb:
+            self.target = np.array( optimizer.target_rgb, dtype = float )
+            self.linear = np.zeros( 3 )
+            self.positive = np.zeros( 3 )
+            self.curve = np.zeros( 3 )
+            self.low = np.zeros( 3 )
+            self.slope = np.zeros( 3 )
+            self.rgb = np.zeros( 3 )
+            self.diff = np.zeros( 3 )
+            self.d_linear = np.zeros( 3 )
+            self.is_low = np.zeros( 3, dtype = bool )
+            self.in_range = np.zeros( 3, dtype = bool )
+            self.in_range_upper = np.zeros( 3, dtype = bool )
+        else:
+            self.max_error = optimizer.illuminant_error == "max"
+            self.white = np.ascontiguousarray( Colorimetry.illuminant_white_points( illuminants ).reshape( -1 ) )
+            self.lab_offset = np.tile( optimizer.target_lab + np.array( [ 16.0, 0.0, 0.0 ] ), ( num_illuminants, 1 ) )
+            self.lab_from_f = np.ascontiguousarray( MixEvaluator.F_TO_LAB.T )
+            self.mean_weights = np.full( num_illuminants, 1.0 / num_illuminants )
+
+            self.t = np.zeros( 3 * num_illuminants )
+            self.f = np.zeros( 3 * num_illuminants )
+            self.f_linear = np.zeros( 3 * num_illuminants )
+            self.f_slope = np.zeros( 3 * num_illuminants )
+            self.is_low = np.zeros( 3 * num_illuminants, dtype = bool )
+            self.diff = np.zeros( ( num_illuminants, 3 ) )
+            self.squared = np.zeros( ( num_illuminants, 3 ) )
+            self.d_lab = np.zeros( ( num_illuminants, 3 ) )
+            self.delta_e = np.zeros( num_illuminants )
+            self.safe_delta_e = np.zeros( num_illuminants )
+            self.d_delta_e = np.zeros( num_illuminants )
+
+            # ( I, 3 ) views of the flat buffers, made once
+            self.f_by_illuminant = self.f.reshape( num_illuminants, 3 )
+            self.d_f_by_illuminant = self.d_xyz.reshape( num_illuminants, 3 )
+            self.safe_delta_e_column = self.safe_delta_e[:, None]
+            self.d_delta_e_column = self.d_delta_e[:, None]
+
+    def mix( self, weights ):
+        # the same two flux mix as TwoDiffuseFluxesModel.mix, into self.reflectance; weights don't need to be normalized
+        np.matmul( weights, self.K, out = self.mixed_K )
+        np.matmul( weights, self.S, out = self.mixed_S )
+        np.add( self.mixed_K, self.mixed_S, out = self.total )
+        np.divide( self.mixed_S, self.total, out = self.omega )
+
+        np.subtract( 1.0, self.omega, out = self.root )
+        np.sqrt( self.root, out = self.root )
+        np.multiply( self.root, 2.0, out = self.denominator )
+        np.add( self.denominator, 2.0, out = self.denominator )
+        np.subtract( self.denominator, self.omega, out = self.denominator )
+        np.divide( self.omega, self.denominator, out = self.reflectance )
+
+        np.matmul( self.reflectance, self.colour_weights, out = self.xyz )
+
+    def srgb_error( self ):
+        # same as Colorimetry.xyz_to_rgb_saturated, then the squared difference; leaves d objective / d XYZ in self.d_xyz
+        np.matmul( MixEvaluator.XYZ_TO_RGB, self.xyz, out = self.linear )
+        np.maximum( self.linear, 0.0, out = self.positive )
+
+        np.power( self.positive, 5.0 / 12.0, out = self.curve )
+        np.multiply( self.curve, 211.0 / 200.0, out = self.curve )
+        np.subtract( self.curve, 11.0 / 200.0, out = self.curve )
+        np.multiply( self.positive, 323.0 / 25.0, out = self.low )
+        np.less_equal( self.positive, 0.0031308, out = self.is_low )
+        np.copyto( self.curve, self.low, where = self.is_low )
+        np.clip( self.curve, 0.0, 1.0, out = self.rgb )
+
+        np.subtract( self.rgb, self.target, out = self.diff )
+        np.multiply( self.diff, self.diff, out = self.d_linear )
+        np.add.reduce( self.d_linear, out = self.objective )
+
+        # gamma slope, zero where the channel is clipped
+        np.maximum( self.positive, 0.0031308, out = self.slope )
+        np.power( self.slope, -7.0 / 12.0, out = self.slope )
+        np.multiply( self.slope, 211.0 / 200.0 * 5.0 / 12.0, out = self.slope )
+        np.copyto( self.slope, 323.0 / 25.0, where = self.is_low )
+        np.greater( self.linear, 0.0, out = self.in_range )
+        np.less( self.curve, 1.0, out = self.in_range_upper )
+        np.logical_and( self.in_range, self.in_range_upper, out = self.in_range )
+
+        np.multiply( self.diff, 2.0, out = self.d_linear )
+        np.multiply( self.d_linear, self.slope, out = self.d_linear )
+        np.multiply( self.d_linear, self.in_range, out = self.d_linear )
+        np.matmul( self.d_linear, MixEvaluator.XYZ_TO_RGB, out = self.d_xyz )
+
+    def lab_error( self ):
+        # same as Colorimetry.reflectances_to_Lab, then the mean or max delta E over the illuminants;
+        # leaves d objective / d XYZ in self.d_xyz
+        np.divide( self.xyz, self.white, out = self.t )
+        np.cbrt( self.t, out = self.f )
+        np.multiply( self.t, 7.787, out = self.f_linear )
+        np.add( self.f_linear, 16.0 / 116.0, out = self.f_linear )
+        np.less_equal( self.t, 0.008856, out = self.is_low )
+        np.copyto( self.f, self.f_linear, where = self.is_low )
+
+        np.matmul( self.f_by_illuminant, self.lab_from_f, out = self.diff )
+        np.subtract( self.diff, self.lab_offset, out = self.diff )
+        np.multiply( self.diff, self.diff, out = self.squared )
+        np.add.reduce( self.squared, axis = 1, out = self.delta_e )
+        np.sqrt( self.delta_e, out = self.delta_e )
+
+        if self.max_error:
+            np.maximum.reduce( self.delta_e, out = self.objective )
+            np.equal( self.delta_e, self.objective, out = self.d_delta_e )
+        else:
+            np.matmul( self.delta_e, self.mean_weights, out = self.objective )
+            np.copyto( self.d_delta_e, self.mean_weights )
+
+        np.maximum( self.delta_e, 1e-12, out = self.safe_delta_e )
+        np.divide( self.diff, self.safe_delta_e_column, out = self.d_lab )
+        np.multiply( self.d_lab, self.d_delta_e_column, out = self.d_lab )
+        np.matmul( self.d_lab, MixEvaluator.F_TO_LAB, out = self.d_f_by_illuminant )
+
+        np.maximum( self.t, 0.008856, out = self.f_slope )
+        np.power( self.f_slope, -2.0 / 3.0, out = self.f_slope )
+        np.multiply( self.f_slope, 1.0 / 3.0, out = self.f_slope )
+        np.copyto( self.f_slope, 7.787, where = self.is_low )
+        np.multiply( self.d_xyz, self.f_slope, out = self.d_xyz )
+        np.divide( self.d_xyz, self.white, out = self.d_xyz )
+
+    def evaluate( self, weights ):
+        # objective into self.objective, gradient into self.gradient
+        self.mix( weights )
+
+        if self.srgb:
+            self.srgb_error()
+        else:
+            self.lab_error()
+
+        # back through the colorimetry and the mix: dR / dω = ( D + ω ( 1 + 1 / sqrt( 1 - ω ) ) ) / D^2,
+        # dω / dw_i = ( S_i K_mix - K_i S_mix ) / ( K_mix + S_mix )^2
+        np.matmul( self.colour_weights, self.d_xyz, out = self.d_reflectance )
+
+        np.divide( 1.0, self.root, out = self.spectral_temp )
+        np.add( self.spectral_temp, 1.0, out = self.spectral_temp )
+        np.multiply( self.spectral_temp, self.omega, out = self.spectral_temp )
+        np.add( self.spectral_temp, self.denominator, out = self.spectral_temp )
+        np.divide( self.spectral_temp, self.denominator, out = self.spectral_temp )
+        np.divide( self.spectral_temp, self.denominator, out = self.spectral_temp )
+
+        np.multiply( self.d_reflectance, self.spectral_temp, out = self.spectral_temp )
+        np.divide( self.spectral_temp, self.total, out = self.spectral_temp )
+        np.divide( self.spectral_temp, self.total, out = self.spectral_temp )
+
+        np.multiply( self.spectral_temp, self.mixed_K, out = self.spectral_temp2 )
+        np.matmul( self.S, self.spectral_temp2, out = self.gradient )
+        np.multiply( self.spectral_temp, self.mixed_S, out = self.spectral_temp2 )
+        np.matmul( self.K, self.spectral_temp2, out = self.gradient_part )
+        np.subtract( self.gradient, self.gradient_part, out = self.gradient )
+
+    def __call__( self, weights ):
+        # for scipy.optimize.minimize( ..., jac = True ), which keeps what it gets, hence the copy
+        self.evaluate( weights )
+        return float( self.objective ), self.gradient.copy()
+
+    def pin( self, paint ):
+        # for pinned(): that paint's weight is fixed at 1, the other ones are given as ratios to it
+        self.free_paints = np.array( [ i for i in range( len( self.gradient ) ) if i != paint ] )
+        self.pinned_weights = np.ones( len( self.gradient ) )
+
+    def pinned( self, ratios ):
+        # __call__ over the k - 1 free weights, with the pinned one at 1 - the mix is the same for any scale of the
+        # weights, so fixing one of them takes that flat direction out of the optimizer's way
+        self.pinned_weights[self.free_paints] = ratios
+        self.evaluate( self.pinned_weights )
+        return float( self.objective ), self.gradient[self.free_paints]
+
+
+def combination_indices( num_items, num_picked ):
+    # all itertools.combinations( range( num_items ), num_picked ), in the same order, as a ( C, num_picked ) array
+    num_combinations = scipy.special.comb( num_items, num_picked, exact = True )
+    indices = np.fromiter( chain.from_iterable( combinations( range( num_items ), num_picked ) ), dtype = np.int32, count = num_combinations * num_picked )
+    return indices.reshape( num_combinations, num_picked )
+
+
+def unrank_combination( num_items, num_picked, rank ):
+    # the rank-th of itertools.combinations( range( num_items ), num_picked ), as a list, without going through the
+    # ones before it: every possible first item accounts for a block of comb( items after it, num_picked - 1 ) ranks
+    if not 0 <= rank < math.comb( num_items, num_picked ):
+        raise ValueError( "rank {} out of range".format( rank ) )
+
+    combination = []
+    item = 0
+    for position in range( num_picked ):
+        while rank >= math.comb( num_items - item - 1, num_picked - position - 1 ):
+            rank = rank - math.comb( num_items - item - 1, num_picked - position - 1 )
+            item = item + 1
+        combination.append( item )
+        item = item + 1
+
+    return combination
+
+
+def combinations_range( items, num_picked, start, stop ):
+    # itertools.combinations( items, num_picked )[start:stop], starting right at start (see unrank_combination)
+    num_items = len( items )
+    stop = min( stop, math.comb( num_items, num_picked ) )
+    if start >= stop:
+        return
+
+    indices = unrank_combination( num_items, num_picked, start )
+    for rank in range( start, stop ):
+        yield tuple( items[i] for i in indices )
+
+        # next one in order: bump the last index that can still move, the ones after it follow right behind
+        position = num_picked - 1
+        while position >= 0 and indices[position] == num_items - num_picked + position:
+            position = position - 1
+        if position < 0:
+            return
+
+        indices[position] = indices[position] + 1
+        for following in range( position + 1, num_picked ):
+            indices[following] = indices[following - 1] + 1
+
+
+def K_S_fit_system( K, S, target_R, visibility ):
+    # weights w matching the target's K/S minimize w^T gram w subject to mean_S . w = 1 - a least squares problem,
+    # since K_mix - ratio * S_mix = S_mix * ( ratio_mix - ratio ) is linear in the weights; fixing the (importance weighted)
+    # mean S of the mix rather than the sum of weights keeps that proportional to the K/S error and doesn't favour weak paints
+    target_K_S = ( 1.0 - target_R ) * ( 1.0 - target_R ) / ( 4.0 * target_R )
+
+    # error in K/S matters as much as it moves the reflectance (slope of R(K/S) at the target) where the eye sees it;
+    # with K/S = ( 1 - R )^2 / 4R, R = 1 + u - sqrt( u^2 + 2u ) for u = 2 K/S
+    u = 2.0 * target_K_S
+    slope = np.abs( 1.0 - ( u + 1.0 ) / np.sqrt( u * u + 2.0 * u ) )
+    importance = slope * visibility
+
+    residuals = ( K - target_K_S * S ) * importance
+    return residuals @ residuals.T, ( S * importance ).sum( -1 ) / importance.sum()
+
+
+class RecipePrescreener:
+    # cheap ranking of combinations before the full optimization:
+    # mixed K and S are linear in the weights, so matching the K/S ratio of an estimate of the target reflectance
+    # is a tiny equality constrained least squares problem per combination - all of them are sub-blocks of one
+    # Gram matrix over the enabled paints; combinations are then ranked by the true colour error of those weights
+    def __init__( self, optimizer, paints_to_use, block_size = 4096, refine_iterations = 3, spectral_delta_e = None ):
+        self.optimizer = optimizer
+        self.paints_to_use = list( paints_to_use )
+        self.block_size = block_size
+        self.refine_iterations = refine_iterations
+
+        # it only ranks, so it can run on a coarser spectral grid (see reduced_parameter_arrays)
+        names = [ optimizer.base_paints[paint]["name"] for paint in self.paints_to_use ]
+        self.wavelengths, self.K, self.S = reduced_parameter_arrays( optimizer.pigment_model, names, spectral_delta_e, optimizer.illuminants or ( "D65", ) )
+
+        target_R = Colorimetry.rgb_to_reflectance( optimizer.target_rgb, self.wavelengths )
+        visibility = Colorimetry.illuminant_weights( ( "D65", ), self.wavelengths )[0].sum( -1 )
+        self.gram, self.mean_S = K_S_fit_system( self.K, self.S, target_R, visibility )
+
+    def fit_weights( self, indices ):
+        # ( C, k ) paint indices -> ( C, k ) normalized weights
+        if indices.shape[1] == 1:
+            return np.ones( indices.shape )
+
+        gram = self.gram[indices[:, :, None], indices[:, None, :]]
+        gram = gram + np.eye( indices.shape[1] ) * ( 1e-9 * np.trace( gram, axis1 = 1, axis2 = 2 )[:, None, None] + 1e-30 )
+        constraint = self.mean_S[indices]
+
+        x = np.linalg.solve( gram, constraint[:, :, None] )[:, :, 0]
+        weights = x / ( constraint * x ).sum( -1, keepdims = True )
+
+        # the optimizer keeps every paint at >= 0.001 too
+        weights = weights / weights.sum( -1, keepdims = True )
+        weights = np.maximum( np.nan_to_num( weights, nan = 1.0 ), 0.001 )
+        return weights / weights.sum( -1, keepdims = True )
+
+    def refine_weights( self, K, S, weights ):
+        # the K/S fit is only as good as the guessed target spectrum, so polish the weights with a few
+        # damped Gauss-Newton steps on the actual colour difference - batched over all the combinations
+        def residuals( weights ):
+            diff = self.optimizer.mix_residuals( TwoDiffuseFluxesModel.mix_arrays( K, S, weights ), self.wavelengths )
+            return diff.reshape( len( weights ), -1 )
+
+        num_paints = weights.shape[1]
+        current = residuals( weights )
+        epsilon = 1e-4
+
+        for iteration in range( self.refine_iterations ):
+            jacobian = np.stack( [ ( residuals( weights + epsilon * np.eye( num_paints )[j] ) - current ) / epsilon for j in range( num_paints ) ], -1 )
+
+            # mixes only depend on the weight ratios, the damping takes care of the flat direction
+            normal = np.einsum( "cmi,cmj->cij", jacobian, jacobian )
+            normal = normal + np.eye( num_paints ) * ( 1e-3 * np.trace( normal, axis1 = 1, axis2 = 2 )[:, None, None] + 1e-12 )
+            step = np.linalg.solve( normal, -np.einsum( "cmi,cm->ci", jacobian, current )[:, :, None] )[:, :, 0]
+
+            candidate = np.maximum( weights + step, 0.001 )
+            candidate = candidate / candidate.sum( -1, keepdims = True )
+            candidate_residuals = residuals( candidate )
+
+            improved = ( candidate_residuals * candidate_residuals ).sum( -1 ) < ( current * current ).sum( -1 )
+            weights = np.where( improved[:, None], candidate, weights )
+            current = np.where( improved[:, None], candidate_residuals, current )
+
+        return weights
+
+    def score_combinations( self, indices ):
+        scores = np.empty( len( indices ) )
+
+        for start in range( 0, len( indices ), self.block_size ):
+            block = indices[start:start + self.block_size]
+            K, S = self.K[block], self.S[block]
+
+            weights = self.fit_weights( block )
+            if block.shape[1] > 1:
+                weights = self.refine_weights( K, S, weights )
+
+            scores[start:start + len( block )] = self.optimizer.mix_errors( TwoDiffuseFluxesModel.mix_arrays( K, S, weights ), self.wavelengths )
+
+        return scores
+
+    def best_combinations( self, num_paints, top_m ):
+        # the top_m most promising combinations of num_paints paints, best first
+        indices = combination_indices( len( self.paints_to_use ), num_paints )
+        scores = self.score_combinations( indices )
+
+        best = np.argsort( scores, kind = "stable" )[:top_m]
+        return [ tuple( self.paints_to_use[i] for i in indices[combination] ) for combination in best ]
+
+
+class SparseRecipeSolver:
+    # search that doesn't enumerate every combination: a beam of the best recipes is grown one paint at a time,
+    # then single paints get swapped for better ones; each step scores the candidates for all the enabled paints
+    # in one batch (same K/S fit + colour refinement as the prescreen), so the work grows linearly with the library;
+    # only the final beam of every size goes through the full RecipeOptimizer
+    def __init__( self, optimizer, paints_to_use, beam_width = 8, max_swap_rounds = 3, spectral_delta_e = None ):
+        self.prescreener = RecipePrescreener( optimizer, paints_to_use, spectral_delta_e = spectral_delta_e )
+        self.paints_to_use = list( paints_to_use )
+        self.beam_width = beam_width
+        self.max_swap_rounds = max_swap_rounds
+        self.num_evaluated = 0
+
+    def best_of( self, candidates ):
+        candidates = np.unique( np.sort( np.array( candidates, dtype = np.int32 ), -1 ), axis = 0 )
+        scores = self.prescreener.score_combinations( candidates )
+        self.num_evaluated = self.num_evaluated + len( candidates )
+
+        best = np.argsort( scores, kind = "stable" )[:self.beam_width]
+        return [ tuple( candidate ) for candidate in candidates[best] ], scores[best]
+
+    def grow( self, beam ):
+        return [ recipe + ( paint, ) for recipe in beam for paint in range( len( self.paints_to_use ) ) if paint not in recipe ]
+
+    def swaps( self, beam ):
+        return [ recipe[:i] + ( paint, ) + recipe[i + 1:] for recipe in beam for i in range( len( recipe ) ) for paint in range( len( self.paints_to_use ) ) if paint not in recipe ]
+
+    def candidate_combinations( self, max_num_paints ):
+        # { num_paints : [ paint names ] } - the beam for every recipe size
+        beams = {}
+        beam = [ () ]
+
+        for num_paints in range( 1, min( max_num_paints, len( self.paints_to_use ) ) + 1 ):
+            beam, scores = self.best_of( self.grow( beam ) )
+
+            if num_paints > 1:
+                for swap_round in range( self.max_swap_rounds ):
+                    swapped_beam, swapped_scores = self.best_of( beam + self.swaps( beam ) )
+                    if swapped_beam == beam:
+                        break
+                    beam = swapped_beam
+
+            beams[num_paints] = [ tuple( self.paints_to_use[i] for i in recipe ) for recipe in beam ]
+
+        return beams
+
+
+class PigmentClusters:
+    # library analysis for big (multi-brand) libraries: paints with nearly the same K/S spectrum (three phthalo blues)
+    # mix nearly the same, so they're grouped - average linkage on the RMS difference of log K/S - and the solver searches
+    # the combinations of one representative per group (the member closest to the rest of it) first, then swaps in the
+    # other members only for the winning recipes (solve_recipes search = "clustered")
+    def __init__( self, pigment_model, paint_names, threshold = 0.1 ):
+        self.paint_names = list( paint_names )
+        self.threshold = threshold
+        wavelengths, K, S = pigment_model.get_parameter_arrays( self.paint_names )
+
+        log_ratio = np.log( np.maximum( K / S, 1e-6 ) )
+        distances = scipy.spatial.distance.pdist( log_ratio ) / math.sqrt( len( wavelengths ) )
+        labels = scipy.cluster.hierarchy.fcluster( scipy.cluster.hierarchy.linkage( distances, "average" ), threshold, "distance" ) if len( self.paint_names ) > 1 else np.ones( len( self.paint_names ), dtype = int )
+        distances = scipy.spatial.distance.squareform( distances )
+
+        # [ [ representative, other members... ] ], in the order of the first member in paint_names
+        self.clusters = []
+        for label in dict.fromkeys( labels ):
+            members = np.nonzero( labels == label )[0]
+            representative = members[np.argmin( distances[np.ix_( members, members )].sum( -1 ) )]
+            self.clusters.append( [ self.paint_names[i] for i in [ representative ] + [ member for member in members if member != representative ] ] )
+
+        self.representatives = [ cluster[0] for cluster in self.clusters ]
+        self.members = { cluster[0] : cluster for cluster in self.clusters }
+
+    def expand( self, paint_sets ):
+        # the combinations that swap the paints of the given representative recipes for other members of their clusters
+        expanded = {}
+        for paint_set in paint_sets:
+            for combination in product( *( self.members[paint] for paint in paint_set ) ):
+                if combination not in paint_sets:
+                    expanded[combination] = True
+        return list( expanded.keys() )
+
+
+class SpectralRecipeOptimizer:
+    # target given as a reflectance spectrum (eg. a measured swatch) instead of an RGB triplet: an RGB match is only
+    # a metamer that can fall apart under another light, a spectral one isn't; matching the target's K/S is a linear
+    # least squares problem in the weights, so it's solved exactly for all the combinations at once, no iterations,
+    # gamma or colorimetry involved; recipes are ranked by the visibility weighted RMS of the reflectance difference
+    def __init__( self, base_paints, target_spectrum, pigment_model, paints_to_use, block_size = 4096 ):
+        self.base_paints = base_paints
+        self.pigment_model = pigment_model
+        self.paints_to_use = list( paints_to_use )
+        self.block_size = block_size
 
+        names = [ base_paints[paint]["name"] for paint in self.paints_to_use ]
+        self.wavelengths, self.K, self.S = pigment_model.get_parameter_arrays( names )
 
+        # outside of the measured range the target says nothing
+        covered = ( self.wavelengths >= target_spectrum.wavelengths.min() ) & ( self.wavelengths <= target_spectrum.wavelengths.max() )
+        self.target_R = np.clip( target_spectrum.resample( self.wavelengths ).values, 0.001, 0.999 )
+        self.target_rgb = Colorimetry.xyz_to_rgb_saturated( Colorimetry.reflectances_to_xyz( self.target_R, self.wavelengths )[0] )
 
-def load_measurments( file_path ):
-    data = {}
-    
+        visibility = Colorimetry.illuminant_weights( ( "D65", ), self.wavelengths )[0].sum( -1 ) * covered
+        self.visibility = visibility / visibility.sum()
+        self.gram, self.mean_S = K_S_fit_system( self.K, self.S, self.target_R, self.visibility )
+
+    def fit_weights( self, indices ):
+        # ( C, k ) paint indices -> ( C, k ) normalized non-negative weights; the constrained optimum is the
+        # unconstrained one on the subset of paints it keeps, so solve every subset at once and keep the best
+        # all-positive solution (k is small, 2^k - 1 subsets)
+        num_paints = indices.shape[1]
+        subsets = ( ( np.arange( 1, 2 ** num_paints )[:, None] >> np.arange( num_paints ) ) & 1 ).astype( bool )
+        pairs = subsets[:, :, None] & subsets[:, None, :]
+
+        gram = self.gram[indices[:, :, None], indices[:, None, :]][:, None]
+        gram = gram + np.eye( num_paints ) * ( 1e-9 * np.trace( gram, axis1 = -2, axis2 = -1 )[..., None, None] + 1e-30 )
+        constraint = self.mean_S[indices][:, None] * subsets
+
+        # paints left out of a subset get a unit diagonal and no constraint, so they solve to 0
+        x = np.linalg.solve( np.where( pairs, gram, np.eye( num_paints ) ), constraint[..., None] )[..., 0]
+        x = x / ( constraint * x ).sum( -1, keepdims = True )
+
+        objective = np.einsum( "csi,csij,csj->cs", x, gram, x )
+        objective = np.where( ( x >= 0.0 ).all( -1 ), objective, np.inf )
+        weights = np.take_along_axis( x, np.argmin( objective, -1 )[:, None, None], 1 )[:, 0]
+
+        # the RGB optimizer keeps every paint at >= 0.001 too
+        weights = np.maximum( weights / weights.sum( -1, keepdims = True ), 0.001 )
+        return weights / weights.sum( -1, keepdims = True )
+
+    def spectral_errors( self, reflectances ):
+        return np.sqrt( ( ( reflectances - self.target_R ) ** 2 * self.visibility ).sum( -1 ) )
+
+    def solve_combinations( self, indices ):
+        # ( C, k ) paint indices -> ( weights ( C, k ), mixed reflectances ( C, λ ), errors ( C ) )
+        weights = np.empty( indices.shape )
+        mixed_R = np.empty( ( len( indices ), len( self.wavelengths ) ) )
+
+        for start in range( 0, len( indices ), self.block_size ):
+            block = indices[start:start + self.block_size]
+            weights[start:start + len( block )] = self.fit_weights( block )
+            mixed_R[start:start + len( block )] = TwoDiffuseFluxesModel.mix_arrays( self.K[block], self.S[block], weights[start:start + len( block )] )
+
+        return weights, mixed_R, self.spectral_errors( mixed_R )
+
+    def make_recipes( self, indices, weights, mixed_R, errors ):
+        mixed_rgb = Colorimetry.xyz_to_rgb_saturated( Colorimetry.reflectances_to_xyz( mixed_R, self.wavelengths )[:, 0, :] )
+        return [ ( mixed_rgb[i], errors[i], tuple( self.paints_to_use[paint] for paint in indices[i] ), weights[i] ) for i in range( len( indices ) ) ]
+
+    def __call__( self, paint_set ):
+        # same interface as RecipeOptimizer
+        indices = np.array( [ [ self.paints_to_use.index( paint ) for paint in paint_set ] ] )
+        return self.make_recipes( indices, *self.solve_combinations( indices ) )[0]
+
+    def best_recipes( self, num_paints, num_best = 3 ):
+        indices = combination_indices( len( self.paints_to_use ), num_paints )
+        weights, mixed_R, errors = self.solve_combinations( indices )
+
+        best = np.argsort( errors, kind = "stable" )[:num_best]
+        return self.make_recipes( indices[best], weights[best], mixed_R[best], errors[best] )
+
+
+def integer_lattice( num_paints, max_total_parts ):
+    # every vector of num_paints positive integers that sum up to at most max_total_parts, ( P, num_paints );
+    # picking num_paints cut points out of 1..max_total_parts maps one to one onto those vectors
+    cuts = combination_indices( max_total_parts, num_paints ) + 1
+    return np.diff( cuts, axis = 1, prepend = 0 )
+
+
+def nearest_parts( proportions, total_parts ):
+    # the vector of positive integers summing up to total_parts closest to proportions: one part of every paint, and
+    # the rest handed out in proportion to what's missing, the leftovers by largest remainder
+    proportions = np.asarray( proportions, dtype = float ) / np.sum( proportions )
+    remaining = total_parts - len( proportions )
+
+    extra = np.maximum( proportions * total_parts - 1.0, 0.0 )
+    extra = extra * remaining / extra.sum() if extra.sum() > 0 else np.full( len( proportions ), remaining / len( proportions ) )
+
+    parts = np.floor( extra ).astype( int )
+    parts[np.argsort( parts - extra, kind = "stable" )[:remaining - parts.sum()]] += 1
+    return parts + 1
+
+
+def parts_window( num_paints, total_parts, proportions = None, radius = 1.0 ):
+    # yields every vector of num_paints positive integers summing up to total_parts whose proportions are within radius
+    # of proportions (all of them without proportions), ( P, num_paints ) blocks with one amount of the first paint each;
+    # only the box around the proportions is enumerated, the last paint is whatever is left of total_parts
+    low = np.ones( num_paints, dtype = int )
+    high = np.full( num_paints, total_parts - num_paints + 1 )
+    if proportions is not None:
+        proportions = np.asarray( proportions, dtype = float ) / np.sum( proportions )
+        low = np.maximum( low, np.ceil( ( proportions - radius ) * total_parts - 1e-9 ).astype( int ) )
+        high = np.minimum( high, np.floor( ( proportions + radius ) * total_parts + 1e-9 ).astype( int ) )
+
+    if num_paints == 1:
+        if low[0] <= total_parts <= high[0]:
+            yield np.array( [ [ total_parts ] ] )
+        return
+
+    if num_paints > 2:
+        middle = np.indices( np.maximum( high[1:-1] - low[1:-1] + 1, 0 ) ).reshape( num_paints - 2, -1 ).T + low[1:-1]
+    else:
+        middle = np.zeros( ( 1, 0 ), dtype = int )
+
+    for first in range( low[0], high[0] + 1 ):
+        last = total_parts - first - middle.sum( -1 )
+        inside = ( last >= low[-1] ) & ( last <= high[-1] )
+        if inside.any():
+            yield np.concatenate( [ np.full( ( inside.sum(), 1 ), first ), middle[inside], last[inside, None] ], -1 )
+
+
+class PartsRecipeSolver:
+    # recipes in whole parts (1:2:5, drops, ...) instead of continuous weights; rounding the continuous optimum
+    # loses accuracy, so the lattice of part vectors up to max_total_parts is evaluated instead, in batched
+    # mix + colorimetry passes; with the continuous optimum only its prune_radius box is enumerated for every total
+    # (or, when the box holds no lattice point, the one nearest to it), and only the best of every total is kept
+    BATCH_SIZE = 4096
+
+    def __init__( self, optimizer, max_total_parts = 12, prune_radius = 0.2 ):
+        self.optimizer = optimizer
+        self.max_total_parts = max_total_parts
+        self.prune_radius = prune_radius
+
+    def candidate_parts( self, num_paints, weights ):
+        # ( P, num_paints ) blocks of part vectors for every total
+        for total_parts in range( num_paints, self.max_total_parts + 1 ):
+            found = False
+            for block in parts_window( num_paints, total_parts, weights, self.prune_radius ):
+                found = True
+                yield block
+
+            if not found:
+                yield nearest_parts( weights, total_parts )[None]
+
+    def keep_best( self, K, S, wavelengths, parts, best ):
+        # best = { total parts : ( error, parts ) }, updated with the best of parts for every total in it
+        errors = np.concatenate( [ self.optimizer.mix_errors( TwoDiffuseFluxesModel.mix_arrays( K, S, parts[start:start + PartsRecipeSolver.BATCH_SIZE].astype( float ) ), wavelengths )
+                                   for start in range( 0, len( parts ), PartsRecipeSolver.BATCH_SIZE ) ] )
+        totals = parts.sum( -1 )
+
+        for total_parts in np.unique( totals ):
+            in_total = np.nonzero( totals == total_parts )[0]
+            i = in_total[np.argmin( errors[in_total] )]
+            if total_parts not in best or errors[i] < best[total_parts][0]:
+                best[total_parts] = ( errors[i], parts[i] )
+
+    def __call__( self, paint_set, weights = None ):
+        # returns the recipes where adding parts still improves the match, fewest parts first,
+        # as [ ( mixed_rgb, diff, paint_set, parts, delta_e ) ]; delta_e is CIE76 under D65
+        if len( paint_set ) > self.max_total_parts:
+            raise ValueError( "{} paints don't fit in {} parts".format( len( paint_set ), self.max_total_parts ) )
+
+        names = [ self.optimizer.base_paints[paint]["name"] for paint in paint_set ]
+        wavelengths, K, S = self.optimizer.pigment_model.get_parameter_arrays( names )
+
+        best = {}
+        batch = []
+        batch_size = 0
+        for block in self.candidate_parts( len( paint_set ), weights ):
+            batch.append( block )
+            batch_size = batch_size + len( block )
+            if batch_size >= PartsRecipeSolver.BATCH_SIZE:
+                self.keep_best( K, S, wavelengths, np.concatenate( batch ), best )
+                batch = []
+                batch_size = 0
+
+        if batch:
+            self.keep_best( K, S, wavelengths, np.concatenate( batch ), best )
+
+        # pareto front: for every total amount of parts, keep it only if it beats everything with fewer parts
+        front = []
+        best_error = np.inf
+        for total_parts in sorted( best ):
+            if best[total_parts][0] < best_error:
+                best_error = best[total_parts][0]
+                front.append( best[total_parts] )
+
+        errors = np.array( [ error for error, _ in front ] )
+        parts = np.array( [ front_parts for _, front_parts in front ] )
+
+        mixed_R = TwoDiffuseFluxesModel.mix_arrays( K, S, parts.astype( float ) )
+        xyz = Colorimetry.reflectances_to_xyz( mixed_R, wavelengths )
+        mixed_rgb = Colorimetry.xyz_to_rgb_saturated( xyz[:, 0, :] )
+        delta_e = np.sqrt( ( ( Colorimetry.reflectances_to_Lab( mixed_R, wavelengths )[:, 0, :] - self.optimizer.target_lab ) ** 2 ).sum( -1 ) )
+
+        return [ ( mixed_rgb[i], errors[i], paint_set, parts[i], delta_e[i] ) for i in range( len( front ) ) ]
+
+
+class MixCorrector:
+    # "nudge my mix": the smallest amounts of paint to add to a mix that's already close, to bring it onto the target;
+    # paint can only be added, never taken out, so the additions x >= 0 go on top of the current amounts a, and since
+    # only the ratios matter, sum( x ) is penalized (relative to sum( a ) and the error the mix starts from) to keep
+    # them small and sparse; up to max_extra_paints paints that aren't in the mix yet can come in too, picked by how
+    # fast a first drop of them brings the error down (the gradient at 0); one MixEvaluator over the current paints
+    # and all the candidates does every solve, with the paints that aren't in a candidate set pinned at 0 by bounds,
+    # all warm started at x = 0 - a couple of short L-BFGS-B runs, tens of milliseconds
+    def __init__( self, optimizer, paints_to_use, max_extra_paints = 1, num_candidates = 3, addition_penalty = 0.05, max_iterations = 100 ):
+        self.optimizer = optimizer
+        self.paints_to_use = paints_to_use
+        self.max_extra_paints = max_extra_paints
+        self.num_candidates = num_candidates
+        self.addition_penalty = addition_penalty
+        self.max_iterations = max_iterations
+
+    def __call__( self, current_paints, current_amounts ):
+        # returns [ ( mixed_rgb, diff, paint_set, amounts, additions ) ], the best correction first; paint_set is the
+        # current paints followed by the extra ones used, amounts are what's in the pot after adding the additions
+        current_paints = list( current_paints )
+        current_amounts = np.asarray( current_amounts, dtype = float )
+        if len( current_paints ) == 0 or current_amounts.sum() <= 0:
+            return []
+
+        extra_paints = [ paint for paint in self.paints_to_use if paint not in current_paints ] if self.max_extra_paints > 0 else []
+        all_paints = current_paints + extra_paints
+        num_current = len( current_paints )
+
+        evaluator = MixEvaluator( self.optimizer, all_paints )
+        start = np.concatenate( [ current_amounts, np.zeros( len( extra_paints ) ) ] )
+
+        evaluator.evaluate( start )
+        start_error = float( evaluator.objective )
+        penalty = self.addition_penalty * start_error / current_amounts.sum()
+
+        # extra paints whose first drop helps more than the penalty costs, steepest first
+        extra_slopes = evaluator.gradient[num_current:] + penalty
+        candidates = [ num_current + i for i in np.argsort( extra_slopes )[:self.num_candidates] if extra_slopes[i] < 0.0 ]
+
+        candidate_sets = [ () ]
+        for num_extra in range( 1, min( self.max_extra_paints, 2 ) + 1 ):
+            candidate_sets.extend( combinations( candidates, num_extra ) )
+
+        def objective( additions ):
+            evaluator.evaluate( start + additions )
+            return float( evaluator.objective ) + penalty * additions.sum(), evaluator.gradient + penalty
+
+        corrections = []
+        for extra_set in candidate_sets:
+            bounds = [ ( 0.0, None ) ] * num_current + [ ( 0.0, None if i in extra_set else 0.0 ) for i in range( num_current, len( all_paints ) ) ]
+            result = scipy.optimize.minimize( objective, np.zeros( len( all_paints ) ), jac = True, bounds = bounds, method = "L-BFGS-B", options = { "maxiter" : self.max_iterations } )
+
+            used = list( range( num_current ) ) + [ i for i in extra_set if result["x"][i] > 0.0 ]
+            additions = result["x"][used]
+            amounts = start[used] + additions
+
+            evaluator.mix( start + result["x"] )
+            mixed_rgb = Colorimetry.xyz_to_rgb_saturated( Colorimetry.reflectances_to_xyz( evaluator.reflectance, evaluator.wavelengths )[0] )
+            diff = float( self.optimizer.mix_errors( evaluator.reflectance, evaluator.wavelengths ) )
+
+            corrections.append( ( result["fun"], ( mixed_rgb, diff, tuple( all_paints[i] for i in used ), amounts, additions ) ) )
+
+        # a pair whose second paint wasn't worth adding after all is the same correction as the single
+        corrections.sort( key = lambda correction: correction[0] )
+        unique = {}
+        for _, correction in corrections:
+            unique.setdefault( correction[2], correction )
+        return list( unique.values() )
+
+
+def recipe_robustness( pigment_model, paint_names, weights, relative_noise = 0.05, absolute_noise = 0.0, num_samples = 1000, seed = 0, spectral_delta_e = None ):
+    # how much a recipe's colour moves when it's not weighed out exactly: the Jacobian of Lab (D65) with respect to
+    # the weights, and the delta E distribution over num_samples mixes with every weight off by a relative (gaussian,
+    # relative_noise of the weight) and an absolute (absolute_noise of the total amount) error, all mixed in one batch
+    wavelengths, K, S = reduced_parameter_arrays( pigment_model, paint_names, spectral_delta_e )
+    weights = np.asarray( weights, dtype = float )
+    weights = weights / weights.sum()
+    num_paints = len( weights )
+
+    rng = np.random.default_rng( seed )
+    perturbed = weights * ( 1.0 + relative_noise * rng.standard_normal( ( num_samples, num_paints ) ) ) + absolute_noise * rng.standard_normal( ( num_samples, num_paints ) )
+    perturbed = np.maximum( perturbed, 0.0 )
+
+    # central differences for the Jacobian go in the same batch
+    step = 1e-4
+    steps = np.concatenate( [ weights + step * np.eye( num_paints ), weights - step * np.eye( num_paints ) ] )
+
+    lab = Colorimetry.reflectances_to_Lab( TwoDiffuseFluxesModel.mix_arrays( K, S, np.concatenate( [ weights[None], steps, perturbed ] ) ), wavelengths )[:, 0, :]
+    nominal_lab = lab[0]
+    jacobian = ( ( lab[1:1 + num_paints] - lab[1 + num_paints:1 + 2 * num_paints] ) / ( 2.0 * step ) ).T
+    delta_e = np.sqrt( ( ( lab[1 + 2 * num_paints:] - nominal_lab ) ** 2 ).sum( -1 ) )
+
+    return { "lab" : nominal_lab,
+             "jacobian" : jacobian,
+             # delta E for 1% more of each paint
+             "sensitivity" : np.sqrt( ( jacobian * jacobian ).sum( 0 ) ) * 0.01 * weights,
+             "delta_e" : delta_e,
+             "mean" : float( delta_e.mean() ),
+             "median" : float( np.median( delta_e ) ),
+             "p95" : float( np.percentile( delta_e, 95 ) ),
+             "max" : float( delta_e.max() ) }
+
+
+class PaintGamut:
+    # approximate gamut of everything a set of paints can mix: the mixing simplex is sampled with the batched model
+    # (single paints, pairs at log spaced ratios since pigment strengths differ by orders of magnitude, and random
+    # sparse mixes of more) and the Lab (D65) samples are wrapped in a convex hull; mixing isn't convex in Lab,
+    # so it's an outer approximation - it rejects targets that are clearly out of reach, it doesn't promise a match
+    def __init__( self, pigment_model, paint_names, num_samples = 1024, seed = 0, spectral_delta_e = None ):
+        wavelengths, K, S = reduced_parameter_arrays( pigment_model, paint_names, spectral_delta_e )
+        num_paints = len( paint_names )
+
+        samples = [ np.eye( num_paints ) ]
+        if num_paints > 1:
+            ratios = np.geomspace( 1e-3, 1e3, 25 )
+            pairs = combination_indices( num_paints, 2 )
+            pair_weights = np.zeros( ( len( pairs ), len( ratios ), num_paints ) )
+            pair_weights[np.arange( len( pairs ) )[:, None], :, pairs[:, 0][:, None]] = ( ratios / ( 1.0 + ratios ) )[None, :]
+            pair_weights[np.arange( len( pairs ) )[:, None], :, pairs[:, 1][:, None]] = ( 1.0 / ( 1.0 + ratios ) )[None, :]
+            samples.append( pair_weights.reshape( -1, num_paints ) )
+
+        if num_paints > 2:
+            # a small concentration favours mixes dominated by a few paints, where the gamut boundary is
+            samples.append( np.random.default_rng( seed ).dirichlet( np.full( num_paints, 0.3 ), num_samples ) )
+
+        weights = np.concatenate( samples )
+        reflectances = TwoDiffuseFluxesModel.mix_arrays( K, S, weights )
+        self.samples_lab = Colorimetry.reflectances_to_Lab( reflectances, wavelengths )[:, 0, :]
+        self.white = Colorimetry.illuminant_white_points( ( "D65", ) )[0] * 100.0
+
+        try:
+            hull = scipy.spatial.ConvexHull( self.samples_lab )
+            points = self.samples_lab
+        except scipy.spatial.QhullError:
+            # a single paint, or paints that only mix along a line: give every sample a tiny volume
+            tetrahedron = np.array( [ [ 1.0, 1.0, 1.0 ], [ 1.0, -1.0, -1.0 ], [ -1.0, 1.0, -1.0 ], [ -1.0, -1.0, 1.0 ] ] ) * 1e-3
+            points = ( self.samples_lab[:, None, :] + tetrahedron ).reshape( -1, 3 )
+            hull = scipy.spatial.ConvexHull( points )
+
+        self.normals = np.ascontiguousarray( hull.equations[:, :3] )
+        self.offsets = np.ascontiguousarray( hull.equations[:, 3] )
+
+        # per facet data for the closest point queries: a corner, the two edges from it and their dot products
+        # (for barycentric coordinates), and all three edges as start + direction
+        triangles = points[hull.simplices]
+        self.corners = triangles[:, 0]
+        self.edge_ab = triangles[:, 1] - triangles[:, 0]
+        self.edge_ac = triangles[:, 2] - triangles[:, 0]
+        self.d00 = ( self.edge_ab * self.edge_ab ).sum( -1 )
+        self.d01 = ( self.edge_ab * self.edge_ac ).sum( -1 )
+        self.d11 = ( self.edge_ac * self.edge_ac ).sum( -1 )
+        self.denominator = np.maximum( self.d00 * self.d11 - self.d01 * self.d01, 1e-30 )
+
+        self.edge_starts = triangles
+        self.edge_directions = np.roll( triangles, -1, axis = 1 ) - triangles
+        self.edge_lengths = np.maximum( ( self.edge_directions * self.edge_directions ).sum( -1 ), 1e-30 )
+
+        # outline of the gamut on the xy chromaticity diagram
+        xyz = Colorimetry.reflectances_to_xyz( reflectances, wavelengths )[:, 0, :]
+        xy = xyz[:, :2] / xyz.sum( -1, keepdims = True )
+        try:
+            self.xy_boundary = xy[scipy.spatial.ConvexHull( xy ).vertices]
+        except scipy.spatial.QhullError:
+            self.xy_boundary = xy[[ np.argmin( xy[:, 0] ), np.argmax( xy[:, 0] ) ]]
+
+    def distance_outside( self, lab ):
+        # largest signed distance to the hull's facet planes: <= 0 inside, a lower bound of the distance outside
+        return float( ( self.normals @ lab + self.offsets ).max() )
+
+    def contains( self, lab, tolerance = 0.0 ):
+        return self.distance_outside( lab ) <= tolerance
+
+    def nearest( self, lab ):
+        # closest point of the hull to the Lab colour and the delta E to it, ( lab, 0 ) for colours inside;
+        # the closest point is either a projection onto a facet that lands inside it, or on one of the edges
+        # (for a convex hull, only facets facing the colour can hold it, which is usually a handful)
+        lab = np.asarray( lab, dtype = float )
+        plane_distances = self.normals @ lab + self.offsets
+        visible = np.nonzero( plane_distances > 0.0 )[0]
+        if len( visible ) == 0:
+            return lab, 0.0
+
+        plane_distances = plane_distances[visible]
+        projected = lab - plane_distances[:, None] * self.normals[visible]
+        relative = projected - self.corners[visible]
+        d20 = ( relative * self.edge_ab[visible] ).sum( -1 )
+        d21 = ( relative * self.edge_ac[visible] ).sum( -1 )
+        v = ( self.d11[visible] * d20 - self.d01[visible] * d21 ) / self.denominator[visible]
+        w = ( self.d00[visible] * d21 - self.d01[visible] * d20 ) / self.denominator[visible]
+        facet_distances = np.where( ( v >= 0.0 ) & ( w >= 0.0 ) & ( v + w <= 1.0 ), plane_distances, np.inf )
+
+        edge_starts = self.edge_starts[visible].reshape( -1, 3 )
+        edge_directions = self.edge_directions[visible].reshape( -1, 3 )
+        t = np.clip( ( ( lab - edge_starts ) * edge_directions ).sum( -1 ) / self.edge_lengths[visible].reshape( -1 ), 0.0, 1.0 )
+        edge_points = edge_starts + t[:, None] * edge_directions
+        edge_distances = np.sqrt( ( ( edge_points - lab ) ** 2 ).sum( -1 ) )
+
+        best_facet = np.argmin( facet_distances )
+        best_edge = np.argmin( edge_distances )
+
+        if facet_distances[best_facet] < edge_distances[best_edge]:
+            return projected[best_facet], float( facet_distances[best_facet] )
+        return edge_points[best_edge], float( edge_distances[best_edge] )
+
+    def lab_to_rgb( self, lab ):
+        xyz = np.array( Colorimetry.Lab_to_xyz( *lab, *self.white ) ) / 100.0
+        return Colorimetry.xyz_to_rgb_saturated( xyz )
+
+
+# gamuts of the recently used paint sets
+GAMUT_CACHE_SIZE = 32
+gamut_cache = OrderedDict()
+gamut_cache_lock = threading.Lock()
+
+
+def get_gamut( paint_database, paints, spectral_delta_e = None ):
+    # PaintGamut of a paint set, cached by the (unordered) set of paints and their parameters
+    key = ( paint_database.get_hash( paints ), tuple( sorted( paints ) ), spectral_delta_e )
+
+    with gamut_cache_lock:
+        gamut = gamut_cache.get( key )
+        if gamut is not None:
+            gamut_cache.move_to_end( key )
+            return gamut
+
+    all_paints = paint_database.get_all_paints()
+    gamut = PaintGamut( paint_database.get_mixing_model(), [ all_paints[paint]["name"] for paint in key[1] ], spectral_delta_e = spectral_delta_e )
+
+    with gamut_cache_lock:
+        gamut_cache[key] = gamut
+        while len( gamut_cache ) > GAMUT_CACHE_SIZE:
+            gamut_cache.popitem( last = False )
+
+    return gamut
+
+
+CLUSTER_CACHE_SIZE = 32
+cluster_cache = OrderedDict()
+cluster_cache_lock = threading.Lock()
+
+def get_clusters( paint_database, paints, threshold = 0.1 ):
+    # PigmentClusters of a paint set, cached like get_gamut
+    key = ( paint_database.get_hash( paints ), tuple( sorted( paints ) ), threshold )
+
+    with cluster_cache_lock:
+        clusters = cluster_cache.get( key )
+        if clusters is not None:
+            cluster_cache.move_to_end( key )
+            return clusters
+
+    all_paints = paint_database.get_all_paints()
+    clusters = PigmentClusters( paint_database.get_mixing_model(), [ all_paints[paint]["name"] for paint in key[1] ], threshold )
+
+    with cluster_cache_lock:
+        cluster_cache[key] = clusters
+        while len( cluster_cache ) > CLUSTER_CACHE_SIZE:
+            cluster_cache.popitem( last = False )
+
+    return clusters
+
+
+class OutOfGamutError( ValueError ):
+    def __init__( self, target_lab, nearest_lab, nearest_rgb, distance ):
+        self.target_lab = target_lab
+        self.nearest_lab = nearest_lab
+        self.nearest_rgb = nearest_rgb
+        self.distance = distance
+
+        super().__init__( "target is {:.1f} dE outside of what the paints can mix, the nearest reachable colour is #{:02x}{:02x}{:02x}".format(
+            distance, *( np.round( np.asarray( nearest_rgb ) * 255 ).astype( int ) ) ) )
+
+
+# threads only run Python code in parallel on a free-threaded build
+FREE_THREADED = not getattr( sys, "_is_gil_enabled", lambda: True )()
+
+
+class AdaptiveExecutor:
+    # a map_function for solve_recipes that picks how to run every call: the first couple of tasks run inline
+    # to measure what a task costs, then the rest runs
+    #   - inline, when that's cheaper than handing it to a pool (eg. the dozen 1 paint recipes),
+    #   - on a thread pool on a free-threaded build, where threads actually run in parallel (the per recipe work
+    #     is lots of small NumPy calls, which hold the GIL most of the time otherwise),
+    #   - on a process pool otherwise, in chunks of about chunk_seconds of work, so sending them is amortized
+    #     but every worker still gets a few
+    # pools are started on first use and kept; every call leaves a record in telemetry
+    def __init__( self, max_workers = None, chunk_seconds = 0.02, probe_tasks = 2, telemetry_size = 256 ):
+        self.max_workers = max_workers if max_workers else min( 61, os.cpu_count() )
+        self.chunk_seconds = chunk_seconds
+        self.probe_tasks = probe_tasks
+
+        self.process_pool = None
+        self.thread_pool = None
+
+        # what the pools cost on top of the work; guesses until they are measured
+        self.process_startup_seconds = 0.1 + 0.02 * self.max_workers
+        self.process_chunk_seconds = 0.0005
+        self.thread_task_seconds = 0.00005
+
+        self.telemetry = deque( maxlen = telemetry_size )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def close( self ):
+        if self.process_pool:
+            self.process_pool.terminate()
+            self.process_pool.join()
+            self.process_pool = None
+        if self.thread_pool:
+            self.thread_pool.shutdown()
+            self.thread_pool = None
+
+    def get_process_pool( self ):
+        if self.process_pool is None:
+            start = time.perf_counter()
+            self.process_pool = multiprocessing.Pool( self.max_workers )
+            # make sure the workers are up, so the startup cost is all in here
+            self.process_pool.map( abs, range( self.max_workers ), 1 )
+            self.process_startup_seconds = time.perf_counter() - start
+        return self.process_pool
+
+    def get_thread_pool( self ):
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPoolExecutor( self.max_workers )
+        return self.thread_pool
+
+    def plan( self, num_tasks, task_seconds ):
+        # ( strategy, workers, chunk size, estimated seconds ) for num_tasks more tasks
+        inline_seconds = task_seconds * num_tasks
+        workers = min( self.max_workers, num_tasks )
+        if workers <= 1:
+            return "inline", 1, num_tasks, inline_seconds
+
+        if FREE_THREADED:
+            thread_seconds = inline_seconds / workers + self.thread_task_seconds * num_tasks
+            return ( "threads", workers, 1, thread_seconds ) if thread_seconds < inline_seconds else ( "inline", 1, num_tasks, inline_seconds )
+
+        chunk_size = max( 1, min( math.ceil( self.chunk_seconds / max( task_seconds, 1e-9 ) ), math.ceil( num_tasks / ( 4 * workers ) ) ) )
+        num_chunks = math.ceil( num_tasks / chunk_size )
+        startup_seconds = self.process_startup_seconds if self.process_pool is None else 0.0
+        process_seconds = inline_seconds / min( workers, num_chunks ) + startup_seconds + self.process_chunk_seconds * num_chunks
+
+        return ( "processes", workers, chunk_size, process_seconds ) if process_seconds < inline_seconds else ( "inline", 1, num_tasks, inline_seconds )
+
+    def __call__( self, function, items ):
+        items = list( items )
+        start = time.perf_counter()
+
+        num_probed = min( self.probe_tasks, len( items ) )
+        results = [ function( item ) for item in items[:num_probed] ]
+        task_seconds = ( time.perf_counter() - start ) / max( num_probed, 1 )
+
+        remaining = items[num_probed:]
+        strategy, workers, chunk_size, estimated_seconds = self.plan( len( remaining ), task_seconds )
+
+        run_start = time.perf_counter()
+        if len( remaining ) == 0 or strategy == "inline":
+            results.extend( function( item ) for item in remaining )
+        elif strategy == "threads":
+            results.extend( self.get_thread_pool().map( function, remaining ) )
+
+            overhead = ( time.perf_counter() - run_start ) - task_seconds * len( remaining ) / workers
+            self.thread_task_seconds = 0.5 * self.thread_task_seconds + 0.5 * max( overhead / len( remaining ), 0.0 )
+        else:
+            pool = self.get_process_pool()
+            run_start = time.perf_counter()
+            results.extend( pool.map( function, remaining, chunk_size ) )
+
+            # whatever didn't scale is overhead, spread over the chunks
+            num_chunks = math.ceil( len( remaining ) / chunk_size )
+            overhead = ( time.perf_counter() - run_start ) - task_seconds * len( remaining ) / min( workers, num_chunks )
+            self.process_chunk_seconds = 0.5 * self.process_chunk_seconds + 0.5 * max( overhead / num_chunks, 0.0 )
+
+        self.telemetry.append( { "strategy" : strategy, "tasks" : len( items ), "workers" : workers, "chunk_size" : chunk_size,
+                                 "task_seconds" : task_seconds, "estimated_seconds" : estimated_seconds,
+                                 "seconds" : time.perf_counter() - start } )
+        return results
+
+
+def single_paint_recipe( optimizer, paint_database, paint ):
+    mixed_rgb = paint_database.get_colorimetry( paint )["rgb"]
+    diff = mixed_rgb - optimizer.target_rgb
+    return mixed_rgb, float( np.dot( diff, diff ) ), ( paint, ), np.array( [ 1.0 ] )
+
+
+def solve_recipes( target_rgb, paint_database, paints_to_use, max_num_paints = 4, num_best = 3, map_function = map, illuminants = None, illuminant_error = "mean", recipe_sizes = None, prescreen_top_m = None, search = "exhaustive", beam_width = 8, max_total_parts = None, gamut_tolerance = None, cluster_threshold = 0.1, cluster_expand = 8, spectral_delta_e = None ):
+    # headless solver core: yields ( num_paints, best recipes ) for every recipe size, as soon as it's done;
+    # map_function lets the caller spread the combinations over a pool (eg. Pool.map), recipe_sizes
+    # restricts the solve to some of the sizes (eg. the ones that aren't cached yet), and prescreen_top_m
+    # only fully optimizes that many of the most promising combinations per size;
+    # search = "sparse" replaces the enumeration of all combinations with SparseRecipeSolver's beam search;
+    # search = "clustered" enumerates the combinations of PigmentClusters representatives (paints closer than
+    # cluster_threshold in log K/S grouped), then the other members of the clusters in the cluster_expand best of them;
+    # with max_total_parts the best recipes are returned in integer parts instead of continuous weights, as
+    # ( mixed_rgb, diff, paint_set, parts, delta_e ), and sizes with more paints than parts are left out;
+    # with gamut_tolerance (delta E) targets further than that outside the paints' gamut raise OutOfGamutError up front;
+    # spectral_delta_e lets the prescreen, the sparse search and the gamut run on a coarser spectral grid that's within
+    # that delta E of the full one (reduced_parameter_arrays), the recipes themselves are always optimized on the full grid
+    optimizer = RecipeOptimizer( paint_database.get_all_paints(), target_rgb, paint_database.get_mixing_model(), illuminants, illuminant_error )
+
+    if gamut_tolerance is not None:
+        gamut = get_gamut( paint_database, paints_to_use, spectral_delta_e )
+        if not gamut.contains( optimizer.target_lab, gamut_tolerance ):
+            nearest_lab, distance = gamut.nearest( optimizer.target_lab )
+            if distance > gamut_tolerance:
+                raise OutOfGamutError( optimizer.target_lab, nearest_lab, gamut.lab_to_rgb( nearest_lab ), distance )
+
+    parts_solver = PartsRecipeSolver( optimizer, max_total_parts ) if max_total_parts else None
+    recipe_sizes = recipe_sizes if recipe_sizes is not None else range( 1, max_num_paints + 1 )
+    if parts_solver is not None:
+        # every paint takes at least one part, bigger recipes can't be had within max_total_parts
+        recipe_sizes = [ num_paints for num_paints in recipe_sizes if num_paints <= max_total_parts ]
+
+    prescreener = RecipePrescreener( optimizer, paints_to_use, spectral_delta_e = spectral_delta_e ) if prescreen_top_m and search == "exhaustive" else None
+    beams = SparseRecipeSolver( optimizer, paints_to_use, beam_width, spectral_delta_e = spectral_delta_e ).candidate_combinations( max( recipe_sizes, default = 0 ) ) if search == "sparse" else None
+    clusters = get_clusters( paint_database, paints_to_use, cluster_threshold ) if search == "clustered" else None
+
+    for num_paints in recipe_sizes:
+        if num_paints == 1 and optimizer.illuminants is None:
+            # a single paint is its masstone whatever the amount, nothing to optimize; its colour is in the library's cache
+            results = [ single_paint_recipe( optimizer, paint_database, paint ) for paint in paints_to_use ]
+        else:
+            if beams is not None:
+                paint_combinations = beams.get( num_paints, [] )
+            elif prescreener is not None:
+                paint_combinations = prescreener.best_combinations( num_paints, prescreen_top_m )
+            elif clusters is not None:
+                paint_combinations = list( combinations( clusters.representatives, num_paints ) )
+            else:
+                paint_combinations = list( combinations( paints_to_use, num_paints ) )
+            results = list( map_function( optimizer, paint_combinations ) )
+
+            if clusters is not None:
+                winners = heapq.nsmallest( cluster_expand, results, key = lambda result: result[1] )
+                results = results + list( map_function( optimizer, clusters.expand( [ tuple( winner[2] ) for winner in winners ] ) ) )
+        best = heapq.nsmallest( num_best, results, key = lambda result: result[1] )
+
+        if parts_solver is not None:
+            # most accurate whole parts version of every recipe, with its delta E; rounding can reorder them
+            best = sorted( [ parts_solver( paint_set, weights )[-1] for _, _, paint_set, weights in best ], key = lambda result: result[1] )
+
+        yield num_paints, best
+
+
+def solve_spectral_recipes( target_spectrum, paint_database, paints_to_use, max_num_paints = 4, num_best = 3, recipe_sizes = None ):
+    # solve_recipes for a reflectance spectrum target (see SpectralRecipeOptimizer); it's vectorized over
+    # the combinations already, so there's no map_function
+    optimizer = SpectralRecipeOptimizer( paint_database.get_all_paints(), target_spectrum, paint_database.get_mixing_model(), paints_to_use )
+    recipe_sizes = recipe_sizes if recipe_sizes is not None else range( 1, max_num_paints + 1 )
+
+    for num_paints in recipe_sizes:
+        yield num_paints, optimizer.best_recipes( num_paints, num_best )
+
+
+PALETTE_CACHE_SIZE = 256
+palette_cache = OrderedDict()
+palette_cache_lock = threading.Lock()
+
+def palette_target_candidates( paint_database, paints_to_use, target_rgb, max_recipe_paints = 3, keep = 2000, spectral_delta_e = None ):
+    # a target's keep best recipes of up to max_recipe_paints of the paints, scored with the batched prescreen in Lab
+    # (delta E under D65), as ( ( C, max_recipe_paints ) paint indices padded with len( paints_to_use ), ( C, ) delta E ),
+    # best first; cached per target and paint set, so a palette can be re-run with other limits without rescoring
+    key = ( paint_database.get_hash( paints_to_use ), tuple( paints_to_use ), tuple( np.round( np.asarray( target_rgb ) * 255 ).astype( int ) ), max_recipe_paints, keep, spectral_delta_e )
+
+    with palette_cache_lock:
+        candidates = palette_cache.get( key )
+        if candidates is not None:
+            palette_cache.move_to_end( key )
+            return candidates
+
+    optimizer = RecipeOptimizer( paint_database.get_all_paints(), np.asarray( target_rgb, dtype = float ), paint_database.get_mixing_model(), ( "D65", ) )
+    prescreener = RecipePrescreener( optimizer, paints_to_use, spectral_delta_e = spectral_delta_e )
+
+    indices = []
+    delta_e = []
+    for num_paints in range( 1, min( max_recipe_paints, len( paints_to_use ) ) + 1 ):
+        size_indices = combination_indices( len( paints_to_use ), num_paints )
+        size_delta_e = np.nan_to_num( prescreener.score_combinations( size_indices ), nan = np.inf )
+
+        best = np.argsort( size_delta_e, kind = "stable" )[:keep]
+        indices.append( np.pad( size_indices[best], ( ( 0, 0 ), ( 0, max_recipe_paints - num_paints ) ), constant_values = len( paints_to_use ) ) )
+        delta_e.append( size_delta_e[best] )
+
+    indices = np.concatenate( indices )
+    delta_e = np.concatenate( delta_e )
+    best = np.argsort( delta_e, kind = "stable" )[:keep]
+    candidates = ( indices[best], delta_e[best] )
+
+    with palette_cache_lock:
+        palette_cache[key] = candidates
+        while len( palette_cache ) > PALETTE_CACHE_SIZE:
+            palette_cache.popitem( last = False )
+
+    return candidates
+
+
+class PaletteSelector:
+    # which (at most) max_paints of the paints to bring to a job so that every target of a palette can be mixed within
+    # delta_e: every target's candidate recipes come from palette_target_candidates - the prescreen's weights are never
+    # better than the optimizer's, so a target counts as reachable by a paint set when one of its candidates is inside
+    # it and scores under delta_e; the set is grown greedily by whole candidate recipes (most targets newly covered
+    # per paint added), then single paints are swapped while that covers more targets or lowers the total delta E,
+    # and finally every target is solved properly on the chosen paints
+    def __init__( self, paint_database, paints_to_use, targets_rgb, max_paints = 8, delta_e = 3.0, max_recipe_paints = 3, keep = 2000,
+                  candidates_per_target = 25, max_swap_rounds = 10, spectral_delta_e = None ):
+        if max_paints < 1:
+            raise ValueError( "a palette needs at least one paint, got max_paints = {}".format( max_paints ) )
+        if len( targets_rgb ) == 0:
+            raise ValueError( "a palette needs at least one target" )
+        if len( paints_to_use ) == 0:
+            raise ValueError( "no paints to choose the palette from" )
+
+        self.paint_database = paint_database
+        self.paints_to_use = list( paints_to_use )
+        self.targets_rgb = [ np.asarray( target_rgb, dtype = float ) for target_rgb in targets_rgb ]
+        self.max_paints = max_paints
+        self.delta_e = delta_e
+        self.max_recipe_paints = max_recipe_paints
+        self.candidates_per_target = candidates_per_target
+        self.max_swap_rounds = max_swap_rounds
+
+        candidates = [ palette_target_candidates( paint_database, self.paints_to_use, target_rgb, max_recipe_paints, keep, spectral_delta_e ) for target_rgb in self.targets_rgb ]
+        self.target_candidates = [ target_indices for target_indices, _ in candidates ]
+
+        # all the targets' candidates in one batch, for scoring a paint set in a single pass
+        self.candidate_paints = np.concatenate( [ target_indices for target_indices, _ in candidates ] )
+        self.candidate_delta_e = np.concatenate( [ target_delta_e for _, target_delta_e in candidates ] )
+        self.candidate_targets = np.concatenate( [ np.full( len( target_delta_e ), target ) for target, ( _, target_delta_e ) in enumerate( candidates ) ] )
+
+        # a target without any candidate in the set is as bad as the worst candidate anyone kept
+        finite = self.candidate_delta_e[np.isfinite( self.candidate_delta_e )]
+        self.delta_e_cap = max( finite.max() if len( finite ) > 0 else delta_e, delta_e ) * 2.0
+
+    def best_delta_e( self, selected ):
+        # estimated best delta E of every target with the paints in the ( N, ) boolean mask
+        inside = np.append( selected, True )[self.candidate_paints].all( -1 )
+        best = np.full( len( self.targets_rgb ), np.inf )
+        np.minimum.at( best, self.candidate_targets[inside], self.candidate_delta_e[inside] )
+        return best
+
+    def score( self, selected ):
+        # ( targets covered, -total delta E ), higher is better
+        best = self.best_delta_e( selected )
+        return int( ( best <= self.delta_e ).sum() ), -float( np.minimum( best, self.delta_e_cap ).sum() )
+
+    def grow( self, selected ):
+        # add the candidate recipe that gains most per new paint, or return None when nothing helps
+        current = self.score( selected )
+        best = self.best_delta_e( selected )
+        room = self.max_paints - int( selected.sum() )
+
+        best_gain = None
+        best_selected = None
+        for target in np.nonzero( best > self.delta_e )[0]:
+            for candidate in self.target_candidates[target][:self.candidates_per_target]:
+                new_paints = [ paint for paint in candidate if paint < len( self.paints_to_use ) and not selected[paint] ]
+                if len( new_paints ) == 0 or len( new_paints ) > room:
+                    continue
+
+                trial = selected.copy()
+                trial[new_paints] = True
+                covered, total = self.score( trial )
+                gain = ( ( covered - current[0] ) / len( new_paints ), ( total - current[1] ) / len( new_paints ) )
+                if gain > ( 0, 0.0 ) and ( best_gain is None or gain > best_gain ):
+                    best_gain = gain
+                    best_selected = trial
+
+        return best_selected
+
+    def swap( self, selected ):
+        # the best single paint swap, or None when none of them improves the score
+        current = self.score( selected )
+        best_score = current
+        best_selected = None
+
+        for paint_out in np.nonzero( selected )[0]:
+            for paint_in in np.nonzero( ~selected )[0]:
+                trial = selected.copy()
+                trial[paint_out] = False
+                trial[paint_in] = True
+                trial_score = self.score( trial )
+                if trial_score > best_score:
+                    best_score = trial_score
+                    best_selected = trial
+
+        return best_selected
+
+    def select( self ):
+        # [ paint names ]
+        selected = np.zeros( len( self.paints_to_use ), dtype = bool )
+
+        while selected.sum() < self.max_paints:
+            grown = self.grow( selected )
+            if grown is None:
+                break
+            selected = grown
+
+        for swap_round in range( self.max_swap_rounds ):
+            swapped = self.swap( selected )
+            if swapped is None:
+                break
+            selected = swapped
+
+        return [ self.paints_to_use[i] for i in np.nonzero( selected )[0] ]
+
+    def solve( self, paints, map_function = map, paint_library = None ):
+        # the best recipe of up to max_recipe_paints of the chosen paints for every target, with its delta E (D65);
+        # [ ( recipe, delta E ) ], ( None, inf ) for a target nothing can be mixed for (eg. no paints were chosen).
+        # paint_library is what the recipes are solved on, the database by default; pass its get_mapped_library()
+        # when map_function sends the work to other processes
+        library = paint_library if paint_library is not None else self.paint_database
+        results = []
+        for target_rgb in self.targets_rgb:
+            recipes = []
+            if len( paints ) > 0:
+                recipes = [ best[0] for _, best in solve_recipes( target_rgb, library, paints, self.max_recipe_paints, 1, map_function, ( "D65", ) ) if len( best ) > 0 ]
+            if len( recipes ) == 0:
+                results.append( ( None, np.inf ) )
+                continue
+            recipe = min( recipes, key = lambda recipe: recipe[1] )
+            results.append( ( recipe, float( recipe[1] ) ) )
+        return results
+
+
+# repeat readings of a sample are combined with this statistic: "mean", "median" or "trimmed" (mean of what's left
+# after dropping the lowest and highest MEASUREMENT_TRIM of the readings at every wavelength)
+MEASUREMENT_STATISTIC = "mean"
+MEASUREMENT_TRIM = 0.1
+
+# with 3 or more readings of a sample, a reading whose RMS distance from the median spectrum is more than this many
+# (robust) standard deviations above the typical one is left out as an outlier; the spread is never taken as less
+# than OUTLIER_MIN_DISTANCE, so readings that agree very well don't turn ordinary noise into outliers
+OUTLIER_THRESHOLD = 3.5
+OUTLIER_MIN_DISTANCE = 0.005
+
+
+def load_measurments( file_path, statistic = MEASUREMENT_STATISTIC, outlier_threshold = OUTLIER_THRESHOLD ):
     with open(file_path, 'r') as json_file:
         datasets = json.load(json_file)
 
-        wavelengths = []
+    wavelengths = []
 
-        for dataset in datasets:
-            if dataset["type"] == "wavelengths":
-                wavelengths = np.array( dataset["values"] )
-                break
+    for dataset in datasets:
+        if dataset["type"] == "wavelengths":
+            wavelengths = np.array( dataset["values"] )
+            break
 
-        if len( wavelengths ) == 0:
-            return {}        
+    if len( wavelengths ) == 0:
+        return {}        
 
-        for dataset in datasets:
-            if dataset["type"] != "wavelengths":            
-                dataset["reflectance"] = Spectrum( wavelengths, dataset["reflectance"], 1.0 / 100.0 )
-                data.setdefault( dataset["name"], [] ).append( dataset )
+    # every reading of the file in one ( R, λ ) array, they all share the file's wavelengths
+    readings = [ dataset for dataset in datasets if dataset["type"] != "wavelengths" ]
+    values = np.array( [ dataset["reflectance"] for dataset in readings ], dtype = float ).reshape( len( readings ), len( wavelengths ) ) / 100.0
 
-    data = average_measurements( data )
+    return average_measurements( readings, values, wavelengths, statistic, outlier_threshold )
 
-    return data
 
+def outlier_readings( values, outlier_threshold = OUTLIER_THRESHOLD ):
+    # ( ..., R, λ ) readings of samples with R readings each -> ( ..., R ) mask of the outliers
+    if outlier_threshold is None or values.shape[-2] < 3:
+        return np.zeros( values.shape[:-1], dtype = bool )
 
-def average_measurements( samples ):
-    averaged_samples = {}
+    distances = np.sqrt( np.mean( np.square( values - np.median( values, -2, keepdims = True ) ), -1 ) )
+    typical_distance = np.median( distances, -1, keepdims = True )
+    spread = 1.4826 * np.median( np.abs( distances - typical_distance ), -1, keepdims = True )
 
-    for sample in samples:
-        averaged_spectrum = Spectrum()
+    return distances > typical_distance + outlier_threshold * np.maximum( spread, OUTLIER_MIN_DISTANCE )
 
-        if type( samples[sample] ) is list:
-            for measurement in samples[sample]:
-                averaged_spectrum = averaged_spectrum + measurement["reflectance"]
 
-            averaged_spectrum = averaged_spectrum * ( 1.0 / len( samples[sample] ) )
+def combine_readings( values, keep, statistic = MEASUREMENT_STATISTIC ):
+    # ( ..., R, λ ) readings and ( ..., R ) mask of the ones to use -> ( ..., λ )
+    if statistic == "mean":
+        return ( values * keep[..., None] ).sum( -2 ) / keep.sum( -1 )[..., None]
+
+    # left out readings become NaNs, which sort after everything else
+    masked_values = np.where( keep[..., None], values, np.nan )
+
+    if statistic == "median":
+        return np.nanmedian( masked_values, -2 )
+    if statistic == "trimmed":
+        num_kept = keep.sum( -1, keepdims = True )
+        num_trimmed = ( MEASUREMENT_TRIM * num_kept ).astype( int )
+        positions = np.arange( values.shape[-2] )
+        used = ( positions >= num_trimmed ) & ( positions < num_kept - num_trimmed )
+        return np.where( used[..., None], np.sort( masked_values, -2 ), 0.0 ).sum( -2 ) / used.sum( -1 )[..., None]
+
+    raise ValueError( "unknown statistic: {}".format( statistic ) )
+
+
+def average_measurements( readings, values, wavelengths, statistic = MEASUREMENT_STATISTIC, outlier_threshold = OUTLIER_THRESHOLD ):
+    # readings: the records of a file, values their ( R, λ ) reflectances; returns { name : sample } with one sample
+    # per name, in the order they first show up, with the combined reflectance, the number of readings and the indices
+    # (into readings) of the ones left out as outliers
+    names, first_indices, groups, counts = np.unique( [ reading["name"] for reading in readings ], return_index = True, return_inverse = True, return_counts = True )
+
+    # readings of the same sample next to each other
+    order = np.argsort( groups, kind = "stable" )
+    group_starts = np.concatenate( [ [ 0 ], np.cumsum( counts )[:-1] ] )
+
+    # all the samples with the same number of readings go through as one ( samples, readings, λ ) batch
+    sample_values = np.empty( ( len( names ), values.shape[1] ) )
+    outliers = np.zeros( len( readings ), dtype = bool )
+
+    for count in np.unique( counts ):
+        batch = np.nonzero( counts == count )[0]
+        reading_indices = order[group_starts[batch][:, None] + np.arange( count )]
+        batch_values = values[reading_indices]
+
+        batch_outliers = outlier_readings( batch_values, outlier_threshold )
+        sample_values[batch] = combine_readings( batch_values, ~batch_outliers, statistic )
+        outliers[reading_indices[batch_outliers]] = True
+
+    averaged_samples = {}
+
+    for group in np.argsort( first_indices ):
+        group_readings = order[group_starts[group]:group_starts[group] + counts[group]]
+
+        new_sample = dict( readings[first_indices[group]] )
+        new_sample["reflectance"] = Spectrum( wavelengths, sample_values[group] )
+        new_sample["num_readings"] = int( counts[group] )
+        new_sample["outliers"] = group_readings[outliers[group_readings]].tolist()
 
-            new_sample = dict( samples[sample][0] )
-            new_sample["reflectance"] = averaged_spectrum
-        else:
-            new_sample = dict( samples[sample] )
-            
         averaged_samples[new_sample["name"]] = new_sample
 
     return averaged_samples
 
 
+def same_sample( sample, other ):
+    if sample is other:
+        return True
+    if sample is None or other is None:
+        return False
+
+    return ( sample["type"] == other["type"] and sample.get( "components" ) == other.get( "components" ) and
+             np.array_equal( sample["reflectance"].wavelengths, other["reflectance"].wavelengths ) and
+             np.array_equal( sample["reflectance"].values, other["reflectance"].values ) )
+
+
+def combine_hashes( hashes ):
+    digest = hashlib.sha1()
+    for paint_hash in hashes:
+        digest.update( paint_hash.encode( "utf-8" ) )
+    return digest.hexdigest()
+
+
+# bumped whenever export_arrays writes something new, so stale files from older versions aren't picked up
+MAPPED_LIBRARY_VERSION = 2
+
+# get_mapped_library's files live here, next to the GUI's recipe store; a library nobody asked for in MAPPED_LIBRARY_MAX_AGE
+# seconds (older versions, libraries before a hot reload, ...) is deleted whenever a new one gets exported
+MAPPED_LIBRARY_DIRECTORY = os.path.join( os.path.expanduser( "~" ), ".paintmixing", "libraries" )
+MAPPED_LIBRARY_MAX_AGE = 24 * 60 * 60
+
+
+def replace_atomically( path, write, binary = False ):
+    # write( file ) goes to a temporary file of its own next to path, which then replaces path in one step, so readers
+    # only ever see complete files, and processes writing the same path at the same time don't clobber each other
+    directory, name = os.path.split( os.path.abspath( path ) )
+    handle, temporary_path = tempfile.mkstemp( prefix = name + ".", suffix = ".tmp", dir = directory )
+    try:
+        with os.fdopen( handle, "wb" if binary else "w" ) as temporary_file:
+            write( temporary_file )
+        os.replace( temporary_path, path )
+    except BaseException:
+        try:
+            os.unlink( temporary_path )
+        except OSError:
+            pass
+        raise
+
+
+def prune_mapped_libraries( directory, keep_path, max_age = None ):
+    # deletes the exported libraries in directory whose header wasn't touched (by get_mapped_library) in max_age seconds;
+    # processes that still have one mapped keep their mapping, only the name goes away (where the OS allows it)
+    oldest = time.time() - ( MAPPED_LIBRARY_MAX_AGE if max_age is None else max_age )
+    for header_path in glob.glob( os.path.join( directory, "paintmixing-v*.npy.json" ) ):
+        path = header_path[:-len( ".json" )]
+        if os.path.abspath( path ) == os.path.abspath( keep_path ):
+            continue
+
+        try:
+            if os.path.getmtime( header_path ) < oldest:
+                # the header goes first, without it the arrays don't count as exported
+                os.remove( header_path )
+                os.remove( path )
+        except OSError:
+            pass
+
 
 class PaintDatabase:
     def __init__( self, measurement_files ):
         self.colorimetry = Colorimetry()
         
-        self.measurments = {}
+        # later files override same named samples of the earlier ones
+        self.file_measurments = OrderedDict()
         for file_path in measurement_files:
-            self.measurments = { **self.measurments, **load_measurments( file_path ) }
+            self.file_measurments[file_path] = load_measurments( file_path )
+        self.measurments = self.merge_measurments()
     
         self.mixing_model = TwoDiffuseFluxesModel()
         self.mixing_model.init_paints( self.measurments, "white" )
 
         self.masstones = [ k for k in self.measurments.keys() if self.measurments[k]["type"] == "masstone" ]
 
+        self.parameters_hash = None
+        self.paint_hashes = {}
+        self.colorimetry_cache = {}
+
+    def merge_measurments( self ):
+        return PaintDatabase.merge_file_measurments( self.file_measurments )
+
+    def merge_file_measurments( file_measurments ):
+        measurments = {}
+        for measurments_of_file in file_measurments.values():
+            measurments = { **measurments, **measurments_of_file }
+        return measurments
+
+    def add_measurement_file( self, file_path ):
+        # adds a file, or reloads one that's already in; returns the names of the paints that had to be refitted
+        return self.update_measurement_files( { file_path : load_measurments( file_path ) } )
+
+    def remove_measurement_file( self, file_path ):
+        return self.update_measurement_files( {}, [ file_path ] )
+
+    def update_measurement_files( self, loaded_files, removed_files = () ):
+        # loaded_files is { file path : load_measurments( file path ) }; only the paints fitted from samples that
+        # actually changed get refitted, the rest (and everything cached for them, eg. get_hash( paints )) stay;
+        # a change that leaves a library that can't be fitted (no white, a failing fit) raises ValueError and
+        # leaves the database as it was
+        file_measurments = OrderedDict( ( file_path, measurments ) for file_path, measurments in self.file_measurments.items() if file_path not in removed_files )
+        file_measurments.update( loaded_files )
+        measurments = PaintDatabase.merge_file_measurments( file_measurments )
+
+        changed_samples = [ name for name in self.measurments.keys() | measurments.keys() if not same_sample( self.measurments.get( name ), measurments.get( name ) ) ]
+        if len( changed_samples ) == 0:
+            self.file_measurments = file_measurments
+            return set()
+
+        if "white" not in measurments:
+            raise ValueError( "the library would have no white left, the change is not applied" )
+
+        paint_parameters = dict( self.mixing_model.paint_parameters )
+        parameter_arrays_cache = self.mixing_model.parameter_arrays_cache
+        try:
+            refitted = self.mixing_model.update_K_S( measurments, "white", changed_samples )
+            for name in refitted:
+                if name in self.mixing_model.paint_parameters and not all( np.isfinite( self.mixing_model.paint_parameters[name][key].values ).all() for key in ( "K", "S" ) ):
+                    raise ValueError( "fitting {} gave non-finite K or S".format( name ) )
+        except Exception as error:
+            self.mixing_model.paint_parameters = paint_parameters
+            self.mixing_model.parameter_arrays_cache = parameter_arrays_cache
+            raise ValueError( "the library can't be fitted ({}: {}), the change is not applied".format( type( error ).__name__, error ) ) from error
+
+        self.file_measurments = file_measurments
+        self.measurments = measurments
+        self.masstones = [ k for k in self.measurments.keys() if self.measurments[k]["type"] == "masstone" ]
+        self.parameters_hash = None
+        for name in refitted:
+            self.paint_hashes.pop( name, None )
+        for name in changed_samples:
+            self.colorimetry_cache.pop( name, None )
+
+        return refitted
 
     def get_base_paints( self ):
         return self.masstones
@@ -432,3 +2325,262 @@ class PaintDatabase:
     def get_mixing_model( self ):
         return self.mixing_model
         
+
+    def get_colorimetry( self, name ):
+        # { "xyz", "xy", "Lab", "rgb", "swatch" } of a sample's reflectance under D65 (rgb is 0-1 sRGB, swatch the same
+        # as 0-255 ints); the first request computes every sample in one batched pass, and changed samples are recomputed
+        colorimetry = self.colorimetry_cache.get( name )
+
+        if colorimetry is None:
+            self.compute_colorimetry( [ sample_name for sample_name in self.measurments.keys() if sample_name not in self.colorimetry_cache ] )
+            colorimetry = self.colorimetry_cache[name]
+
+        return colorimetry
+
+    def compute_colorimetry( self, names ):
+        # one batch per wavelength grid (samples from the same file share theirs)
+        grids = {}
+        for name in names:
+            grids.setdefault( self.measurments[name]["reflectance"].wavelengths.tobytes(), [] ).append( name )
+
+        for grid_names in grids.values():
+            wavelengths = self.measurments[grid_names[0]]["reflectance"].wavelengths
+            reflectances = np.stack( [ self.measurments[name]["reflectance"].values for name in grid_names ] )
+
+            xyz = Colorimetry.reflectances_to_xyz( reflectances, wavelengths )[:, 0, :]
+            xy = xyz[:, :2] / np.maximum( xyz.sum( -1, keepdims = True ), 1e-12 )
+            lab = Colorimetry.reflectances_to_Lab( reflectances, wavelengths )[:, 0, :]
+            rgb = Colorimetry.xyz_to_rgb_saturated( xyz )
+            swatch = ( rgb * 255 ).astype( int )
+
+            for i, name in enumerate( grid_names ):
+                self.colorimetry_cache[name] = { "xyz" : xyz[i], "xy" : xy[i], "Lab" : lab[i], "rgb" : rgb[i], "swatch" : tuple( int( component ) for component in swatch[i] ) }
+
+    def get_paint_hash( self, name ):
+        paint_hash = self.paint_hashes.get( name )
+
+        if paint_hash is None:
+            digest = hashlib.sha1()
+            digest.update( name.encode( "utf-8" ) )
+            for term in ( "K", "S" ):
+                digest.update( np.ascontiguousarray( self.mixing_model.paint_parameters[name][term].wavelengths, dtype = np.float64 ).tobytes() )
+                digest.update( np.ascontiguousarray( self.mixing_model.paint_parameters[name][term].values, dtype = np.float64 ).tobytes() )
+
+            paint_hash = digest.hexdigest()
+            self.paint_hashes[name] = paint_hash
+
+        return paint_hash
+
+    def get_hash( self, paints = None ):
+        # identifies the fitted K/S parameters, so solved recipes can be tied to the library they came from;
+        # for a list of paints, only their parameters, so results for them outlive changes to the other paints
+        if paints is not None:
+            return combine_hashes( self.get_paint_hash( name ) for name in sorted( set( paints ) ) )
+
+        if self.parameters_hash is None:
+            self.parameters_hash = combine_hashes( self.get_paint_hash( name ) for name in sorted( self.mixing_model.paint_parameters.keys() ) )
+
+        return self.parameters_hash
+
+    def export_arrays( self, path ):
+        # fitted K and S of the base paints as one ( 2, N, λ ) .npy file plus a .json header with the names and the grid,
+        # for MappedPaintLibrary; the header is written last, so its presence means the file is complete
+        names = list( self.get_base_paints() )
+        wavelengths, K, S = self.mixing_model.get_parameter_arrays( names )
+
+        header = { "names" : names, "wavelengths" : wavelengths.tolist(), "hash" : self.get_hash(),
+                   "paint_hashes" : { name : self.get_paint_hash( name ) for name in names },
+                   "colorimetry" : { name : { key : np.asarray( value ).tolist() for key, value in self.get_colorimetry( name ).items() } for name in names } }
+
+        replace_atomically( path, lambda array_file: np.save( array_file, np.stack( [ K, S ] ) ), binary = True )
+        replace_atomically( path + ".json", lambda header_file: json.dump( header, header_file ) )
+
+    def get_mapped_library( self, directory = None ):
+        # read-only, memory-mapped copy of the fitted library, shared by every process that opens it; the header's
+        # modification time is when it was last asked for, for prune_mapped_libraries
+        directory = directory if directory else MAPPED_LIBRARY_DIRECTORY
+        os.makedirs( directory, exist_ok = True )
+
+        path = os.path.join( directory, "paintmixing-v{}-{}.npy".format( MAPPED_LIBRARY_VERSION, self.get_hash() ) )
+        try:
+            os.utime( path + ".json" )
+        except FileNotFoundError:
+            self.export_arrays( path )
+            prune_mapped_libraries( directory, path )
+
+        return MappedPaintLibrary( path )
+
+
+class PaintDatabaseWatcher:
+    # hot reload: watches the database's measurement files (and *.json files showing up in the given directories)
+    # by their modification times and applies whatever changed through update_measurement_files; poll() can be
+    # driven from a GUI timer, start() polls on a thread of its own (then on_change runs on that thread too);
+    # on_error( message ) hears about changes that couldn't be applied (they're logged when there's no on_error)
+    def __init__( self, paint_database, directories = (), interval = 1.0, on_change = None, on_error = None ):
+        self.paint_database = paint_database
+        self.directories = list( directories )
+        self.interval = interval
+        self.on_change = on_change
+        self.on_error = on_error
+
+        self.stamps = self.scan()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def scan( self ):
+        # { file path : ( modification time, size ) } of everything that's watched and exists
+        paths = set( self.paint_database.file_measurments.keys() )
+        for directory in self.directories:
+            paths.update( glob.glob( os.path.join( directory, "*.json" ) ) )
+
+        stamps = {}
+        for path in paths:
+            try:
+                status = os.stat( path )
+                stamps[path] = ( status.st_mtime_ns, status.st_size )
+            except OSError:
+                pass
+        return stamps
+
+    def poll( self ):
+        # returns the names of the refitted paints (empty when nothing changed)
+        stamps = self.scan()
+
+        loaded_files = {}
+        for path, stamp in stamps.items():
+            if self.stamps.get( path ) != stamp:
+                try:
+                    loaded_files[path] = load_measurments( path )
+                except ( OSError, ValueError, TypeError, KeyError ):
+                    # not a measurement file, or one that's still being written; it's read again once it changes
+                    pass
+        removed_files = [ path for path in self.stamps if path not in stamps ]
+
+        self.stamps = stamps
+        if len( loaded_files ) == 0 and len( removed_files ) == 0:
+            return set()
+
+        try:
+            refitted = self.paint_database.update_measurement_files( loaded_files, removed_files )
+        except ValueError as error:
+            # the database keeps what it had; the files are picked up again once they change
+            self.report_error( "library not reloaded: {}".format( error ) )
+            return set()
+        if refitted and self.on_change:
+            self.on_change( refitted )
+        return refitted
+
+    def report_error( self, message ):
+        if self.on_error:
+            self.on_error( message )
+        else:
+            logging.getLogger( __name__ ).warning( message )
+
+    def start( self ):
+        self.thread = threading.Thread( target = self.run, daemon = True )
+        self.thread.start()
+        return self
+
+    def stop( self ):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def run( self ):
+        while not self.stop_event.wait( self.interval ):
+            try:
+                self.poll()
+            except Exception as error:
+                # eg. on_change failing; one bad poll mustn't stop the reloading for good
+                self.report_error( "library watcher: {}: {}".format( type( error ).__name__, error ) )
+
+
+class MappedPigmentModel:
+    # read-only stand-in for a fitted TwoDiffuseFluxesModel, backed by a file written by PaintDatabase.export_arrays;
+    # it pickles as just the path and each process maps the file once, so a pool of any size shares one copy of
+    # the K and S arrays, and workers don't have to unpickle the measurements
+    opened_files = {}
+
+    def open( path ):
+        opened = MappedPigmentModel.opened_files.get( path )
+
+        if opened is None:
+            with open( path + ".json", "r" ) as header_file:
+                header = json.load( header_file )
+            opened = ( header, np.load( path, mmap_mode = "r" ) )
+            MappedPigmentModel.opened_files[path] = opened
+
+        return opened
+
+    def __init__( self, path ):
+        self.path = path
+        self.header, self.arrays = MappedPigmentModel.open( path )
+        self.wavelengths = np.array( self.header["wavelengths"] )
+        self.indices = { name : i for i, name in enumerate( self.header["names"] ) }
+        self.parameter_arrays_cache = {}
+
+    def __getstate__( self ):
+        return { "path" : self.path }
+
+    def __setstate__( self, state ):
+        self.__init__( state["path"] )
+
+    def get_parameter_arrays( self, names ):
+        # same as TwoDiffuseFluxesModel.get_parameter_arrays; a contiguous run of paints (eg. all of them) is a view of the mapping
+        names = tuple( names )
+        arrays = self.parameter_arrays_cache.get( names )
+
+        if arrays is None:
+            indices = np.array( [ self.indices[name] for name in names ], dtype = np.int64 )
+
+            if len( indices ) > 0 and np.array_equal( indices, np.arange( indices[0], indices[0] + len( indices ) ) ):
+                K, S = self.arrays[0, indices[0]:indices[0] + len( indices )], self.arrays[1, indices[0]:indices[0] + len( indices )]
+            else:
+                K, S = self.arrays[0, indices], self.arrays[1, indices]
+
+            arrays = ( self.wavelengths, K, S )
+            self.parameter_arrays_cache[names] = arrays
+
+        return arrays
+
+    def mix( self, components ):
+        _, K, S = self.get_parameter_arrays( [ component["name"] for component, _ in components ] )
+        weights = np.array( [ weight for _, weight in components ], dtype = float )
+        return Spectrum( self.wavelengths, TwoDiffuseFluxesModel.mix_arrays( K, S, weights ) )
+
+
+class MappedPaintLibrary:
+    # the part of the PaintDatabase interface the solvers use (solve_recipes, RecipeOptimizer, ...), over a MappedPigmentModel
+    def __init__( self, path ):
+        self.mixing_model = MappedPigmentModel( path )
+        self.paints = { name : { "name" : name, "type" : "masstone" } for name in self.mixing_model.header["names"] }
+
+    def get_base_paints( self ):
+        return self.mixing_model.header["names"]
+
+    def get_paint( self, name ):
+        return self.paints[name]
+
+    def get_all_paints( self ):
+        return self.paints
+
+    def get_mixing_model( self ):
+        return self.mixing_model
+
+    def get_colorimetry( self, name ):
+        colorimetry = self.mixing_model.header["colorimetry"][name]
+        return { key : tuple( value ) if key == "swatch" else np.array( value ) for key, value in colorimetry.items() }
+
+    def get_hash( self, paints = None ):
+        if paints is not None:
+            return combine_hashes( self.mixing_model.header["paint_hashes"][name] for name in sorted( set( paints ) ) )
+        return self.mixing_model.header["hash"]
+
+
+if __name__ == '__main__':
+    # python -m PaintMixing ...; the command line lives in PaintMixingCLI, which imports this module under its
+    # own name, so the workers unpickle the same classes the rest of the tools use
+    import PaintMixingCLI
+
+    multiprocessing.freeze_support()
+    PaintMixingCLI.main( sys.argv[1:] )
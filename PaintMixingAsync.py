@@ -0,0 +1,100 @@
+import os
+import heapq
+import asyncio
+import PaintMixing
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+
+# asyncio front end for the solver: any number of concurrent solves share a single executor;
+# combinations are submitted in chunks through a shared pool of slots, which gives backpressure
+# (at most max_in_flight chunks queued in the executor) and, since asyncio hands out freed slots
+# in FIFO order, interleaves the chunks of concurrent targets fairly
+
+DEFAULT_CHUNK_SIZE = 16
+
+
+def optimize_chunk( optimizer, paint_combinations ):
+    return [ optimizer( paint_set ) for paint_set in paint_combinations ]
+
+
+def release_slot( loop, slots ):
+    # done callback of a chunk's executor future: it runs on the executor's side once the chunk has really finished,
+    # or was cancelled before it started - a chunk that's already running keeps its slot until it's done
+    try:
+        loop.call_soon_threadsafe( slots.release )
+    except RuntimeError:
+        # the loop is closed, its slots went with it
+        pass
+
+
+class AsyncRecipeSolver:
+    def __init__( self, paint_database, executor = None, max_workers = None, max_in_flight = None, chunk_size = DEFAULT_CHUNK_SIZE ):
+        self.paint_database = paint_database
+        self.library = paint_database.get_mapped_library()
+        self.chunk_size = chunk_size
+
+        max_workers = max_workers if max_workers else min( 61, os.cpu_count() )
+
+        self.owns_executor = executor is None
+        self.executor = executor if executor else ProcessPoolExecutor( max_workers )
+        self.max_in_flight = max_in_flight if max_in_flight else 2 * max_workers
+
+        self.slots = None
+        self.slots_loop = None
+
+    async def __aenter__( self ):
+        return self
+
+    async def __aexit__( self, exc_type, exc_value, traceback ):
+        self.close()
+
+    def close( self ):
+        if self.owns_executor:
+            self.executor.shutdown( wait = False, cancel_futures = True )
+
+    def get_slots( self ):
+        # asyncio primitives belong to a loop, so make a fresh set if we're being driven from a new one
+        loop = asyncio.get_running_loop()
+        if self.slots_loop is not loop:
+            self.slots = asyncio.Semaphore( self.max_in_flight )
+            self.slots_loop = loop
+        return self.slots
+
+    async def solve_progressive( self, target_rgb, paints_to_use, max_num_paints = 4, num_best = 3, illuminants = None, illuminant_error = "mean" ):
+        # async counterpart of PaintMixing.solve_recipes: yields ( num_paints, best recipes ) per recipe size;
+        # cancelling the consuming task cancels every chunk of this solve that hasn't started yet, the ones already
+        # running hold on to their slots until they finish
+        loop = asyncio.get_running_loop()
+        slots = self.get_slots()
+        optimizer = PaintMixing.RecipeOptimizer( self.library.get_all_paints(), target_rgb, self.library.get_mixing_model(), illuminants, illuminant_error )
+
+        for num_paints in range( 1, max_num_paints + 1 ):
+            paint_combinations = list( combinations( paints_to_use, num_paints ) )
+            chunks = [ paint_combinations[i:i + self.chunk_size] for i in range( 0, len( paint_combinations ), self.chunk_size ) ]
+
+            futures = []
+            try:
+                for chunk in chunks:
+                    await slots.acquire()
+                    try:
+                        executor_future = self.executor.submit( optimize_chunk, optimizer, chunk )
+                    except BaseException:
+                        slots.release()
+                        raise
+                    executor_future.add_done_callback( lambda _: release_slot( loop, slots ) )
+                    futures.append( asyncio.wrap_future( executor_future, loop = loop ) )
+
+                chunk_results = await asyncio.gather( *futures )
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+            results = [ result for chunk_result in chunk_results for result in chunk_result ]
+            yield num_paints, heapq.nsmallest( num_best, results, key = lambda result: result[1] )
+
+    async def solve( self, target_rgb, paints_to_use, max_num_paints = 4, num_best = 3, illuminants = None, illuminant_error = "mean" ):
+        return [ result async for result in self.solve_progressive( target_rgb, paints_to_use, max_num_paints, num_best, illuminants, illuminant_error ) ]
+
+    async def solve_many( self, targets_rgb, paints_to_use, max_num_paints = 4, num_best = 3, illuminants = None, illuminant_error = "mean" ):
+        return await asyncio.gather( *[ self.solve( target_rgb, paints_to_use, max_num_paints, num_best, illuminants, illuminant_error ) for target_rgb in targets_rgb ] )
@@ -0,0 +1,659 @@
+import os
+import sys
+import math
+import time
+import copy
+import json
+import pickle
+import heapq
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+import numpy as np
+import scipy.optimize
+import PaintMixing
+from itertools import combinations
+from multiprocessing import Pool
+
+# reports used to tune the solver on the bundled (or any other) data:
+#   python PaintMixingBenchmarks.py prescreen --top-m 10 25 50 100
+#   python PaintMixingBenchmarks.py sparse --library-sizes 13 50 100 200
+#   python PaintMixingBenchmarks.py spectral
+#   python PaintMixingBenchmarks.py evaluator
+#   python PaintMixingBenchmarks.py memory --library-sizes 1000 --processes 16
+#   python PaintMixingBenchmarks.py gamut
+#   python PaintMixingBenchmarks.py executor --processes 8
+#   python PaintMixingBenchmarks.py loading --readings 1000 20000 100000
+#   python PaintMixingBenchmarks.py nudge
+#   python PaintMixingBenchmarks.py simplex --max-paints 3 --illuminants D65 A
+#   python PaintMixingBenchmarks.py clusters --variants 3 --max-paints 3
+#   python PaintMixingBenchmarks.py resolution
+#   python PaintMixingBenchmarks.py palette --library-sizes 13 100
+
+DEFAULT_TARGETS = [ "#8040a0", "#c8a070", "#3c6e46", "#d2343c", "#e6d2aa", "#283c78", "#965a32", "#a0b4be" ]
+
+
+def parse_color( text ):
+    text = text.lstrip( "#" )
+    return np.array( [ int( text[i:i + 2], 16 ) for i in ( 0, 2, 4 ) ] ) / 255.0
+
+
+def synthetic_library( paint_database, num_paints, seed = 0 ):
+    # bigger library for scaling tests: extra "pigments" are random two paint blends of the measured ones
+    # (a blend's K and S are as valid pigment parameters as any), so the colour space stays realistic
+    library = copy.deepcopy( paint_database )
+    mixing_model = library.get_mixing_model()
+    base_paints = list( library.get_base_paints() )
+    wavelengths, K, S = mixing_model.get_parameter_arrays( base_paints )
+
+    rng = np.random.default_rng( seed )
+    while len( library.masstones ) < num_paints:
+        a, b = rng.choice( len( base_paints ), 2, replace = False )
+        t = rng.uniform( 0.2, 0.8 )
+        name = "{}+{} ({:.2f})".format( base_paints[a], base_paints[b], t )
+
+        blended_K = t * K[a] + ( 1.0 - t ) * K[b]
+        blended_S = t * S[a] + ( 1.0 - t ) * S[b]
+
+        mixing_model.paint_parameters[name] = { "K" : PaintMixing.Spectrum( wavelengths, blended_K ), "S" : PaintMixing.Spectrum( wavelengths, blended_S ) }
+        library.measurments[name] = { "name" : name, "type" : "masstone", "reflectance" : PaintMixing.Spectrum( wavelengths, PaintMixing.TwoDiffuseFluxesModel.reflectance_from_K_S( blended_K, blended_S ) ) }
+        library.masstones.append( name )
+
+    mixing_model.parameter_arrays_cache = {}
+    library.parameters_hash = None
+    return library
+
+
+def brand_variants( paint_database, num_variants, spread = 0.03, seed = 0 ):
+    # multi-brand library: every measured paint comes in num_variants versions, each with a slightly different
+    # K/S spectrum (a random tilt of log K/S, about spread) and tinting strength (K and S both scaled)
+    library = copy.deepcopy( paint_database )
+    mixing_model = library.get_mixing_model()
+    base_paints = list( library.get_base_paints() )
+    wavelengths, K, S = mixing_model.get_parameter_arrays( base_paints )
+    x = np.linspace( -1.0, 1.0, len( wavelengths ) )
+
+    rng = np.random.default_rng( seed )
+    for paint, paint_K, paint_S in zip( base_paints, K, S ):
+        for variant in range( 1, num_variants ):
+            name = "{} ({})".format( paint, variant + 1 )
+            tilt = np.exp( rng.normal( 0.0, spread ) + rng.normal( 0.0, spread ) * x )
+            strength = np.exp( rng.normal( 0.0, 0.3 ) )
+
+            variant_K = paint_K * tilt * strength
+            variant_S = paint_S * strength
+
+            mixing_model.paint_parameters[name] = { "K" : PaintMixing.Spectrum( wavelengths, variant_K ), "S" : PaintMixing.Spectrum( wavelengths, variant_S ) }
+            library.measurments[name] = { "name" : name, "type" : "masstone", "reflectance" : PaintMixing.Spectrum( wavelengths, PaintMixing.TwoDiffuseFluxesModel.reflectance_from_K_S( variant_K, variant_S ) ) }
+            library.masstones.append( name )
+
+    mixing_model.parameter_arrays_cache = {}
+    library.parameters_hash = None
+    return library
+
+
+def report_prescreen_recall( paint_database, targets_rgb, top_m_values, max_num_paints = 4, num_best = 3, map_function = map ):
+    # for every target and recipe size: how many of the exhaustive search's best recipes survive the prescreen
+    # at a given top_m, and how much worse the best surviving recipe is than the exhaustive best
+    paints = paint_database.get_base_paints()
+    rows = []
+
+    for target_rgb in targets_rgb:
+        optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), target_rgb, paint_database.get_mixing_model() )
+
+        prescreen_time = time.perf_counter()
+        prescreener = PaintMixing.RecipePrescreener( optimizer, paints )
+        ranked = { num_paints : prescreener.best_combinations( num_paints, max( top_m_values ) ) for num_paints in range( 1, max_num_paints + 1 ) }
+        prescreen_time = time.perf_counter() - prescreen_time
+
+        for num_paints in range( 1, max_num_paints + 1 ):
+            exhaustive = list( map_function( optimizer, list( combinations( paints, num_paints ) ) ) )
+            best = heapq.nsmallest( num_best, exhaustive, key = lambda result: result[1] )
+            best_sets = set( result[2] for result in best )
+
+            for top_m in top_m_values:
+                kept = set( ranked[num_paints][:top_m] )
+                best_kept_error = min( result[1] for result in exhaustive if result[2] in kept )
+
+                rows.append( { "target" : target_rgb, "num_paints" : num_paints, "top_m" : top_m,
+                               "recall" : len( best_sets & kept ) / len( best_sets ),
+                               "found_best" : best[0][2] in kept,
+                               "error_increase" : best_kept_error - best[0][1],
+                               "prescreen_time" : prescreen_time } )
+
+    print( "{:>10} {:>6} {:>10} {:>12} {:>16}".format( "num paints", "top m", "recall@{}".format( num_best ), "found best", "mean error incr." ) )
+    for num_paints in range( 1, max_num_paints + 1 ):
+        for top_m in top_m_values:
+            selected = [ row for row in rows if row["num_paints"] == num_paints and row["top_m"] == top_m ]
+            print( "{:>10} {:>6} {:>10.3f} {:>12.3f} {:>16.6f}".format( num_paints, top_m,
+                                                                        np.mean( [ row["recall"] for row in selected ] ),
+                                                                        np.mean( [ row["found_best"] for row in selected ] ),
+                                                                        np.mean( [ row["error_increase"] for row in selected ] ) ) )
+    print( "prescreen time per target: {:.3f}s".format( np.mean( [ row["prescreen_time"] for row in rows ] ) ) )
+
+    return rows
+
+
+def report_sparse_search( paint_database, targets_rgb, library_sizes, max_num_paints = 4, beam_width = 8, map_function = map ):
+    # quality of the sparse search against the exhaustive one on the real library, then how its cost grows with the library
+    paints = paint_database.get_base_paints()
+
+    print( "{:>8} {:>10} {:>16} {:>16} {:>12} {:>12}".format( "target", "num paints", "exhaustive error", "sparse error", "exh. time", "sparse time" ) )
+    for target_rgb in targets_rgb:
+        exhaustive_time = time.perf_counter()
+        exhaustive = list( PaintMixing.solve_recipes( target_rgb, paint_database, paints, max_num_paints, 1, map_function ) )
+        exhaustive_time = time.perf_counter() - exhaustive_time
+
+        sparse_time = time.perf_counter()
+        sparse = list( PaintMixing.solve_recipes( target_rgb, paint_database, paints, max_num_paints, 1, map_function, search = "sparse", beam_width = beam_width ) )
+        sparse_time = time.perf_counter() - sparse_time
+
+        for ( num_paints, exhaustive_best ), ( _, sparse_best ) in zip( exhaustive, sparse ):
+            print( "{:>8} {:>10} {:>16.6f} {:>16.6f} {:>12} {:>12}".format( "#{:02x}{:02x}{:02x}".format( *( np.round( target_rgb * 255 ).astype( int ) ) ), num_paints,
+                                                                          exhaustive_best[0][1], sparse_best[0][1],
+                                                                          "{:.2f}s".format( exhaustive_time ) if num_paints == max_num_paints else "",
+                                                                          "{:.2f}s".format( sparse_time ) if num_paints == max_num_paints else "" ) )
+
+    print()
+    print( "{:>12} {:>16} {:>16} {:>16}".format( "library size", "all combinations", "sparse evaluated", "sparse search" ) )
+    for library_size in library_sizes:
+        library = synthetic_library( paint_database, library_size )
+        library_paints = library.get_base_paints()
+        optimizer = PaintMixing.RecipeOptimizer( library.get_all_paints(), targets_rgb[0], library.get_mixing_model() )
+
+        search_time = time.perf_counter()
+        solver = PaintMixing.SparseRecipeSolver( optimizer, library_paints, beam_width )
+        solver.candidate_combinations( max_num_paints )
+        search_time = time.perf_counter() - search_time
+
+        num_combinations = sum( math.comb( len( library_paints ), k ) for k in range( 1, max_num_paints + 1 ) )
+        print( "{:>12} {:>16} {:>16} {:>15.3f}s".format( len( library_paints ), num_combinations, solver.num_evaluated, search_time ) )
+
+
+def report_spectral_targets( paint_database, max_num_paints = 4, map_function = map ):
+    # the measured mixes as targets: spectral solve against the RGB solve of the same colour,
+    # timing and how well the best recipe holds up under daylight and under incandescent light
+    paints = paint_database.get_base_paints()
+    mixing_model = paint_database.get_mixing_model()
+    all_paints = paint_database.get_all_paints()
+    illuminants = ( "D65", "A" )
+
+    def delta_e( recipe, target_R, wavelengths ):
+        _, _, paint_set, weights = recipe
+        _, K, S = mixing_model.get_parameter_arrays( list( paint_set ) )
+        mixed_R = PaintMixing.TwoDiffuseFluxesModel.mix_arrays( K, S, weights )
+        difference = PaintMixing.Colorimetry.reflectances_to_Lab( mixed_R, wavelengths, illuminants ) - PaintMixing.Colorimetry.reflectances_to_Lab( target_R, wavelengths, illuminants )
+        return np.sqrt( ( difference * difference ).sum( -1 ) )
+
+    print( "{:>36} {:>12} {:>12} {:>12} {:>12} {:>12} {:>12}".format( "target", "rgb time", "rgb dE D65", "rgb dE A", "spec. time", "spec. dE D65", "spec. dE A" ) )
+    for name in [ name for name in all_paints if all_paints[name]["type"] != "masstone" ]:
+        target_spectrum = all_paints[name]["reflectance"]
+        wavelengths, _, _ = mixing_model.get_parameter_arrays( paints )
+        target_R = target_spectrum.resample( wavelengths ).values
+
+        spectral_time = time.perf_counter()
+        spectral = list( PaintMixing.solve_spectral_recipes( target_spectrum, paint_database, paints, max_num_paints, 1 ) )
+        spectral_time = time.perf_counter() - spectral_time
+
+        rgb_time = time.perf_counter()
+        rgb = list( PaintMixing.solve_recipes( np.array( PaintMixing.Colorimetry.reflectance_to_rgb( target_spectrum ) ), paint_database, paints, max_num_paints, 1, map_function ) )
+        rgb_time = time.perf_counter() - rgb_time
+
+        spectral_best = min( ( best[0] for _, best in spectral ), key = lambda recipe: recipe[1] )
+        rgb_best = min( ( best[0] for _, best in rgb ), key = lambda recipe: recipe[1] )
+
+        print( "{:>36} {:>11.2f}s {:>12.2f} {:>12.2f} {:>11.3f}s {:>12.2f} {:>12.2f}".format( name, rgb_time, *delta_e( rgb_best, target_R, wavelengths ),
+                                                                                             spectral_time, *delta_e( spectral_best, target_R, wavelengths ) ) )
+
+
+def report_evaluator_allocations( paint_database, targets_rgb, num_evaluations = 2000 ):
+    # the optimizer's inner loop: time and memory traffic of one objective evaluation, the generic
+    # mix + reflectance_to_rgb path against the preallocated MixEvaluator (which gives the gradient too)
+    paints = paint_database.get_base_paints()
+    paint_set = tuple( paints[:3] )
+    weights = np.array( [ 0.5, 0.3, 0.2 ] )
+
+    def measure( evaluate ):
+        # warm up first, so only the steady state is measured
+        for i in range( 10 ):
+            evaluate()
+
+        start_time = time.perf_counter()
+        for i in range( num_evaluations ):
+            evaluate()
+        elapsed = ( time.perf_counter() - start_time ) / num_evaluations
+
+        tracemalloc.start()
+        start_memory, _ = tracemalloc.get_traced_memory()
+        for i in range( num_evaluations ):
+            evaluate()
+        end_memory, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return elapsed, ( end_memory - start_memory ) / num_evaluations, peak_memory - start_memory
+
+    print( "{:>14} {:>10} {:>14} {:>18} {:>16}".format( "objective", "path", "time / eval", "net bytes / eval", "peak bytes" ) )
+    for illuminants in ( None, ( "D65", "A", "F11" ) ):
+        optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), targets_rgb[0], paint_database.get_mixing_model(), illuminants )
+        evaluator = PaintMixing.MixEvaluator( optimizer, paint_set )
+
+        for path, evaluate in ( ( "generic", lambda: optimizer.mix_error( optimizer.mix_current_set( paint_set, weights ) ) ),
+                                ( "evaluator", lambda: evaluator.evaluate( weights ) ) ):
+            elapsed, net_bytes, peak_bytes = measure( evaluate )
+            print( "{:>14} {:>10} {:>12.1f}us {:>18.1f} {:>16}".format( "srgb" if illuminants is None else "lab x{}".format( len( illuminants ) ), path, elapsed * 1e6, net_bytes, peak_bytes ) )
+
+
+def worker_footprint( optimizer, paint_sets ):
+    # runs in a pool worker: optimize a few recipes, then report the worker's proportional set size
+    # (shared pages, like a memory-mapped library, count 1/N for each of the N processes mapping them)
+    for paint_set in paint_sets:
+        optimizer( paint_set )
+
+    try:
+        with open( "/proc/self/smaps_rollup", "r" ) as smaps:
+            pss = next( int( line.split()[1] ) for line in smaps if line.startswith( "Pss:" ) )
+    except OSError:
+        pss = None
+
+    return os.getpid(), pss
+
+
+def report_worker_memory( paint_database, targets_rgb, library_size, processes ):
+    # a fresh (spawned, as on Windows) pool solving from the database vs from its memory-mapped export
+    library = synthetic_library( paint_database, library_size )
+    paints = library.get_base_paints()
+    paint_sets = list( combinations( paints[:6], 2 ) )[:4]
+
+    print( "{:>10} {:>16} {:>16} {:>18} {:>18}".format( "source", "pickled size", "unpickle time", "mean worker PSS", "total worker PSS" ) )
+    for source, solver_library in ( ( "database", library ), ( "mapped", library.get_mapped_library() ) ):
+        optimizer = PaintMixing.RecipeOptimizer( solver_library.get_all_paints(), targets_rgb[0], solver_library.get_mixing_model() )
+
+        pickled = pickle.dumps( optimizer )
+        unpickle_time = time.perf_counter()
+        pickle.loads( pickled )
+        unpickle_time = time.perf_counter() - unpickle_time
+
+        with multiprocessing.get_context( "spawn" ).Pool( processes ) as p:
+            footprints = dict( p.starmap( worker_footprint, [ ( optimizer, paint_sets ) ] * ( 2 * processes ), chunksize = 1 ) )
+
+        if None in footprints.values():
+            print( "{:>10} {:>14.1f}kB {:>14.2f}ms {:>18} {:>18}".format( source, len( pickled ) / 1024, unpickle_time * 1000, "n/a", "n/a" ) )
+        else:
+            print( "{:>10} {:>14.1f}kB {:>14.2f}ms {:>16.1f}MB {:>16.1f}MB".format( source, len( pickled ) / 1024, unpickle_time * 1000,
+                                                                                  np.mean( list( footprints.values() ) ) / 1024, sum( footprints.values() ) / 1024 ) )
+
+
+def report_gamut( paint_database, targets_rgb, max_num_paints = 3, map_function = map, num_queries = 1000 ):
+    # gamut build and query cost, and how the distance outside the gamut compares to the best recipe the solver finds
+    # (the hull is an outer approximation, so the distance should be a lower bound of the best recipe's delta E)
+    paints = paint_database.get_base_paints()
+    mixing_model = paint_database.get_mixing_model()
+
+    build_time = time.perf_counter()
+    gamut = PaintMixing.PaintGamut( mixing_model, paints )
+    build_time = time.perf_counter() - build_time
+    print( "gamut of {} paints: {} facets, built in {:.3f}s".format( len( paints ), len( gamut.normals ), build_time ) )
+    print()
+
+    print( "{:>8} {:>12} {:>12} {:>14} {:>10} {:>14}".format( "target", "dE outside", "contains", "nearest", "nearest", "best recipe dE" ) )
+    for target_rgb in targets_rgb:
+        optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), target_rgb, mixing_model )
+
+        contains_time = time.perf_counter()
+        for i in range( num_queries ):
+            gamut.contains( optimizer.target_lab )
+        contains_time = ( time.perf_counter() - contains_time ) / num_queries
+
+        nearest_time = time.perf_counter()
+        for i in range( num_queries ):
+            nearest_lab, distance = gamut.nearest( optimizer.target_lab )
+        nearest_time = ( time.perf_counter() - nearest_time ) / num_queries
+
+        best = min( ( best[0] for _, best in PaintMixing.solve_recipes( target_rgb, paint_database, paints, max_num_paints, 1, map_function, search = "sparse" ) ), key = lambda recipe: recipe[1] )
+        wavelengths, K, S = mixing_model.get_parameter_arrays( list( best[2] ) )
+        best_lab = PaintMixing.Colorimetry.reflectances_to_Lab( PaintMixing.TwoDiffuseFluxesModel.mix_arrays( K, S, best[3] ), wavelengths )[0]
+
+        print( "{:>8} {:>12.2f} {:>10.1f}us {:>12.1f}us {:>10} {:>14.2f}".format( "#{:02x}{:02x}{:02x}".format( *( np.round( target_rgb * 255 ).astype( int ) ) ), distance,
+                                                                               contains_time * 1e6, nearest_time * 1e6,
+                                                                               "#{:02x}{:02x}{:02x}".format( *( np.round( gamut.lab_to_rgb( nearest_lab ) * 255 ).astype( int ) ) ),
+                                                                               np.linalg.norm( best_lab - optimizer.target_lab ) ) )
+
+
+def report_executor( paint_database, targets_rgb, max_num_paints = 4, processes = None ):
+    # a fixed process pool with default chunking against AdaptiveExecutor, per recipe size, and what the executor picked
+    processes = processes if processes else min( 61, os.cpu_count() )
+    library = paint_database.get_mapped_library()
+    paints = library.get_base_paints()
+
+    print( "{:>8} {:>6} {:>12} {:>12} {:>10} {:>8} {:>6} {:>10}".format( "size", "tasks", "pool", "adaptive", "strategy", "workers", "chunk", "ms/task" ) )
+
+    with Pool( processes ) as p, PaintMixing.AdaptiveExecutor( processes ) as executor:
+        # both pools warmed up, so the comparison is about the per call costs
+        p.map( abs, range( processes ) )
+        executor.get_process_pool()
+
+        for num_paints in range( 1, max_num_paints + 1 ):
+            pool_time = 0.0
+            adaptive_time = 0.0
+            for target_rgb in targets_rgb:
+                start = time.perf_counter()
+                pool_best = list( PaintMixing.solve_recipes( target_rgb, library, paints, num_paints, 3, p.map, recipe_sizes = [ num_paints ] ) )
+                pool_time = pool_time + time.perf_counter() - start
+
+                start = time.perf_counter()
+                adaptive_best = list( PaintMixing.solve_recipes( target_rgb, library, paints, num_paints, 3, executor, recipe_sizes = [ num_paints ] ) )
+                adaptive_time = adaptive_time + time.perf_counter() - start
+
+                assert [ recipe[2] for recipe in pool_best[0][1] ] == [ recipe[2] for recipe in adaptive_best[0][1] ]
+
+            run = executor.telemetry[-1]
+            print( "{:>8} {:>6} {:>11.3f}s {:>11.3f}s {:>10} {:>8} {:>6} {:>10.2f}".format( num_paints, run["tasks"], pool_time / len( targets_rgb ), adaptive_time / len( targets_rgb ),
+                                                                                           run["strategy"], run["workers"], run["chunk_size"], run["task_seconds"] * 1000.0 ) )
+
+
+def report_measurement_loading( paint_database, num_readings_values, readings_per_sample = 10, outlier_fraction = 0.05, seed = 0 ):
+    # load time of spectrophotometer sized exports (noisy repeats of the bundled samples), and how many of the
+    # readings that were made bad on purpose (a 5% reflectance offset) the outlier check catches
+    rng = np.random.default_rng( seed )
+    base_samples = [ paint_database.get_paint( name ) for name in paint_database.get_base_paints() ]
+    wavelengths = base_samples[0]["reflectance"].wavelengths
+
+    print( "{:>10} {:>10} {:>10} {:>10} {:>10} {:>12}".format( "readings", "samples", "load", "injected", "caught", "false alarms" ) )
+    for num_readings in num_readings_values:
+        num_samples = max( 1, num_readings // readings_per_sample )
+        sources = rng.integers( len( base_samples ), size = num_samples )
+
+        datasets = [ { "type" : "wavelengths", "values" : wavelengths.tolist() } ]
+        injected = set()
+        for sample_index, source in enumerate( sources ):
+            reflectance = base_samples[source]["reflectance"].resample( wavelengths ).values
+            for reading in range( readings_per_sample ):
+                values = reflectance + rng.normal( 0.0, 0.002, len( wavelengths ) )
+                if rng.random() < outlier_fraction:
+                    values = values + 0.05
+                    injected.add( len( datasets ) - 1 )
+                datasets.append( { "type" : "masstone", "name" : "sample {}".format( sample_index ), "reflectance" : ( values * 100.0 ).tolist() } )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join( directory, "export.json" )
+            with open( path, "w" ) as export_file:
+                json.dump( datasets, export_file )
+
+            start = time.perf_counter()
+            samples = PaintMixing.load_measurments( path )
+            load_time = time.perf_counter() - start
+
+        flagged = { index for sample in samples.values() for index in sample["outliers"] }
+        print( "{:>10} {:>10} {:>9.3f}s {:>10} {:>10} {:>12}".format( num_samples * readings_per_sample, len( samples ), load_time, len( injected ), len( flagged & injected ), len( flagged - injected ) ) )
+
+
+def report_nudge( paint_database, targets_rgb, max_extra_paints_values = ( 0, 1, 2 ), weight_noise = 0.3, num_repeats = 10, seed = 0 ):
+    # MixCorrector latency and delta E, starting from each target's best two paint recipe weighed out badly
+    # (every amount off by a lognormal weight_noise), against the full solve it replaces
+    rng = np.random.default_rng( seed )
+    paints = paint_database.get_base_paints()
+    mixing_model = paint_database.get_mixing_model()
+
+    def delta_e( paint_set, amounts, target_lab ):
+        wavelengths, K, S = mixing_model.get_parameter_arrays( list( paint_set ) )
+        lab = PaintMixing.Colorimetry.reflectances_to_Lab( PaintMixing.TwoDiffuseFluxesModel.mix_arrays( K, S, np.asarray( amounts ) ), wavelengths )[0]
+        return np.linalg.norm( lab - target_lab )
+
+    print( "{:>8} {:>10} {:>10} {:>6} {:>10} {:>10} {:>30}".format( "target", "solve", "start dE", "extra", "nudge", "dE", "additions" ) )
+    for target_rgb in targets_rgb:
+        optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), target_rgb, mixing_model )
+
+        solve_time = time.perf_counter()
+        best = list( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 2, 1 ) )[-1][1][0]
+        solve_time = time.perf_counter() - solve_time
+
+        current_paints = list( best[2] )
+        current_amounts = np.asarray( best[3] ) * np.exp( rng.normal( 0.0, weight_noise, len( current_paints ) ) )
+        target_name = "#{:02x}{:02x}{:02x}".format( *( np.round( target_rgb * 255 ).astype( int ) ) )
+
+        for max_extra_paints in max_extra_paints_values:
+            corrector = PaintMixing.MixCorrector( optimizer, paints, max_extra_paints )
+
+            nudge_time = time.perf_counter()
+            for i in range( num_repeats ):
+                corrections = corrector( current_paints, current_amounts )
+            nudge_time = ( time.perf_counter() - nudge_time ) / num_repeats
+
+            _, _, paint_set, amounts, additions = corrections[0]
+            print( "{:>8} {:>9.3f}s {:>10.2f} {:>6} {:>8.1f}ms {:>10.2f} {:>30}".format( target_name, solve_time, delta_e( current_paints, current_amounts, optimizer.target_lab ),
+                                                                                     max_extra_paints, nudge_time * 1000.0, delta_e( paint_set, amounts, optimizer.target_lab ),
+                                                                                     " ".join( "{}+{:.2f}".format( paint, addition ) for paint, addition in zip( paint_set, additions ) if addition > 0.0 ) ) )
+
+
+def report_simplex( paint_database, targets_rgb, max_num_paints = 3, illuminants = None ):
+    # RecipeOptimizer's k weights in the ( 0.001, 1 ) box from equal weights, the way they used to be optimized, against
+    # the k - 1 ratios to a pinned paint from the lattice seed (RecipeOptimizer.optimize_weights), for every combination
+    # of the base paints: L-BFGS-B iterations, evaluations, wall time, and how the errors they end up at compare to the box's
+    # on the sRGB objective, and on the Lab one under illuminants too when they are given
+    paints = paint_database.get_base_paints()
+    mixing_model = paint_database.get_mixing_model()
+
+    def run_box( optimizer, evaluator, num_paints ):
+        return scipy.optimize.minimize( evaluator, np.array( [ 0.5 ] * num_paints ), jac = True, bounds = [ ( 0.001, 1 ) ] )
+
+    def run_pinned( optimizer, evaluator, num_paints ):
+        return optimizer.optimize_weights( evaluator )[1]
+
+    print( "{:>10} {:>6} {:>8} {:>8} {:>6} {:>6} {:>10} {:>11} {:>8} {:>8} {:>10}".format( "objective", "size", "method", "solves", "nit", "nfev", "ms/solve", "mean error", "better", "worse", "max loss" ) )
+    for objective_illuminants in ( ( None, tuple( illuminants ) ) if illuminants else ( None, ) ):
+        objective = "srgb" if objective_illuminants is None else "+".join( objective_illuminants )
+        for num_paints in range( 2, max_num_paints + 1 ):
+            paint_sets = list( combinations( paints, num_paints ) )
+            stats = {}
+            for name, run in ( ( "box", run_box ), ( "pinned", run_pinned ) ):
+                iterations = []
+                evaluations = []
+                errors = []
+                start = time.perf_counter()
+                for target_rgb in targets_rgb:
+                    optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), target_rgb, mixing_model, objective_illuminants )
+                    for paint_set in paint_sets:
+                        result = run( optimizer, PaintMixing.MixEvaluator( optimizer, paint_set ), num_paints )
+                        iterations.append( result["nit"] )
+                        evaluations.append( result["nfev"] )
+                        errors.append( result["fun"] )
+                stats[name] = ( np.array( iterations ), np.array( evaluations ), np.array( errors ), ( time.perf_counter() - start ) / len( errors ) )
+
+            for name, ( iterations, evaluations, errors, seconds ) in stats.items():
+                # differences smaller than 1e-6 (squared sRGB or delta E) are the same minimum
+                gain = stats["box"][2] - errors
+                print( "{:>10} {:>6} {:>8} {:>8} {:>6.1f} {:>6.1f} {:>10.2f} {:>11.5f} {:>8} {:>8} {:>10.3f}".format( objective, num_paints, name, len( errors ), iterations.mean(), evaluations.mean(), seconds * 1000.0,
+                                                                                                                errors.mean(), ( gain > 1e-6 ).sum(), ( gain < -1e-6 ).sum(), -gain.min() ) )
+
+
+def report_clusters( paint_database, targets_rgb, num_variants = 3, max_num_paints = 3, threshold = 0.1, cluster_expand = 8, map_function = map ):
+    # the clustered search against the exhaustive one on a library with num_variants brands of every paint:
+    # how many clusters there are, how many combinations each search optimizes, and the best error of every size
+    library = brand_variants( paint_database, num_variants )
+    paints = library.get_base_paints()
+
+    start = time.perf_counter()
+    clusters = PaintMixing.PigmentClusters( library.get_mixing_model(), paints, threshold )
+    print( "{} paints in {} clusters (largest {}), analysed in {:.3f}s".format( len( paints ), len( clusters.clusters ), max( len( cluster ) for cluster in clusters.clusters ), time.perf_counter() - start ) )
+    print()
+
+    def counting_map( counter ):
+        def counted( function, items ):
+            items = list( items )
+            counter[0] = counter[0] + len( items )
+            return map_function( function, items )
+        return counted
+
+    print( "{:>8} {:>6} {:>12} {:>12} {:>12} {:>12} {:>10} {:>10}".format( "target", "size", "exh. combos", "clust. combos", "exh. error", "clust. error", "exh. time", "clust. time" ) )
+    for target_rgb in targets_rgb:
+        runs = {}
+        for search in ( "exhaustive", "clustered" ):
+            counter = [ 0 ]
+            start = time.perf_counter()
+            best = {}
+            for num_paints in range( 2, max_num_paints + 1 ):
+                counter[0] = 0
+                _, recipes = next( PaintMixing.solve_recipes( target_rgb, library, paints, max_num_paints, 1, counting_map( counter ), recipe_sizes = [ num_paints ],
+                                                              search = search, cluster_threshold = threshold, cluster_expand = cluster_expand ) )
+                best[num_paints] = ( counter[0], recipes[0][1] )
+            runs[search] = ( best, time.perf_counter() - start )
+
+        for num_paints in range( 2, max_num_paints + 1 ):
+            ( exhaustive_combos, exhaustive_error ), ( clustered_combos, clustered_error ) = runs["exhaustive"][0][num_paints], runs["clustered"][0][num_paints]
+            print( "{:>8} {:>6} {:>12} {:>12} {:>12.6f} {:>12.6f} {:>10} {:>10}".format( "#{:02x}{:02x}{:02x}".format( *( np.round( target_rgb * 255 ).astype( int ) ) ), num_paints,
+                                                                                        exhaustive_combos, clustered_combos, exhaustive_error, clustered_error,
+                                                                                        "{:.2f}s".format( runs["exhaustive"][1] ) if num_paints == max_num_paints else "",
+                                                                                        "{:.2f}s".format( runs["clustered"][1] ) if num_paints == max_num_paints else "" ) )
+
+
+class BandPigmentModel:
+    # hands out K and S on num_bands evenly spaced samples (PaintMixing.band_parameter_arrays), so anything that takes
+    # a pigment model can be timed at one spectral resolution level
+    def __init__( self, pigment_model, num_bands ):
+        self.pigment_model = pigment_model
+        self.num_bands = num_bands
+        self.parameter_arrays_cache = {}
+
+    def get_parameter_arrays( self, names ):
+        names = tuple( names )
+        if names not in self.parameter_arrays_cache:
+            self.parameter_arrays_cache[names] = PaintMixing.band_parameter_arrays( *self.pigment_model.get_parameter_arrays( names ), self.num_bands )
+        return self.parameter_arrays_cache[names]
+
+
+def report_spectral_resolution( paint_database, targets_rgb, max_num_paints = 4, top_m = 25, delta_e_bounds = ( 0.1, 0.25, 0.5, 1.0 ) ):
+    # every SPECTRAL_LEVELS grid against the full one: delta E of the probe mixes, then the time (and speedup) of the
+    # batched paths on it - prescreen scores of all the max_num_paints combinations (and how many of the full grid's
+    # top_m it keeps), the gamut, the robustness estimate - and of a single MixEvaluator evaluation
+    paints = paint_database.get_base_paints()
+    mixing_model = paint_database.get_mixing_model()
+    wavelengths, K, S = mixing_model.get_parameter_arrays( paints )
+    indices = PaintMixing.combination_indices( len( paints ), max_num_paints )
+
+    def time_levels( pigment_model ):
+        optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), targets_rgb[0], pigment_model )
+
+        start = time.perf_counter()
+        top = set()
+        for target_rgb in targets_rgb:
+            optimizer.target_rgb = target_rgb
+            scores = PaintMixing.RecipePrescreener( optimizer, paints ).score_combinations( indices )
+            top.update( ( tuple( target_rgb ), combination ) for combination in np.argsort( scores, kind = "stable" )[:top_m] )
+        prescreen_time = ( time.perf_counter() - start ) / len( targets_rgb )
+
+        start = time.perf_counter()
+        PaintMixing.PaintGamut( pigment_model, paints )
+        gamut_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range( 10 ):
+            PaintMixing.recipe_robustness( pigment_model, paints[:3], [ 0.5, 0.3, 0.2 ] )
+        robustness_time = ( time.perf_counter() - start ) / 10
+
+        evaluator = PaintMixing.MixEvaluator( optimizer, paints[:3] )
+        weights = np.array( [ 0.5, 0.3, 0.2 ] )
+        start = time.perf_counter()
+        for i in range( 2000 ):
+            evaluator.evaluate( weights )
+        evaluator_time = ( time.perf_counter() - start ) / 2000
+
+        return prescreen_time, top, gamut_time, robustness_time, evaluator_time
+
+    # once to warm up the caches (colour weights, parameter arrays), then for real
+    time_levels( mixing_model )
+    full_prescreen, full_top, full_gamut, full_robustness, full_evaluator = time_levels( mixing_model )
+
+    print( "{:>6} {:>9} {:>9} {:>16} {:>8} {:>16} {:>16} {:>16}".format( "bands", "max dE", "mean dE", "prescreen", "top {}".format( top_m ), "gamut", "robustness", "evaluator" ) )
+    print( "{:>6} {:>9} {:>9} {:>14.1f}ms {:>8} {:>14.1f}ms {:>14.2f}ms {:>14.1f}us".format( len( wavelengths ), "", "", full_prescreen * 1000.0, "", full_gamut * 1000.0, full_robustness * 1000.0, full_evaluator * 1e6 ) )
+    for num_bands in PaintMixing.SPECTRAL_LEVELS:
+        delta_e = PaintMixing.band_delta_e( wavelengths, K, S, num_bands )
+        prescreen_time, top, gamut_time, robustness_time, evaluator_time = time_levels( BandPigmentModel( mixing_model, num_bands ) )
+        print( "{:>6} {:>9.3f} {:>9.3f} {:>9.1f}ms {:>4.1f}x {:>7.0%} {:>9.1f}ms {:>4.1f}x {:>9.2f}ms {:>4.1f}x {:>9.1f}us {:>4.1f}x".format(
+            num_bands, delta_e.max(), delta_e.mean(),
+            prescreen_time * 1000.0, full_prescreen / prescreen_time, len( top & full_top ) / len( full_top ),
+            gamut_time * 1000.0, full_gamut / gamut_time, robustness_time * 1000.0, full_robustness / robustness_time, evaluator_time * 1e6, full_evaluator / evaluator_time ) )
+
+    print()
+    for max_delta_e in delta_e_bounds:
+        print( "spectral_delta_e {:g}: {} bands".format( max_delta_e, len( PaintMixing.reduced_parameter_arrays( mixing_model, paints, max_delta_e )[0] ) ) )
+
+
+def report_palette( paint_database, targets_rgb, library_sizes, max_paints_values = ( 4, 6, 8 ), delta_e = 3.0, max_recipe_paints = 3, spectral_delta_e = 1.0, map_function = map ):
+    # PaletteSelector on growing libraries: time to score every target's candidate recipes (once per library, the
+    # later palette sizes hit the cache), to pick the paints, and to solve the targets on them; estimated is how many
+    # targets the prescreen thinks are within delta_e, solved how many really are
+    print( "{:>8} {:>6} {:>10} {:>10} {:>10} {:>10} {:>8}".format( "library", "paints", "score", "select", "solve", "estimated", "solved" ) )
+    for library_size in library_sizes:
+        library = synthetic_library( paint_database, library_size ) if library_size > len( paint_database.get_base_paints() ) else paint_database
+        paints = library.get_base_paints()
+
+        for max_paints in max_paints_values:
+            start = time.perf_counter()
+            selector = PaintMixing.PaletteSelector( library, paints, targets_rgb, max_paints, delta_e, max_recipe_paints, spectral_delta_e = spectral_delta_e )
+            scored = time.perf_counter()
+            chosen = selector.select()
+            selected = time.perf_counter()
+            results = selector.solve( chosen, map_function )
+            solved = time.perf_counter()
+
+            estimated = int( ( selector.best_delta_e( np.isin( paints, chosen ) ) <= delta_e ).sum() )
+            covered = sum( result_delta_e <= delta_e for _, result_delta_e in results )
+            print( "{:>8} {:>6} {:>9.2f}s {:>9.2f}s {:>9.2f}s {:>10} {:>8}".format( len( paints ), max_paints, scored - start, selected - scored, solved - selected,
+                                                                                    "{}/{}".format( estimated, len( targets_rgb ) ), "{}/{}".format( covered, len( targets_rgb ) ) ) )
+
+
+def main( argv ):
+    bundle_dir = os.path.abspath( os.path.dirname( __file__ ) )
+
+    parser = argparse.ArgumentParser( description = "Paint mixing solver benchmarks" )
+    parser.add_argument( "report", choices = [ "prescreen", "sparse", "spectral", "evaluator", "memory", "gamut", "executor", "loading", "nudge", "simplex", "clusters", "resolution", "palette" ] )
+    parser.add_argument( "--data", nargs = "+", default = [ os.path.join( bundle_dir, "data/masstone.json" ), os.path.join( bundle_dir, "data/mix1.json" ) ] )
+    parser.add_argument( "--targets", nargs = "+", default = DEFAULT_TARGETS )
+    parser.add_argument( "--max-paints", type = int, default = 4 )
+    parser.add_argument( "--top-m", type = int, nargs = "+", default = [ 10, 25, 50, 100 ] )
+    parser.add_argument( "--beam-width", type = int, default = 8 )
+    parser.add_argument( "--library-sizes", type = int, nargs = "+", default = [ 13, 50, 100, 200 ] )
+    parser.add_argument( "--processes", type = int, default = None )
+    parser.add_argument( "--variants", type = int, default = 3 )
+    parser.add_argument( "--cluster-threshold", type = float, default = 0.1 )
+    parser.add_argument( "--readings", type = int, nargs = "+", default = [ 1000, 20000, 100000 ] )
+    parser.add_argument( "--illuminants", nargs = "+", default = None, help = "simplex: also run on the Lab objective under these illuminants" )
+    args = parser.parse_args( argv )
+
+    paint_database = PaintMixing.PaintDatabase( args.data )
+    targets_rgb = [ parse_color( target ) for target in args.targets ]
+
+    with Pool( args.processes if args.processes else min( 61, os.cpu_count() ) ) as p:
+        if args.report == "prescreen":
+            report_prescreen_recall( paint_database, targets_rgb, args.top_m, args.max_paints, 3, p.map )
+        elif args.report == "sparse":
+            report_sparse_search( paint_database, targets_rgb, args.library_sizes, args.max_paints, args.beam_width, p.map )
+        elif args.report == "spectral":
+            report_spectral_targets( paint_database, args.max_paints, p.map )
+        elif args.report == "evaluator":
+            report_evaluator_allocations( paint_database, targets_rgb )
+        elif args.report == "gamut":
+            report_gamut( paint_database, targets_rgb, args.max_paints, p.map )
+        elif args.report == "loading":
+            report_measurement_loading( paint_database, args.readings )
+        elif args.report == "resolution":
+            report_spectral_resolution( paint_database, targets_rgb, args.max_paints )
+        elif args.report == "palette":
+            report_palette( paint_database, targets_rgb, args.library_sizes, map_function = p.map )
+        elif args.report == "clusters":
+            report_clusters( paint_database, targets_rgb, args.variants, args.max_paints, args.cluster_threshold, map_function = p.map )
+        elif args.report == "simplex":
+            report_simplex( paint_database, targets_rgb, args.max_paints, args.illuminants )
+        elif args.report == "nudge":
+            report_nudge( paint_database, targets_rgb )
+        elif args.report == "executor":
+            report_executor( paint_database, targets_rgb, args.max_paints, args.processes )
+        elif args.report == "memory":
+            for library_size in args.library_sizes:
+                report_worker_memory( paint_database, targets_rgb, library_size, args.processes if args.processes else min( 61, os.cpu_count() ) )
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main( sys.argv[1:] )
@@ -0,0 +1,189 @@
+import os
+import sys
+import csv
+import json
+import time
+import pstats
+import cProfile
+import argparse
+import multiprocessing
+import numpy as np
+import PaintMixing
+from PaintMixingServer import recipe_to_json, parse_target
+from multiprocessing import Pool
+
+# headless command line solver, for machines without a display (or PyQt5):
+#   python -m PaintMixing targets.csv --paints white "cold yellow" magenta --max-num-paints 3 > recipes.jsonl
+#   python -m PaintMixing targets.jsonl --profile solve.prof
+# targets are CSV (a header with id and either hex or r, g, b columns; or rows of just #rrggbb) or JSONL
+# (one { "id", "target", "paints", "max_num_paints" } object per line, only target is required, or just
+# the target); every target is solved in its own worker, and its results are written as one JSON line
+# as soon as it's done, in the order of the input
+
+
+def read_targets( path ):
+    # [ { "id", "target", ... } ], target still unparsed
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+        is_jsonl = lines and lines[0].lstrip().startswith( ( "{", "[", "\"" ) )
+    else:
+        with open( path, newline = "" ) as targets_file:
+            lines = targets_file.read().splitlines()
+        is_jsonl = path.endswith( ( ".jsonl", ".json" ) )
+
+    lines = [ line for line in lines if line.strip() ]
+
+    if is_jsonl:
+        jobs = []
+        for line_number, line in enumerate( lines ):
+            job = json.loads( line )
+            job = job if isinstance( job, dict ) else { "target" : job }
+            job.setdefault( "id", line_number )
+            jobs.append( job )
+        return jobs
+
+    rows = list( csv.reader( lines ) )
+    header = [ column.strip().lower() for column in rows[0] ] if rows else []
+
+    if "r" in header and "g" in header and "b" in header:
+        return [ { "id" : row[header.index( "id" )] if "id" in header else row_number,
+                   "target" : [ float( row[header.index( component )] ) for component in ( "r", "g", "b" ) ] }
+                 for row_number, row in enumerate( rows[1:] ) ]
+
+    if "hex" in header:
+        return [ { "id" : row[header.index( "id" )] if "id" in header else row_number, "target" : row[header.index( "hex" )].strip() }
+                 for row_number, row in enumerate( rows[1:] ) ]
+
+    # no header, every row is a target (and maybe an id in front of it)
+    return [ { "id" : row[0] if len( row ) > 1 else row_number, "target" : row[-1].strip() } for row_number, row in enumerate( rows ) ]
+
+
+class SolveSettings:
+    def __init__( self, library, paints, max_num_paints, num_best, illuminants, illuminant_error, prescreen_top_m, search, max_total_parts, gamut_tolerance, cluster_threshold, spectral_delta_e, profile ):
+        self.library = library
+        self.paints = paints
+        self.max_num_paints = max_num_paints
+        self.num_best = num_best
+        self.illuminants = illuminants
+        self.illuminant_error = illuminant_error
+        self.prescreen_top_m = prescreen_top_m
+        self.search = search
+        self.max_total_parts = max_total_parts
+        self.gamut_tolerance = gamut_tolerance
+        self.cluster_threshold = cluster_threshold
+        self.spectral_delta_e = spectral_delta_e
+        self.profile = profile
+
+
+class ProfileStats:
+    # pstats.Stats.add() takes anything with create_stats() and stats, which lets us ship a worker's
+    # profile back as a plain dict instead of going through files
+    def __init__( self, stats ):
+        self.stats = stats
+
+    def create_stats( self ):
+        pass
+
+
+def solve_job( settings, job ):
+    # runs in a worker; returns ( output line, profile stats or None )
+    profiler = cProfile.Profile() if settings.profile else None
+    result = { "id" : job["id"] }
+    start = time.perf_counter()
+
+    try:
+        target_rgb = parse_target( job["target"] )
+        paints = job.get( "paints", settings.paints )
+        result["target"] = "#{:02x}{:02x}{:02x}".format( *( int( round( component ) ) for component in target_rgb ) )
+
+        if profiler:
+            profiler.enable()
+        recipes = {}
+        for num_paints, best in PaintMixing.solve_recipes( np.array( target_rgb ) / 255.0, settings.library, paints, job.get( "max_num_paints", settings.max_num_paints ), settings.num_best,
+                                                           map, settings.illuminants, settings.illuminant_error, None, settings.prescreen_top_m, settings.search,
+                                                           max_total_parts = settings.max_total_parts, gamut_tolerance = settings.gamut_tolerance,
+                                                           cluster_threshold = settings.cluster_threshold, spectral_delta_e = settings.spectral_delta_e ):
+            recipes[str( num_paints )] = [ recipe_to_json( recipe ) for recipe in best ]
+        result["recipes"] = recipes
+    except PaintMixing.OutOfGamutError as error:
+        result["error"] = str( error )
+        result["nearest"] = "#{:02x}{:02x}{:02x}".format( *( int( round( component * 255 ) ) for component in error.nearest_rgb ) )
+    except ( ValueError, KeyError ) as error:
+        result["error"] = "{}: {}".format( type( error ).__name__, error )
+    finally:
+        if profiler:
+            profiler.disable()
+
+    result["seconds"] = round( time.perf_counter() - start, 4 )
+
+    if profiler:
+        profiler.create_stats()
+    return json.dumps( result ), profiler.stats if profiler and profiler.stats else None
+
+
+def solve_job_star( arguments ):
+    return solve_job( *arguments )
+
+
+def main( argv ):
+    bundle_dir = os.path.abspath( os.path.dirname( __file__ ) )
+
+    parser = argparse.ArgumentParser( prog = "python -m PaintMixing", description = "Solve paint recipes for a list of target colours" )
+    parser.add_argument( "targets", help = "CSV or JSONL file with the targets, - for stdin" )
+    parser.add_argument( "--data", nargs = "+", default = [ os.path.join( bundle_dir, "data/masstone.json" ), os.path.join( bundle_dir, "data/mix1.json" ) ] )
+    parser.add_argument( "--paints", nargs = "+", default = None, help = "paints to mix from (all the base paints by default)" )
+    parser.add_argument( "--max-num-paints", type = int, default = 3 )
+    parser.add_argument( "--num-best", type = int, default = 3 )
+    parser.add_argument( "--illuminants", nargs = "+", default = None )
+    parser.add_argument( "--illuminant-error", choices = [ "mean", "max" ], default = "mean" )
+    parser.add_argument( "--prescreen-top-m", type = int, default = None )
+    parser.add_argument( "--search", choices = [ "exhaustive", "sparse", "clustered" ], default = "exhaustive" )
+    parser.add_argument( "--cluster-threshold", type = float, default = 0.1, help = "log K/S distance under which paints count as one for --search clustered" )
+    parser.add_argument( "--spectral-delta-e", type = float, default = None, help = "run the prescreen, sparse search and gamut on a coarser spectral grid within this delta E" )
+    parser.add_argument( "--max-total-parts", type = int, default = None )
+    parser.add_argument( "--gamut-tolerance", type = float, default = None )
+    parser.add_argument( "--processes", type = int, default = None, help = "worker processes, 0 solves everything in this process" )
+    parser.add_argument( "--out", default = "-", help = "JSONL output, - for stdout" )
+    parser.add_argument( "--profile", default = None, metavar = "PATH", help = "dump cProfile statistics of the solves (merged over all the workers) to PATH" )
+    args = parser.parse_args( argv )
+
+    paint_database = PaintMixing.PaintDatabase( args.data )
+    jobs = read_targets( args.targets )
+
+    # workers get the library as a memory-mapped file, not a pickled copy of the database
+    settings = SolveSettings( paint_database.get_mapped_library(), args.paints if args.paints else paint_database.get_base_paints(),
+                              args.max_num_paints, args.num_best, args.illuminants, args.illuminant_error, args.prescreen_top_m, args.search,
+                              args.max_total_parts, args.gamut_tolerance, args.cluster_threshold, args.spectral_delta_e, args.profile is not None )
+
+    processes = args.processes if args.processes is not None else min( 61, os.cpu_count(), max( 1, len( jobs ) ) )
+    stats = None
+    start = time.perf_counter()
+
+    out_file = sys.stdout if args.out == "-" else open( args.out, "w" )
+    pool = Pool( processes ) if processes > 0 else None
+    try:
+        results = ( pool.imap if pool else map )( solve_job_star, [ ( settings, job ) for job in jobs ] )
+        for line, job_stats in results:
+            out_file.write( line + "\n" )
+            out_file.flush()
+
+            if job_stats is not None:
+                stats = pstats.Stats( ProfileStats( job_stats ) ) if stats is None else stats.add( ProfileStats( job_stats ) )
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if out_file is not sys.stdout:
+            out_file.close()
+
+    print( "solved {} targets in {:.2f} s".format( len( jobs ), time.perf_counter() - start ), file = sys.stderr )
+
+    if stats is not None:
+        stats.dump_stats( args.profile )
+        stats.stream = sys.stderr
+        stats.sort_stats( "cumulative" ).print_stats( 25 )
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main( sys.argv[1:] )
@@ -0,0 +1,183 @@
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+import matplotlib.image
+import PaintMixing
+from itertools import combinations
+
+# printable mixing charts; every chart is a grid of swatches, each swatch a few paints with weights,
+# and the whole grid is mixed and turned into colour in one batch:
+#   python PaintMixingCharts.py pairs --out charts/pairs
+#   python PaintMixingCharts.py gradients --steps 11 --out charts/gradients
+#   python PaintMixingCharts.py tints --shade black --out charts/tints
+#   python PaintMixingCharts.py triangle --paints "cold yellow" magenta "blue green shade" --out charts/triangle
+# each writes <out>.png and <out>.csv
+
+
+class SwatchGrid:
+    # rows x columns swatches; swatch ( r, c ) mixes paints indices[r, c] with weights[r, c] (zero weights pad
+    # swatches with fewer paints), invalid swatches (eg. outside of a triangle) are left blank
+    def __init__( self, names, indices, weights, valid = None, row_labels = None, column_labels = None ):
+        self.names = list( names )
+        self.indices = indices
+        self.weights = weights
+        self.valid = valid if valid is not None else np.ones( indices.shape[:2], dtype = bool )
+        self.row_labels = row_labels
+        self.column_labels = column_labels
+
+        self.rgb = None
+        self.lab = None
+
+    def evaluate( self, pigment_model ):
+        wavelengths, K, S = pigment_model.get_parameter_arrays( self.names )
+
+        reflectances = PaintMixing.TwoDiffuseFluxesModel.mix_arrays( K[self.indices], S[self.indices], self.weights )
+        xyz = PaintMixing.Colorimetry.reflectances_to_xyz( reflectances, wavelengths )[..., 0, :]
+
+        self.rgb = PaintMixing.Colorimetry.xyz_to_rgb_saturated( xyz )
+        self.lab = PaintMixing.Colorimetry.reflectances_to_Lab( reflectances, wavelengths )[..., 0, :]
+        return self
+
+    def image( self, cell_size = 16, gap = 1, background = 1.0 ):
+        rows, columns = self.indices.shape[:2]
+        pitch = cell_size + gap
+
+        image = np.full( ( rows * pitch + gap, columns * pitch + gap, 3 ), background )
+        cells = np.where( self.valid[..., None], self.rgb, background )
+
+        for row in range( cell_size ):
+            for column in range( cell_size ):
+                image[gap + row::pitch, gap + column::pitch][:rows, :columns] = cells
+
+        return image
+
+    def save_png( self, path, cell_size = 16 ):
+        matplotlib.image.imsave( path, self.image( cell_size ) )
+
+    def save_csv( self, path ):
+        with open( path, "w", newline = "" ) as csv_file:
+            writer = csv.writer( csv_file )
+            writer.writerow( [ "row", "column", "row label", "column label", "paints", "weights", "hex", "r", "g", "b", "L", "a", "b*" ] )
+
+            rgb_int = np.round( self.rgb * 255 ).astype( int )
+            for row, column in zip( *np.nonzero( self.valid ) ):
+                used = self.weights[row, column] > 0
+                writer.writerow( [ row, column,
+                                   self.row_labels[row] if self.row_labels is not None else "",
+                                   self.column_labels[column] if self.column_labels is not None else "",
+                                   ";".join( self.names[i] for i in self.indices[row, column][used] ),
+                                   ";".join( "{:.4f}".format( weight ) for weight in self.weights[row, column][used] ),
+                                   "#{:02x}{:02x}{:02x}".format( *rgb_int[row, column] ),
+                                   *rgb_int[row, column],
+                                   *( "{:.2f}".format( value ) for value in self.lab[row, column] ) ] )
+
+
+def pair_chart( names, ratio = 0.5 ):
+    # N x N: swatch ( i, j ) is paint i and paint j at ratio : 1 - ratio, the diagonal are the masstones
+    num_paints = len( names )
+    rows, columns = np.meshgrid( np.arange( num_paints ), np.arange( num_paints ), indexing = "ij" )
+
+    indices = np.stack( [ rows, columns ], -1 )
+    weights = np.broadcast_to( np.array( [ ratio, 1.0 - ratio ] ), indices.shape ).copy()
+
+    return SwatchGrid( names, indices, weights, row_labels = names, column_labels = names )
+
+
+def pair_gradients( names, steps = 11 ):
+    # one row per pair of paints, going from the first to the second in steps
+    pairs = np.array( list( combinations( range( len( names ) ), 2 ) ) ).reshape( -1, 2 )
+    t = np.linspace( 0.0, 1.0, steps )
+
+    indices = np.broadcast_to( pairs[:, None, :], ( len( pairs ), steps, 2 ) ).copy()
+    weights = np.broadcast_to( np.stack( [ 1.0 - t, t ], -1 )[None], ( len( pairs ), steps, 2 ) ).copy()
+
+    return SwatchGrid( names, indices, weights,
+                       row_labels = [ "{} / {}".format( names[a], names[b] ) for a, b in pairs ],
+                       column_labels = [ "{:.2f}".format( value ) for value in t ] )
+
+
+def tint_ladders( names, white = "white", shade = None, steps = 11 ):
+    # one row per paint: masstone towards white (tints), then towards shade (eg. black) if given;
+    # white is added in geometric steps, since a little white already shifts a strong pigment a lot
+    names = list( names )
+    extra = [ white ] + ( [ shade ] if shade else [] )
+    all_names = names + [ name for name in extra if name not in names ]
+    paints = [ all_names.index( name ) for name in names if name not in extra ]
+
+    fractions = np.concatenate( [ [ 0.0 ], np.geomspace( 0.01, 0.99, steps - 1 ) ] )
+    column_labels = [ "{:.0%} {}".format( fraction, white ) for fraction in fractions ]
+
+    ladders = [ ( all_names.index( white ), fractions ) ]
+    if shade:
+        ladders.append( ( all_names.index( shade ), fractions[1:] ) )
+        column_labels = column_labels + [ "{:.0%} {}".format( fraction, shade ) for fraction in fractions[1:] ]
+
+    indices = []
+    weights = []
+    for extra_paint, ladder_fractions in ladders:
+        indices.append( np.stack( np.broadcast_arrays( np.array( paints )[:, None], np.full( ( 1, len( ladder_fractions ) ), extra_paint ) ), -1 ) )
+        weights.append( np.broadcast_to( np.stack( [ 1.0 - ladder_fractions, ladder_fractions ], -1 )[None], ( len( paints ), len( ladder_fractions ), 2 ) ) )
+
+    return SwatchGrid( all_names, np.concatenate( indices, 1 ), np.concatenate( weights, 1 ),
+                       row_labels = [ all_names[paint] for paint in paints ], column_labels = column_labels )
+
+
+def mixing_triangle( names, resolution = 16 ):
+    # barycentric triangle of three paints as a right triangle: first paint at the top, second at the bottom left,
+    # third at the bottom right; row r has r + 1 swatches
+    rows, columns = np.meshgrid( np.arange( resolution + 1 ), np.arange( resolution + 1 ), indexing = "ij" )
+    valid = columns <= rows
+
+    first = ( resolution - rows ) / resolution
+    third = np.where( valid, columns, 0 ) / resolution
+    second = np.clip( 1.0 - first - third, 0.0, 1.0 )
+
+    indices = np.broadcast_to( np.arange( 3 ), rows.shape + ( 3, ) ).copy()
+    weights = np.stack( [ first, second, third ], -1 )
+    weights = np.where( valid[..., None], weights, np.array( [ 1.0, 0.0, 0.0 ] ) )
+
+    return SwatchGrid( names, indices, weights, valid = valid )
+
+
+def main( argv ):
+    bundle_dir = os.path.abspath( os.path.dirname( __file__ ) )
+
+    parser = argparse.ArgumentParser( description = "Paint mixing charts" )
+    parser.add_argument( "chart", choices = [ "pairs", "gradients", "tints", "triangle" ] )
+    parser.add_argument( "--data", nargs = "+", default = [ os.path.join( bundle_dir, "data/masstone.json" ), os.path.join( bundle_dir, "data/mix1.json" ) ] )
+    parser.add_argument( "--paints", nargs = "+", default = None, help = "paints to chart (all by default, exactly three for a triangle)" )
+    parser.add_argument( "--out", default = "chart" )
+    parser.add_argument( "--steps", type = int, default = 11 )
+    parser.add_argument( "--ratio", type = float, default = 0.5 )
+    parser.add_argument( "--white", default = "white" )
+    parser.add_argument( "--shade", default = None )
+    parser.add_argument( "--resolution", type = int, default = 16 )
+    parser.add_argument( "--cell-size", type = int, default = 16 )
+    args = parser.parse_args( argv )
+
+    paint_database = PaintMixing.PaintDatabase( args.data )
+    names = args.paints if args.paints else paint_database.get_base_paints()
+
+    if args.chart == "pairs":
+        grid = pair_chart( names, args.ratio )
+    elif args.chart == "gradients":
+        grid = pair_gradients( names, args.steps )
+    elif args.chart == "tints":
+        grid = tint_ladders( names, args.white, args.shade, args.steps )
+    else:
+        if len( names ) != 3:
+            parser.error( "a triangle needs exactly three paints" )
+        grid = mixing_triangle( names, args.resolution )
+
+    grid.evaluate( paint_database.get_mixing_model() )
+
+    if os.path.dirname( args.out ):
+        os.makedirs( os.path.dirname( args.out ), exist_ok = True )
+    grid.save_png( args.out + ".png", args.cell_size )
+    grid.save_csv( args.out + ".csv" )
+
+
+if __name__ == '__main__':
+    main( sys.argv[1:] )
@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import math
+import time
+import heapq
+import queue
+import socket
+import argparse
+import threading
+import socketserver
+import multiprocessing
+import numpy as np
+import PaintMixing
+from PaintMixingCLI import read_targets
+from PaintMixingServer import recipe_to_json, parse_target
+from multiprocessing import Pool
+
+# solving over TCP workers, on other machines or several on one for testing:
+#   python PaintMixingDistributed.py worker --host 0.0.0.0 --port 5711        (on every node, trusted network only)
+#   python PaintMixingDistributed.py solve targets.csv --workers node1:5711 node2:5711 localhost:5711
+# the coordinator cuts the combinations of every target and recipe size into shards (ranges of the
+# itertools.combinations order), hands them out to whichever worker is free and merges the per shard
+# top k; results are ordered by error, then by position in the combinations order, so the merged
+# recipes don't depend on which worker solved which shard; a shard whose worker dies or times out
+# goes back in the queue for the others
+#
+# the protocol is one JSON object per line each way: { "op" : "hello" } answers the library hash (the
+# coordinator only uses workers with the same library as its own), { "op" : "solve", ... } a shard
+
+DEFAULT_PORT = 5711
+DEFAULT_SHARD_SIZE = 512
+DEFAULT_TIMEOUT = 600.0
+
+
+def recipe_to_wire( recipe, index ):
+    # unlike PaintMixingServer.recipe_to_json, this keeps full precision, the coordinator needs it to merge
+    mixed_rgb, diff, paint_set, weights = recipe
+    return [ [ float( component ) for component in mixed_rgb ], float( diff ), list( paint_set ), [ float( weight ) for weight in weights ], index ]
+
+
+def recipe_from_wire( data ):
+    mixed_rgb, diff, paint_set, weights, index = data
+    return ( np.array( mixed_rgb ), diff, tuple( paint_set ), np.array( weights ) ), index
+
+
+class WorkerService:
+    def __init__( self, paint_database, processes = None ):
+        self.library = paint_database.get_mapped_library()
+        self.processes = processes if processes else min( 61, os.cpu_count() )
+        self.pool = Pool( self.processes )
+
+    def close( self ):
+        self.pool.terminate()
+        self.pool.join()
+
+    def hello( self, request ):
+        return { "hash" : self.library.get_hash(), "paints" : self.library.get_base_paints(), "processes" : self.processes }
+
+    def solve( self, request ):
+        target_rgb = np.array( request["target"], dtype = float ) / 255.0
+        optimizer = PaintMixing.RecipeOptimizer( self.library.get_all_paints(), target_rgb, self.library.get_mixing_model(), request.get( "illuminants" ), request.get( "illuminant_error", "mean" ) )
+
+        start, stop = request["start"], request["stop"]
+        paint_combinations = list( PaintMixing.combinations_range( request["paints"], request["num_paints"], start, stop ) )
+
+        results = self.pool.map( optimizer, paint_combinations )
+        best = heapq.nsmallest( request["num_best"], zip( results, range( start, stop ) ), key = lambda result: ( result[0][1], result[1] ) )
+        return { "results" : [ recipe_to_wire( recipe, index ) for recipe, index in best ] }
+
+
+class WorkerRequestHandler( socketserver.StreamRequestHandler ):
+    # set by serve_worker()
+    service = None
+
+    def handle( self ):
+        for line in self.rfile:
+            try:
+                request = json.loads( line )
+                if request["op"] == "hello":
+                    response = self.service.hello( request )
+                elif request["op"] == "solve":
+                    response = self.service.solve( request )
+                else:
+                    raise ValueError( "unknown op: {}".format( request["op"] ) )
+            except ( KeyError, TypeError, ValueError ) as error:
+                response = { "error" : "{}: {}".format( type( error ).__name__, error ) }
+
+            self.wfile.write( ( json.dumps( response ) + "\n" ).encode( "utf-8" ) )
+            self.wfile.flush()
+
+
+class WorkerServer( socketserver.ThreadingTCPServer ):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve_worker( service, host = "127.0.0.1", port = DEFAULT_PORT ):
+    handler = type( "BoundWorkerRequestHandler", ( WorkerRequestHandler, ), { "service" : service } )
+    return WorkerServer( ( host, port ), handler )
+
+
+class WorkerConnection:
+    def __init__( self, address, timeout = DEFAULT_TIMEOUT ):
+        host, port = address.rsplit( ":", 1 ) if ":" in address else ( address, DEFAULT_PORT )
+        self.address = address
+        self.socket = socket.create_connection( ( host, int( port ) ), timeout = timeout )
+        self.file = self.socket.makefile( "rwb" )
+
+    def close( self ):
+        try:
+            self.file.close()
+            self.socket.close()
+        except OSError:
+            pass
+
+    def request( self, request ):
+        self.file.write( ( json.dumps( request ) + "\n" ).encode( "utf-8" ) )
+        self.file.flush()
+
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError( "worker {} hung up".format( self.address ) )
+
+        response = json.loads( line )
+        if "error" in response:
+            raise ValueError( "worker {}: {}".format( self.address, response["error"] ) )
+        return response
+
+
+class DistributedSolver:
+    # workers: [ "host:port" ]; library_hash (eg. PaintDatabase.get_hash()) makes sure every worker mixes
+    # with the same fitted library as the coordinator, workers with a different one are left out
+    def __init__( self, workers, library_hash = None, shard_size = DEFAULT_SHARD_SIZE, timeout = DEFAULT_TIMEOUT ):
+        self.workers = list( workers )
+        self.library_hash = library_hash
+        self.shard_size = shard_size
+        self.timeout = timeout
+
+        self.stats = { "shards" : 0, "reissued" : 0, "failed_workers" : [] }
+
+    def make_shards( self, targets_rgb, paints_to_use, max_num_paints, num_best, illuminants, illuminant_error ):
+        shards = []
+        for target_index, target_rgb in enumerate( targets_rgb ):
+            for num_paints in range( 1, max_num_paints + 1 ):
+                num_combinations = math.comb( len( paints_to_use ), num_paints )
+                for start in range( 0, num_combinations, self.shard_size ):
+                    shards.append( { "op" : "solve", "target_index" : target_index, "target" : [ float( component ) for component in target_rgb ],
+                                     "paints" : list( paints_to_use ), "num_paints" : num_paints, "start" : start, "stop" : min( start + self.shard_size, num_combinations ),
+                                     "num_best" : num_best, "illuminants" : illuminants, "illuminant_error" : illuminant_error } )
+        return shards
+
+    def run_shards( self, shards ):
+        # every worker gets its own thread and connection and pulls shards from a shared queue until they're all done;
+        # returns the response of every shard
+        pending = queue.Queue()
+        for shard_index in range( len( shards ) ):
+            pending.put( shard_index )
+
+        responses = [ None ] * len( shards )
+        condition = threading.Condition()
+        state = { "done" : 0, "alive" : len( self.workers ), "stopped" : False }
+
+        def run_worker( address ):
+            connection = None
+            try:
+                connection = WorkerConnection( address, self.timeout )
+                hello = connection.request( { "op" : "hello" } )
+                if self.library_hash is not None and hello["hash"] != self.library_hash:
+                    raise ValueError( "worker {} has a different library ({})".format( address, hello["hash"] ) )
+
+                while True:
+                    with condition:
+                        if state["done"] == len( shards ) or state["stopped"]:
+                            return
+                    try:
+                        shard_index = pending.get( timeout = 0.1 )
+                    except queue.Empty:
+                        continue
+
+                    try:
+                        response = connection.request( { key : value for key, value in shards[shard_index].items() if key != "target_index" } )
+                    except BaseException:
+                        # somebody else gets to do it
+                        pending.put( shard_index )
+                        with condition:
+                            self.stats["reissued"] = self.stats["reissued"] + 1
+                        raise
+
+                    with condition:
+                        responses[shard_index] = response
+                        state["done"] = state["done"] + 1
+                        condition.notify_all()
+            except ( OSError, ValueError, KeyError ) as error:
+                with condition:
+                    self.stats["failed_workers"].append( ( address, str( error ) ) )
+            finally:
+                if connection:
+                    connection.close()
+                with condition:
+                    state["alive"] = state["alive"] - 1
+                    condition.notify_all()
+
+        threads = [ threading.Thread( target = run_worker, args = ( address, ), daemon = True ) for address in self.workers ]
+        for thread in threads:
+            thread.start()
+
+        with condition:
+            try:
+                while state["done"] < len( shards ):
+                    if state["alive"] == 0:
+                        raise RuntimeError( "no workers left, {} of {} shards unsolved: {}".format( len( shards ) - state["done"], len( shards ), self.stats["failed_workers"] ) )
+                    condition.wait()
+            finally:
+                state["stopped"] = True
+
+        self.stats["shards"] = self.stats["shards"] + len( shards )
+        return responses
+
+    def solve_many( self, targets_rgb, paints_to_use, max_num_paints = 4, num_best = 3, illuminants = None, illuminant_error = "mean" ):
+        # targets in 0-255; returns [ ( num_paints, best recipes ) ] for every target, like list( PaintMixing.solve_recipes(...) )
+        shards = self.make_shards( targets_rgb, paints_to_use, max_num_paints, num_best, illuminants, illuminant_error )
+        responses = self.run_shards( shards )
+
+        merged = {}
+        for shard, response in zip( shards, responses ):
+            merged.setdefault( ( shard["target_index"], shard["num_paints"] ), [] ).extend( recipe_from_wire( result ) for result in response["results"] )
+
+        solved = []
+        for target_index in range( len( targets_rgb ) ):
+            sizes = []
+            for num_paints in range( 1, max_num_paints + 1 ):
+                best = heapq.nsmallest( num_best, merged.get( ( target_index, num_paints ), [] ), key = lambda result: ( result[0][1], result[1] ) )
+                sizes.append( ( num_paints, [ recipe for recipe, _ in best ] ) )
+            solved.append( sizes )
+
+        return solved
+
+    def solve( self, target_rgb, paints_to_use, max_num_paints = 4, num_best = 3, illuminants = None, illuminant_error = "mean" ):
+        return self.solve_many( [ target_rgb ], paints_to_use, max_num_paints, num_best, illuminants, illuminant_error )[0]
+
+
+def main( argv ):
+    bundle_dir = os.path.abspath( os.path.dirname( __file__ ) )
+    default_data = [ os.path.join( bundle_dir, "data/masstone.json" ), os.path.join( bundle_dir, "data/mix1.json" ) ]
+
+    parser = argparse.ArgumentParser( description = "Paint recipe solving over TCP workers" )
+    commands = parser.add_subparsers( dest = "command", required = True )
+
+    worker_parser = commands.add_parser( "worker", help = "solve shards for coordinators" )
+    worker_parser.add_argument( "--host", default = "127.0.0.1", help = "the workers aren't authenticated, only listen on other interfaces (eg. 0.0.0.0) on a trusted network" )
+    worker_parser.add_argument( "--port", type = int, default = DEFAULT_PORT )
+    worker_parser.add_argument( "--data", nargs = "+", default = default_data )
+    worker_parser.add_argument( "--processes", type = int, default = None )
+
+    solve_parser = commands.add_parser( "solve", help = "solve targets (CSV or JSONL, see PaintMixingCLI) on the workers" )
+    solve_parser.add_argument( "targets" )
+    solve_parser.add_argument( "--workers", nargs = "+", required = True, metavar = "HOST:PORT" )
+    solve_parser.add_argument( "--data", nargs = "+", default = default_data )
+    solve_parser.add_argument( "--paints", nargs = "+", default = None )
+    solve_parser.add_argument( "--max-num-paints", type = int, default = 3 )
+    solve_parser.add_argument( "--num-best", type = int, default = 3 )
+    solve_parser.add_argument( "--illuminants", nargs = "+", default = None )
+    solve_parser.add_argument( "--illuminant-error", choices = [ "mean", "max" ], default = "mean" )
+    solve_parser.add_argument( "--shard-size", type = int, default = DEFAULT_SHARD_SIZE )
+    solve_parser.add_argument( "--timeout", type = float, default = DEFAULT_TIMEOUT, help = "seconds before a worker that doesn't answer is given up on" )
+    args = parser.parse_args( argv )
+
+    paint_database = PaintMixing.PaintDatabase( args.data )
+
+    if args.command == "worker":
+        service = WorkerService( paint_database, args.processes )
+        server = serve_worker( service, args.host, args.port )
+        print( "solving shards on {}:{}, library {}".format( *server.server_address, service.library.get_hash() ), file = sys.stderr )
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.close()
+        return
+
+    jobs = read_targets( args.targets )
+    paints = args.paints if args.paints else paint_database.get_base_paints()
+    solver = DistributedSolver( args.workers, paint_database.get_hash(), args.shard_size, args.timeout )
+
+    start = time.perf_counter()
+    solved = solver.solve_many( [ parse_target( job["target"] ) for job in jobs ], paints, args.max_num_paints, args.num_best, args.illuminants, args.illuminant_error )
+
+    for job, sizes in zip( jobs, solved ):
+        print( json.dumps( { "id" : job["id"], "recipes" : { str( num_paints ) : [ recipe_to_json( recipe ) for recipe in best ] for num_paints, best in sizes } } ) )
+
+    print( "solved {} targets in {:.2f} s, {} shards, {} reissued, failed workers: {}".format(
+        len( jobs ), time.perf_counter() - start, solver.stats["shards"], solver.stats["reissued"], solver.stats["failed_workers"] ), file = sys.stderr )
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main( sys.argv[1:] )
@@ -1,22 +1,69 @@
 import sys
 import json
 import math
+import hashlib
 import os
 import numpy as np
-import heapq
 from urllib.parse import urlparse
-from itertools import combinations
 import PaintMixing
+import PaintMixingStore
 import matplotlib.path
 import multiprocessing 
-from multiprocessing import Pool
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QListWidget, QPushButton, QGroupBox,QSizePolicy, QVBoxLayout, QHBoxLayout, QFrame, QWidget, QSlider, QSplitter, QColorDialog, QLabel, QListWidgetItem, QCheckBox)
-from PyQt5.QtCore import Qt, QSize, QMimeData, QPoint, QObject, QThread, pyqtSignal, QVariant
+from PyQt5.QtCore import Qt, QSize, QMimeData, QPoint, QObject, QThread, QTimer, pyqtSignal, QVariant
 from PyQt5.QtGui import QColor, QPalette, QDrag, QPainter, QPen, QImage, QPixmap
 
 PAINT_AMOUNT_SLIDER_SCALE = 10000
 MAX_NUM_PAINTS_IN_RECIPE = 4
 
+# None solves under D65 in sRGB; a list of illuminants (eg. [ "D65", "A", "F11" ]) makes the solver
+# minimize the Lab error across all of them instead, combined as the "mean" or the "max"
+SOLVER_ILLUMINANTS = None
+SOLVER_ILLUMINANT_ERROR = "mean"
+
+# when set, only this many of the most promising combinations per recipe size (ranked by a cheap linearized
+# prescreen, see PaintMixingBenchmarks.py prescreen for how the choice affects recall) get fully optimized
+SOLVER_PRESCREEN_TOP_M = None
+
+# "exhaustive" optimizes every combination of the checked paints, "sparse" runs a beam search over them that
+# grows linearly with the number of paints instead (PaintMixingBenchmarks.py sparse compares the two), "clustered"
+# only searches one paint of every group of near duplicates (see SOLVER_CLUSTER_THRESHOLD)
+SOLVER_SEARCH = "exhaustive"
+
+# for SOLVER_SEARCH = "clustered": paints closer than this (RMS difference of log K/S) count as the same pigment, only one
+# of them goes into the search, the others are only tried in the best recipes (PaintMixingBenchmarks.py clusters)
+SOLVER_CLUSTER_THRESHOLD = 0.1
+
+# when set, the batched parts of the solver (prescreen, sparse search, gamut) and the robustness estimate run on a
+# coarser spectral grid that keeps colours within this delta E of the full one (PaintMixingBenchmarks.py resolution)
+SOLVER_SPECTRAL_DELTA_E = None
+
+# when set, recipes are given in whole parts (eg. 7 : 2 : 1) with at most this many parts in total,
+# instead of continuous amounts
+SOLVER_MAX_TOTAL_PARTS = None
+
+# when set, targets further than this (delta E) outside of what the checked paints can mix aren't solved at all,
+# the nearest reachable colour is shown instead
+SOLVER_GAMUT_TOLERANCE = None
+
+# every displayed recipe shows how much its colour moves (delta E) with this much weighing error on every paint
+ROBUSTNESS_RELATIVE_NOISE = 0.05
+ROBUSTNESS_NUM_SAMPLES = 1000
+
+# measurement files (and new *.json files next to them) are checked for changes this often, in seconds, and
+# reloaded into the running app; only the paints fitted from changed measurements get refitted; None turns it off
+LIBRARY_WATCH_INTERVAL = 1.0
+
+# "Nudge" corrects the mix on the sliders instead of solving from scratch: the smallest additions that bring it onto
+# the target, with up to this many (0 - 2) paints that aren't in it yet; it reruns live while a colour is being picked
+NUDGE_MAX_EXTRA_PAINTS = 1
+NUDGE_WHILE_PICKING = True
+# while picking, the nudge waits for the colour to stay put this long, in seconds
+NUDGE_DEBOUNCE_INTERVAL = 0.15
+
+# solved recipes are kept here between sessions
+RECIPE_STORE_PATH = os.path.join( os.path.expanduser( "~" ), ".paintmixing", "recipes.sqlite" )
+
 
 def get_text_color( color ):
     luminance = ( (0.299 * color.red() + 0.587 * color.green() + 0.114 * color.blue()) / 255 ) * 2.0 - 1.0
@@ -24,6 +71,34 @@ def get_text_color( color ):
     return QColor.fromRgbF(1.0 - luminance, 1.0 - luminance, 1.0 - luminance)
 
 
+def get_solver_objective( target_spectrum = None ):
+    # recipes solved with different objectives can't be mixed up in the recipe store
+    if target_spectrum is not None:
+        return "spectral:" + hashlib.sha1( np.stack( [ target_spectrum.wavelengths, target_spectrum.values ] ).tobytes() ).hexdigest()
+
+    objective = "srgb" if SOLVER_ILLUMINANTS is None else "lab:{}:{}".format( ",".join( SOLVER_ILLUMINANTS ), SOLVER_ILLUMINANT_ERROR )
+    if SOLVER_MAX_TOTAL_PARTS:
+        objective = objective + ":parts{}".format( SOLVER_MAX_TOTAL_PARTS )
+
+    # the approximate searches can miss the best recipes, so they don't share stored recipes with the exhaustive one
+    if SOLVER_SEARCH != "exhaustive":
+        objective = objective + ":" + SOLVER_SEARCH
+        if SOLVER_SEARCH == "clustered":
+            objective = objective + "{:g}".format( SOLVER_CLUSTER_THRESHOLD )
+    if SOLVER_PRESCREEN_TOP_M:
+        objective = objective + ":top{}".format( SOLVER_PRESCREEN_TOP_M )
+    if SOLVER_SPECTRAL_DELTA_E:
+        objective = objective + ":bands{:g}".format( SOLVER_SPECTRAL_DELTA_E )
+    return objective
+
+
+def get_recipes_robustness( paint_library, recipes ):
+    # recipe_robustness of every ( rgb, error, paints, amounts, ... ) recipe, for PaintRecipeListItem.add_recipe; it mixes
+    # ROBUSTNESS_NUM_SAMPLES variations of each, so it runs on the solver's thread, not the UI's
+    return [ PaintMixing.recipe_robustness( paint_library.get_mixing_model(), [ paint_library.get_paint( paint )["name"] for paint in recipe[2] ], recipe[3],
+                                            ROBUSTNESS_RELATIVE_NOISE, 0.0, ROBUSTNESS_NUM_SAMPLES, spectral_delta_e = SOLVER_SPECTRAL_DELTA_E ) for recipe in recipes ]
+
+
 def get_color_desc( color ):
     r_int, g_int, b_int = color.red(), color.green(), color.blue()
     r, g, b = PaintMixing.Colorimetry.rgb_int_to_float( r_int, g_int, b_int )
@@ -84,6 +159,7 @@ class SpectraPlotWidget(QWidget):
         self.range = ( ( 380, 730 ), ( 0, 1) )
 
         self.setAcceptDrops(True)  # Accept drops if specified        
+        self.spectrum_dropped_handler = None
 
         self.prep_spectral_gradient()
         
@@ -117,10 +193,16 @@ class SpectraPlotWidget(QWidget):
                 with open(p.path[1:], 'r') as json_file:
                     data = json.load(json_file)
                     for i, spectrum in enumerate( data ):                        
-                        self.add_data( spectrum["name"], PaintMixing.Spectrum( spectrum["wavelengths"], np.array(spectrum["values"]) / 100.0 ), QColor.fromRgbF(1.0, 1.0, 1.0 ) )
+                        dropped_spectrum = PaintMixing.Spectrum( spectrum["wavelengths"], np.array(spectrum["values"]) / 100.0 )
+                        self.add_data( spectrum["name"], dropped_spectrum, QColor.fromRgbF(1.0, 1.0, 1.0 ) )
+                        if self.spectrum_dropped_handler:
+                            self.spectrum_dropped_handler( spectrum["name"], dropped_spectrum )
         except:
             pass
 
+    def set_spectrum_dropped_handler( self, handler ):
+        self.spectrum_dropped_handler = handler
+
 
     def add_data( self, name, spectrum, color):
         self.data[name] = { "data" : spectrum,
@@ -241,8 +323,11 @@ class xyPlotWidget(QWidget):
 
     def add_data( self, name, spectrum, color):
         x, y, z = PaintMixing.Colorimetry.reflectance_to_xyz( spectrum )
+        self.add_data_xy( name, ( x / ( x + y + z ), y / ( x + y + z ) ), color )
 
-        self.data[name] = { "data" : ( x / ( x + y + z ), y / ( x + y + z ) ),
+    def add_data_xy( self, name, xy, color ):
+        # chromaticity that's already known, eg. from PaintDatabase.get_colorimetry
+        self.data[name] = { "data" : ( float( xy[0] ), float( xy[1] ) ),
                             "color" : color}
 
         self.update()
@@ -260,6 +345,16 @@ class xyPlotWidget(QWidget):
             del self.data[name]
             self.update()
 
+    def set_gamut_outline( self, name, outline ):
+        # outline: xy chromaticities of a polygon, eg. PaintGamut.xy_boundary
+        self.gamuts[name] = { "outline" : [ tuple( point ) for point in outline ] }
+        self.update()
+
+    def remove_gamut( self, name ):
+        if name in self.gamuts:
+            del self.gamuts[name]
+            self.update()
+
     def to_plot_coords( self, x, y ):
         def saturate( x ):
             return 0 if x < 0 else 1 if x > 1 else x
@@ -330,6 +425,13 @@ class xyPlotWidget(QWidget):
                     painter.drawEllipse( QPoint(x1, y1), 3, 3 )
                     painter.drawLine(x1, y1, x2, y2)
 
+            if "outline" in gamut:
+                painter.setPen( QPen( QColor.fromRgbF(1.0, 0.8, 0.3, 1.0), 1.0, Qt.DashLine ) )
+                for i in range( 0, len( gamut["outline"] ) ):
+                    x1, y1 = self.to_plot_coords( *gamut["outline"][i-1] )
+                    x2, y2 = self.to_plot_coords( *gamut["outline"][i] )
+                    painter.drawLine(x1, y1, x2, y2)
+
         for name in self.data:
             pen = QPen( self.data[name]["color"], 2, Qt.SolidLine )
             painter.setPen(pen)
@@ -545,7 +647,7 @@ class PaintRecipeListItem(QWidget):
         
         self.recipes = {}
 
-    def add_recipe( self, name, components ):
+    def add_recipe( self, name, components, additions = None, delta_e = None, robustness = None ):
         mixing_components = [ ( self.paint_database.get_paint(paint_name), paint_amount ) for ( paint_name, paint_amount ) in components ]
         mixing_amount_sum = sum( paint_amount for ( paint_name, paint_amount ) in components )
 
@@ -565,7 +667,17 @@ class PaintRecipeListItem(QWidget):
             #text = "RGB ( {}, {}, {} )\n".format( mixed_color.red(), mixed_color.green(), mixed_color.blue() )
             text = get_color_desc( mixed_color ) + "\n"
             for paint_name, paint_amount in components:
-                text = text + paint_name + " : " + "{:.3f}".format( paint_amount ) + "\n"
+                amount_text = "{:g} parts".format( paint_amount ) if SOLVER_MAX_TOTAL_PARTS else "{:.3f}".format( paint_amount )
+                if additions is not None:
+                    amount_text = amount_text + " (+{:.3f})".format( additions[paint_name] )
+                text = text + paint_name + " : " + amount_text + "\n"
+
+            if delta_e is not None:
+                text = text + "dE {:.2f}\n".format( delta_e )
+
+            # computed with the solve (get_recipes_robustness), there's none for the nudged mixes
+            if robustness is not None:
+                text = text + "dE at \u00b1{:.0f}%: {:.2f} median, {:.2f} worst 5%\n".format( ROBUSTNESS_RELATIVE_NOISE * 100, robustness["median"], robustness["p95"] )
         
             text_color = get_text_color( mixed_color )
 
@@ -578,7 +690,8 @@ class PaintRecipeListItem(QWidget):
             self.layout.addWidget( recipe_containter )
 
             self.recipes[name] = { "components" : components,
-                                   "text" : text }
+                                   "text" : text,
+                                   "robustness" : robustness }
 
             self.update_size()
         
@@ -605,6 +718,14 @@ class MainWindow(QMainWindow):
         self.used_paints = {}
         self.all_paints = {}
 
+        os.makedirs( os.path.dirname( RECIPE_STORE_PATH ), exist_ok = True )
+        self.recipe_store = PaintMixingStore.RecipeStore( RECIPE_STORE_PATH )
+        self.target_spectrum = None
+
+        # runs the solver's combinations inline, on threads or on a process pool, depending on how many there are
+        # and what they cost; the pool is kept between solves
+        self.executor = PaintMixing.AdaptiveExecutor()
+
         self.setContentsMargins(5, 5, 5, 5)
 
         # Initialize the splitter layout
@@ -646,6 +767,7 @@ class MainWindow(QMainWindow):
         #self.figure = plt.figure()
         #self.canvas = FigureCanvas(self.figure)
         self.spectra_plot = SpectraPlotWidget()
+        self.spectra_plot.set_spectrum_dropped_handler( self.spectrum_dropped )
         self.mixed_color_layout.addWidget( self.spectra_plot )
 
         self.locus_plot = xyPlotWidget()
@@ -676,8 +798,28 @@ class MainWindow(QMainWindow):
         self.solve_button.clicked.connect(self.solve_color)
         self.recipe_buttons_layout.addWidget( self.solve_button )
 
+        self.nudge_button = QPushButton('Nudge')
+        self.nudge_button.clicked.connect(self.nudge_color)
+        self.recipe_buttons_layout.addWidget( self.nudge_button )
+
         self.list_recipes_group_box_layout.addWidget( self.recipe_buttons_group )
 
+        # why a solve came back with nothing (eg. the target is out of the paints' gamut)
+        self.solve_status = QLabel( "" )
+        self.solve_status.setWordWrap( True )
+        self.solve_status.hide()
+        self.list_recipes_group_box_layout.addWidget( self.solve_status )
+
+        self.nudge_item = None
+        self.nudge_thread = None
+        self.nudge_target = None
+        self.nudge_pending = False
+
+        # the colour dialog fires on every drag step, the nudge only runs once the colour settles
+        self.nudge_timer = QTimer( self )
+        self.nudge_timer.setSingleShot( True )
+        self.nudge_timer.timeout.connect( self.nudge_color )
+
         self.paintRecipeList = QListWidget()
         self.paintRecipeList.setSpacing( 2 )
         self.paintRecipeList.setStyleSheet("""
@@ -691,12 +833,24 @@ class MainWindow(QMainWindow):
         # init paints list        
         self.populate_all_paints_list()
 
+        if LIBRARY_WATCH_INTERVAL:
+            data_directories = sorted( { os.path.dirname( file_path ) for file_path in self.paint_database.file_measurments.keys() } )
+            self.library_watcher = PaintMixing.PaintDatabaseWatcher( self.paint_database, data_directories, on_change = self.paint_library_changed, on_error = self.paint_library_error )
+
+            # polled on the UI thread, so the database never changes under a running slot
+            self.library_watch_timer = QTimer( self )
+            self.library_watch_timer.timeout.connect( self.library_watcher.poll )
+            self.library_watch_timer.start( int( LIBRARY_WATCH_INTERVAL * 1000 ) )
+
+    def closeEvent( self, event ):
+        self.executor.close()
+        super().closeEvent( event )
+
     def populate_all_paints_list(self):
         base_paints = self.paint_database.get_base_paints()
 
         for i, paint in enumerate( base_paints ):
-             rgb = PaintMixing.Colorimetry.reflectance_to_rgb( self.paint_database.get_paint(paint)["reflectance"] )
-             bg_color = QColor.fromRgb( int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255) )
+             bg_color = QColor.fromRgb( *self.paint_database.get_colorimetry( paint )["swatch"] )
 
              item = QListWidgetItem(self.list_allPaints)
              custom_widget = BasePaintListItem(f"{paint}\n" + get_color_desc( bg_color ), bg_color)
@@ -708,6 +862,35 @@ class MainWindow(QMainWindow):
 
              self.all_paints[paint] = item
 
+
+    def paint_library_error( self, message ):
+        # a measurement file that changed into something that can't be used; the paints stay as they were
+        self.statusBar().showMessage( message )
+
+    def paint_library_changed( self, refitted_paints ):
+        self.statusBar().clearMessage()
+
+        # keep the check boxes of the paints that are still there, new paints come in checked
+        checked = { paint_name : self.list_allPaints.itemWidget( item ).checkbox.isChecked() for paint_name, item in self.all_paints.items() }
+
+        self.list_allPaints.clear()
+        self.all_paints = {}
+        self.populate_all_paints_list()
+
+        for paint_name, item in self.all_paints.items():
+            self.list_allPaints.itemWidget( item ).checkbox.setChecked( checked.get( paint_name, True ) )
+
+        # used paints that changed get re-added with their new colours, the ones that are gone are dropped
+        if any( paint_name in refitted_paints for paint_name in self.used_paints.keys() ):
+            base_paints = self.paint_database.get_base_paints()
+            components = [ ( paint_name, self.list_usedPaints.itemWidget( item ).slider.value() / PAINT_AMOUNT_SLIDER_SCALE ) for paint_name, item in self.used_paints.items() ]
+
+            self.remove_all_used_paints()
+            for paint_name, amount in components:
+                if paint_name in base_paints:
+                    self.add_used_paint( paint_name, amount )
+
+        self.locus_plot.remove_gamut( "paints" )
     
     def dropToAllPainsList( self, event ):
         if event.source() == self.list_usedPaints:
@@ -726,8 +909,7 @@ class MainWindow(QMainWindow):
         if paint_name in self.used_paints.keys():
             return 
 
-        rgb = PaintMixing.Colorimetry.reflectance_to_rgb( self.paint_database.get_paint(paint_name)["reflectance"] )
-        bg_color = QColor.fromRgb( int(rgb[0] * 255), int(rgb[1] * 255), int(rgb[2] * 255) )
+        bg_color = QColor.fromRgb( *self.paint_database.get_colorimetry( paint_name )["swatch"] )
 
         item = QListWidgetItem(self.list_usedPaints)             
         custom_widget = UsedPaintListItem(paint_name, bg_color)             
@@ -742,7 +924,7 @@ class MainWindow(QMainWindow):
         self.used_paints[paint_name] = item
 
         self.spectra_plot.add_data( paint_name, self.paint_database.get_paint(paint_name)["reflectance"], bg_color )
-        self.locus_plot.add_data( paint_name, self.paint_database.get_paint(paint_name)["reflectance"], bg_color )
+        self.locus_plot.add_data_xy( paint_name, self.paint_database.get_colorimetry( paint_name )["xy"], bg_color )
         self.mixing_ratios_changed()
     
     def remove_used_paint( self, paint_name ):
@@ -768,7 +950,7 @@ class MainWindow(QMainWindow):
     def used_paint_flipped( self, paint_name, bg_color, state ):
         if state:
             self.spectra_plot.add_data( paint_name, self.paint_database.get_paint(paint_name)["reflectance"], bg_color )
-            self.locus_plot.add_data( paint_name, self.paint_database.get_paint(paint_name)["reflectance"], bg_color )
+            self.locus_plot.add_data_xy( paint_name, self.paint_database.get_colorimetry( paint_name )["xy"], bg_color )
         else:
             self.spectra_plot.remove_data( paint_name )
             self.locus_plot.remove_data( paint_name )                    
@@ -801,15 +983,100 @@ class MainWindow(QMainWindow):
 
     def recipe_picked( self, components ):
         self.remove_all_used_paints()
+        # only the ratios matter, and the sliders go up to 1 (recipes in parts don't)
+        max_amount = max( [ amount for _, amount in components ], default = 1.0 )
+        scale = 1.0 / max_amount if max_amount > 1.0 else 1.0
         for paint, amount in components:
-            self.add_used_paint( paint, amount )
+            self.add_used_paint( paint, amount * scale )
 
     def pick_color(self):        
-        color = QColorDialog.getColor()
-        if color.isValid():
+        dialog = QColorDialog( self.picked_color.color, self )
+        if NUDGE_WHILE_PICKING:
+            dialog.currentColorChanged.connect( self.schedule_nudge )
+
+        if dialog.exec_():
+            color = dialog.selectedColor()
+            self.target_spectrum = None
             self.picked_color.update_color( color )            
             self.locus_plot.add_data_rgb( "target", color )
 
+        # the dialog is closed, the nudge goes back to the picked colour
+        if NUDGE_WHILE_PICKING:
+            self.nudge_timer.stop()
+            self.nudge_target = None
+            self.nudge_color()
+
+    def schedule_nudge( self, color ):
+        self.nudge_target = QColor( color )
+        self.nudge_timer.start( int( NUDGE_DEBOUNCE_INTERVAL * 1000 ) )
+
+    def nudge_color( self, target_color = None ):
+        # the smallest additions to the mix on the sliders that match the target (the picked colour, or the one
+        # being picked), shown on top of the recipe list; the correction runs on its own thread
+        if isinstance( target_color, QColor ):
+            self.nudge_target = target_color
+        target_color = self.nudge_target if self.nudge_target is not None else self.picked_color.color
+
+        # one correction at a time, a newer target waits for the running one and then goes with the latest colour
+        if self.nudge_thread is not None:
+            self.nudge_pending = True
+            return
+        self.nudge_pending = False
+
+        current_paints = [ paint_name for paint_name in self.used_paints.keys() ]
+        current_amounts = [ self.list_usedPaints.itemWidget( self.used_paints[paint_name] ).slider.value() / PAINT_AMOUNT_SLIDER_SCALE for paint_name in current_paints ]
+        paints_to_use = [paint_name for paint_name in self.all_paints.keys() if self.list_allPaints.itemWidget( self.all_paints[paint_name] ).checkbox.isChecked()]
+
+        target_rgb = np.array( ( target_color.red(), target_color.green(), target_color.blue() ) ) / 255.0
+        optimizer = PaintMixing.RecipeOptimizer( self.paint_database.get_all_paints(), target_rgb, self.paint_database.get_mixing_model(), SOLVER_ILLUMINANTS, SOLVER_ILLUMINANT_ERROR )
+
+        self.nudge_worker = MixCorrectorWorker( optimizer, paints_to_use, current_paints, current_amounts )
+        self.nudge_thread = QThread()
+        self.nudge_worker.moveToThread( self.nudge_thread )
+
+        self.nudge_thread.started.connect( self.nudge_worker.run )
+        self.nudge_worker.finished.connect( self.nudge_thread.quit )
+        self.nudge_worker.finished.connect( self.nudge_worker.deleteLater )
+        self.nudge_thread.finished.connect( self.nudge_thread.deleteLater )
+        self.nudge_worker.corrected.connect( lambda corrections: self.nudge_corrected( corrections, target_color ) )
+        self.nudge_thread.finished.connect( self.nudge_finished )
+
+        self.nudge_thread.start()
+
+    def nudge_finished( self ):
+        self.nudge_thread = None
+        if self.nudge_pending:
+            self.nudge_color()
+
+    def nudge_corrected( self, corrections, target_color ):
+        # a correction for a colour that's been moved on from is dropped, the pending one replaces it
+        if self.nudge_pending:
+            return
+
+        if self.nudge_item is not None:
+            self.paintRecipeList.takeItem( self.paintRecipeList.row( self.nudge_item ) )
+            self.nudge_item = None
+
+        if len( corrections ) == 0:
+            return
+
+        self.nudge_item = QListWidgetItem()
+        self.paintRecipeList.insertItem( 0, self.nudge_item )
+        custom_widget = PaintRecipeListItem( target_color, self.paint_database, self.nudge_item )
+        custom_widget.set_recipe_picked_handler( self.recipe_picked )
+
+        for correction_index, ( mixed_rgb, diff, paint_set, amounts, additions ) in enumerate( corrections[:3] ):
+            custom_widget.add_recipe( "nudge/{}".format( correction_index ), list( zip( paint_set, amounts ) ), dict( zip( paint_set, additions ) ) )
+
+        self.paintRecipeList.setItemWidget( self.nudge_item, custom_widget )
+
+    def spectrum_dropped( self, name, spectrum ):
+        # a dropped spectrum becomes the target: the solver matches the spectrum itself, not just its colour
+        self.target_spectrum = spectrum
+        color = QColor.fromRgbF( *PaintMixing.Colorimetry.reflectance_to_rgb( spectrum ) )
+        self.picked_color.update_color( color )
+        self.locus_plot.add_data_rgb( "target", color )
+
     def solve_color(self):
         target_color = self.picked_color.color
 
@@ -817,11 +1084,28 @@ class MainWindow(QMainWindow):
         self.solve_button.setText( "Solving (0/{})...".format( MAX_NUM_PAINTS_IN_RECIPE ) )
 
         self.paintRecipeList.clear()
+        self.nudge_item = None
+        self.solve_status.hide()
 
-        target_rgb = np.array( ( target_color.red(), target_color.green(), target_color.blue() ) ) / 255.0
+        target_rgb_int = ( target_color.red(), target_color.green(), target_color.blue() )
+        target_rgb = np.array( target_rgb_int ) / 255.0
         paints_to_use = [paint_name for paint_name in self.all_paints.keys() if self.list_allPaints.itemWidget( self.all_paints[paint_name] ).checkbox.isChecked()]
 
-        self.worker = RecipeSolverWorker( target_rgb, self.paint_database, paints_to_use )
+        # recipes solved before for this target come straight from the store, only the missing sizes get solved
+        target_spectrum = self.target_spectrum
+        cached_recipes = self.recipe_store.lookup( target_rgb_int, paints_to_use, MAX_NUM_PAINTS_IN_RECIPE, self.paint_database.get_hash( paints_to_use ), get_solver_objective( target_spectrum ) )
+
+        # what the checked paints can mix at all
+        if len( paints_to_use ) > 0:
+            self.locus_plot.set_gamut_outline( "paints", PaintMixing.get_gamut( self.paint_database, paints_to_use, SOLVER_SPECTRAL_DELTA_E ).xy_boundary )
+        self.locus_plot.remove_data( "nearest" )
+
+        # with whole parts, every paint takes at least one part, so recipes of more paints than parts are never solved
+        max_num_paints = min( MAX_NUM_PAINTS_IN_RECIPE, SOLVER_MAX_TOTAL_PARTS ) if SOLVER_MAX_TOTAL_PARTS else MAX_NUM_PAINTS_IN_RECIPE
+        recipe_sizes = [ num_paints for num_paints in range( 1, max_num_paints + 1 ) if num_paints not in cached_recipes ]
+
+        # the worker hands the stored recipes back first, with their robustness, then solves the rest
+        self.worker = RecipeSolverWorker( target_rgb, self.paint_database, paints_to_use, recipe_sizes, target_spectrum, self.executor, cached_recipes )
         self.thread = QThread()
         self.worker.moveToThread( self.thread )
 
@@ -829,17 +1113,30 @@ class MainWindow(QMainWindow):
         self.worker.finished.connect(self.thread.quit)
         self.worker.finished.connect(self.worker.deleteLater)
         self.thread.finished.connect(self.thread.deleteLater)
-        self.worker.progress.connect(lambda three_best: self.add_solved_recipe( three_best, target_color ) )
+        self.worker.progress.connect(lambda three_best, robustness: self.recipe_solved( three_best, robustness, target_color, paints_to_use, target_spectrum ) )
+        self.worker.cached.connect(lambda three_best, robustness: self.add_solved_recipe( three_best, target_color, robustness ) )
+        self.worker.out_of_gamut.connect( self.target_out_of_gamut )
 
         self.thread.start()
 
         self.thread.finished.connect( self.solve_finished )
 
+    def target_out_of_gamut( self, nearest_rgb, message ):
+        self.solve_status.setText( message )
+        self.solve_status.show()
+        self.locus_plot.add_data_rgb( "nearest", QColor.fromRgbF( *nearest_rgb ) )
+
     def solve_finished( self ):
         self.solve_button.setEnabled( True )
         self.solve_button.setText( "Solve" )
 
-    def add_solved_recipe( self, num_paints_three_best, target_color ):
+    def recipe_solved( self, num_paints_three_best, robustness, target_color, paints_to_use, target_spectrum = None ):
+        target_rgb_int = ( target_color.red(), target_color.green(), target_color.blue() )
+        self.recipe_store.store( target_rgb_int, paints_to_use, self.paint_database.get_hash( paints_to_use ), num_paints_three_best[0], num_paints_three_best[1:], get_solver_objective( target_spectrum ) )
+
+        self.add_solved_recipe( num_paints_three_best, target_color, robustness )
+
+    def add_solved_recipe( self, num_paints_three_best, target_color, robustness = None ):
         num_paints = num_paints_three_best[0] 
         
         self.solve_button.setText( "Solving ({}/{})...".format( num_paints, MAX_NUM_PAINTS_IN_RECIPE ) )
@@ -857,7 +1154,8 @@ class MainWindow(QMainWindow):
             for i, paint in enumerate( best_mix[2] ):
                 recipe.append( ( paint, best_mix[3][i] ) )
 
-            custom_widget.add_recipe( "{}/{}".format( num_paints, recipe_index ), recipe )
+            custom_widget.add_recipe( "{}/{}".format( num_paints, recipe_index ), recipe, delta_e = best_mix[4] if len( best_mix ) > 4 else None,
+                                      robustness = robustness[recipe_index] if robustness else None )
 
         self.paintRecipeList.addItem(item)
         self.paintRecipeList.setItemWidget(item, custom_widget)            
@@ -866,24 +1164,69 @@ class MainWindow(QMainWindow):
 
 class RecipeSolverWorker(QObject):
     finished = pyqtSignal()
-    progress = pyqtSignal(list)
+    # [ num_paints, recipes... ], [ robustness of every recipe ]; cached are the stored recipes handed in, progress the solved ones
+    progress = pyqtSignal(list, list)
+    cached = pyqtSignal(list, list)
+    out_of_gamut = pyqtSignal(list, str)
 
-    def __init__( self, target_rgb, paint_database, paints_to_use ):
+    def __init__( self, target_rgb, paint_database, paints_to_use, recipe_sizes = None, target_spectrum = None, executor = None, cached_recipes = None ):
         super().__init__()
+        self.executor = executor
         self.target_rgb = target_rgb
         self.paint_database = paint_database
         self.paints_to_use = paints_to_use
+        self.recipe_sizes = recipe_sizes
+        self.target_spectrum = target_spectrum
+        self.cached_recipes = cached_recipes if cached_recipes else {}
 
     def run(self):
-        for num_paints in range( 1, MAX_NUM_PAINTS_IN_RECIPE + 1 ):
-            paint_combinations = list( combinations( self.paints_to_use, num_paints ) )
+        # the workers map the fitted library from a file rather than each unpickling a copy of the database
+        library = self.paint_database.get_mapped_library()
+
+        for num_paints in sorted( self.cached_recipes.keys() ):
+            three_best = self.cached_recipes[num_paints]
+            self.cached.emit( [ num_paints, *three_best ], get_recipes_robustness( library, three_best ) )
+
+        if self.recipe_sizes is not None and len( self.recipe_sizes ) == 0:
+            self.finished.emit()
+            return
+
+        if self.target_spectrum is not None:
+            # vectorized, fast enough without a pool
+            for num_paints, three_best in PaintMixing.solve_spectral_recipes( self.target_spectrum, self.paint_database, self.paints_to_use, MAX_NUM_PAINTS_IN_RECIPE, 3, self.recipe_sizes ):
+                self.progress.emit( [ num_paints, *three_best ], get_recipes_robustness( library, three_best ) )
 
-            with Pool(min( 61, os.cpu_count() )) as p:
-                results = p.map( PaintMixing.RecipeOptimizer( self.paint_database.get_all_paints(), self.target_rgb, self.paint_database.get_mixing_model() ), paint_combinations )
+            self.finished.emit()
+            return
 
-            three_best = heapq.nsmallest(3, results, key=lambda result: result[1])
-            self.progress.emit( [ num_paints, *three_best ] )
+        executor = self.executor if self.executor else PaintMixing.AdaptiveExecutor()
+        try:
+            for num_paints, three_best in PaintMixing.solve_recipes( self.target_rgb, library, self.paints_to_use, MAX_NUM_PAINTS_IN_RECIPE, 3, executor, SOLVER_ILLUMINANTS, SOLVER_ILLUMINANT_ERROR, self.recipe_sizes, SOLVER_PRESCREEN_TOP_M, SOLVER_SEARCH, max_total_parts = SOLVER_MAX_TOTAL_PARTS, gamut_tolerance = SOLVER_GAMUT_TOLERANCE, cluster_threshold = SOLVER_CLUSTER_THRESHOLD, spectral_delta_e = SOLVER_SPECTRAL_DELTA_E ):
+                self.progress.emit( [ num_paints, *three_best ], get_recipes_robustness( library, three_best ) )
+        except PaintMixing.OutOfGamutError as error:
+            self.out_of_gamut.emit( [ float( component ) for component in error.nearest_rgb ], str( error ) )
+        finally:
+            if executor is not self.executor:
+                executor.close()
+
+        self.finished.emit()
+
+
+class MixCorrectorWorker(QObject):
+    finished = pyqtSignal()
+    # [ ( mixed_rgb, diff, paint_set, amounts, additions ) ], the best correction first
+    corrected = pyqtSignal(list)
 
+    def __init__( self, optimizer, paints_to_use, current_paints, current_amounts ):
+        super().__init__()
+        self.optimizer = optimizer
+        self.paints_to_use = paints_to_use
+        self.current_paints = current_paints
+        self.current_amounts = current_amounts
+
+    def run(self):
+        corrections = PaintMixing.MixCorrector( self.optimizer, self.paints_to_use, NUDGE_MAX_EXTRA_PAINTS )( self.current_paints, self.current_amounts )
+        self.corrected.emit( corrections[:3] )
         self.finished.emit()
 
 
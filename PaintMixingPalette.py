@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import PaintMixing
+from PaintMixingCLI import read_targets
+from PaintMixingServer import recipe_to_json, parse_target
+from multiprocessing import Pool
+
+# which paints to bring for a whole palette: picks at most --max-paints of the paints so that as many of the targets
+# as possible mix within --delta-e (D65), then solves every target on them:
+#   python PaintMixingPalette.py palette.csv --max-paints 6 --delta-e 3
+#   python PaintMixingPalette.py palette.jsonl --data data/masstone.json data/mix1.json my_paints.json --spectral-delta-e 1 --out palette.json
+# targets are read like PaintMixingCLI.py reads them (CSV or JSONL, only the target of every line is used)
+
+
+def main( argv ):
+    bundle_dir = os.path.abspath( os.path.dirname( __file__ ) )
+
+    parser = argparse.ArgumentParser( description = "Pick the paints for a palette of target colours" )
+    parser.add_argument( "targets", help = "CSV or JSONL file with the targets, - for stdin" )
+    parser.add_argument( "--data", nargs = "+", default = [ os.path.join( bundle_dir, "data/masstone.json" ), os.path.join( bundle_dir, "data/mix1.json" ) ] )
+    parser.add_argument( "--paints", nargs = "+", default = None, help = "paints to choose from (all the base paints by default)" )
+    parser.add_argument( "--max-paints", type = int, default = 8, help = "paints in the palette" )
+    parser.add_argument( "--delta-e", type = float, default = 3.0, help = "a target counts as covered when it mixes within this delta E" )
+    parser.add_argument( "--max-recipe-paints", type = int, default = 3, help = "paints in the recipe of one target" )
+    parser.add_argument( "--candidates-per-target", type = int, default = 25 )
+    parser.add_argument( "--spectral-delta-e", type = float, default = None, help = "score the candidate recipes on a coarser spectral grid within this delta E" )
+    parser.add_argument( "--processes", type = int, default = None, help = "worker processes for the final solves, 0 solves everything in this process" )
+    parser.add_argument( "--out", default = None, help = "JSON output with the paints and the recipes" )
+    args = parser.parse_args( argv )
+
+    paint_database = PaintMixing.PaintDatabase( args.data )
+    paints = args.paints if args.paints else paint_database.get_base_paints()
+    jobs = read_targets( args.targets )
+    targets_rgb = [ np.array( parse_target( job["target"] ) ) / 255.0 for job in jobs ]
+
+    start = time.perf_counter()
+    try:
+        selector = PaintMixing.PaletteSelector( paint_database, paints, targets_rgb, args.max_paints, args.delta_e, args.max_recipe_paints,
+                                                candidates_per_target = args.candidates_per_target, spectral_delta_e = args.spectral_delta_e )
+    except ValueError as error:
+        parser.error( str( error ) )
+    scored = time.perf_counter()
+    chosen = selector.select()
+    selected = time.perf_counter()
+
+    processes = args.processes if args.processes is not None else min( 61, os.cpu_count() )
+    pool = Pool( processes ) if processes > 0 else None
+    try:
+        # the workers map the fitted library from a file rather than each unpickling a copy of the database
+        results = selector.solve( chosen, pool.map if pool else map, paint_database.get_mapped_library() if pool else None )
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    print( "paints: {}".format( ", ".join( chosen ) ) )
+    for job, ( recipe, delta_e ) in zip( jobs, results ):
+        print( "{:>10} {:>8.2f} {}{}".format( str( job["id"] ), delta_e, "  " if delta_e <= args.delta_e else "! ",
+                                             " + ".join( "{:.3f} {}".format( amount, paint ) for paint, amount in zip( recipe[2], recipe[3] ) ) if recipe else "not covered" ) )
+
+    covered = sum( delta_e <= args.delta_e for _, delta_e in results )
+    print( "{} of {} targets within delta E {:g}; scored in {:.2f} s, selected in {:.2f} s, solved in {:.2f} s".format(
+        covered, len( jobs ), args.delta_e, scored - start, selected - scored, time.perf_counter() - selected ), file = sys.stderr )
+
+    if args.out:
+        with open( args.out, "w" ) as out_file:
+            json.dump( { "paints" : chosen,
+                         "targets" : [ { "id" : job["id"], "delta_e" : delta_e if recipe else None, "recipe" : recipe_to_json( recipe ) if recipe else None } for job, ( recipe, delta_e ) in zip( jobs, results ) ] },
+                       out_file, indent = 2 )
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main( sys.argv[1:] )
@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import numbers
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+import PaintMixing
+from collections import OrderedDict
+from multiprocessing import Pool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# small local HTTP/JSON recipe service:
+#   GET  /paints  - base paints and the hash of the loaded library
+#   GET  /stats   - cache and request counters
+#   POST /solve   - { "target" : [ r, g, b ] or "#rrggbb", "paints" : [ ... ], "max_paints" : 4, "top_k" : 3 }
+#                   answers with newline delimited JSON, one line per recipe size, as soon as it's solved
+
+DEFAULT_PORT = 8642
+DEFAULT_CACHE_SIZE = 1024
+
+
+class SolveJob:
+    # one solve in flight; identical requests that arrive meanwhile subscribe to it instead of solving again
+    def __init__( self ):
+        self.results = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def add_result( self, result ):
+        with self.condition:
+            self.results.append( result )
+            self.condition.notify_all()
+
+    def finish( self, error = None ):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def stream( self ):
+        num_sent = 0
+
+        while True:
+            with self.condition:
+                while num_sent == len( self.results ) and not self.done:
+                    self.condition.wait()
+
+                pending = self.results[num_sent:]
+                done = self.done
+                error = self.error
+
+            for result in pending:
+                yield result
+            num_sent = num_sent + len( pending )
+
+            if done and num_sent == len( self.results ):
+                if error is not None:
+                    raise error
+                return
+
+
+class RecipeService:
+    def __init__( self, paint_database, processes = None, cache_size = DEFAULT_CACHE_SIZE, target_quantization = 1 ):
+        self.paint_database = paint_database
+        self.library = paint_database.get_mapped_library()
+        self.cache_size = cache_size
+        self.target_quantization = target_quantization
+
+        self.pool = Pool( processes if processes else min( 61, os.cpu_count() ) )
+
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.jobs = {}
+        self.stats = { "requests" : 0, "cache_hits" : 0, "coalesced" : 0, "solves" : 0 }
+
+    def close( self ):
+        self.pool.terminate()
+        self.pool.join()
+
+    def quantize_target( self, target_rgb ):
+        # targets are solved at the quantized colour, so whatever ends up in the cache is exact for its key
+        step = self.target_quantization
+        return tuple( int( min( 255, round( round( component / step ) * step ) ) ) for component in target_rgb )
+
+    def make_key( self, target_rgb, paints, max_num_paints, num_best ):
+        # only the parameters of the paints used go in, so cached results survive changes to the other paints
+        return ( self.quantize_target( target_rgb ), tuple( sorted( paints ) ), max_num_paints, num_best, self.library.get_hash( paints ) )
+
+    def library_changed( self, refitted_paints ):
+        # the database got updated (see PaintMixing.PaintDatabaseWatcher); requests only ever look at self.library,
+        # so they see either the old or the new library, never a half updated one
+        self.library = self.paint_database.get_mapped_library()
+
+    def solve( self, target_rgb, paints, max_num_paints = 4, num_best = 3 ):
+        # yields ( num_paints, recipes ) in order of recipe size, then whether the answer came from the cache
+        key = self.make_key( target_rgb, paints, max_num_paints, num_best )
+
+        with self.lock:
+            self.stats["requests"] = self.stats["requests"] + 1
+
+            cached = self.cache.get( key )
+            if cached is not None:
+                self.cache.move_to_end( key )
+                self.stats["cache_hits"] = self.stats["cache_hits"] + 1
+            else:
+                job = self.jobs.get( key )
+                if job is None:
+                    job = SolveJob()
+                    self.jobs[key] = job
+                    self.stats["solves"] = self.stats["solves"] + 1
+
+                    # solve on a separate thread, so the result still lands in the cache when the client hangs up
+                    threading.Thread( target = self.run_job, args = ( key, job ), daemon = True ).start()
+                else:
+                    self.stats["coalesced"] = self.stats["coalesced"] + 1
+
+        if cached is not None:
+            for result in cached:
+                yield result
+            return
+
+        for result in job.stream():
+            yield result
+
+    def run_job( self, key, job ):
+        target, paints, max_num_paints, num_best, _ = key
+        target_rgb = np.array( target ) / 255.0
+
+        try:
+            for num_paints, best in PaintMixing.solve_recipes( target_rgb, self.library, list( paints ), max_num_paints, num_best, self.pool.map ):
+                job.add_result( ( num_paints, [ recipe_to_json( recipe ) for recipe in best ] ) )
+        except Exception as error:
+            with self.lock:
+                del self.jobs[key]
+            job.finish( error )
+            return
+
+        with self.lock:
+            self.cache[key] = list( job.results )
+            while len( self.cache ) > self.cache_size:
+                self.cache.popitem( last = False )
+            del self.jobs[key]
+
+        job.finish()
+
+    def get_stats( self ):
+        with self.lock:
+            return { **self.stats, "cached" : len( self.cache ), "in_flight" : len( self.jobs ) }
+
+
+def recipe_to_json( recipe ):
+    # parts recipes ( solve_recipes with max_total_parts ) carry their delta E as a fifth item
+    mixed_rgb, diff, paint_set, weights = recipe[:4]
+    result = { "rgb" : [ int( round( component * 255 ) ) for component in mixed_rgb ],
+               "error" : float( diff ),
+               "paints" : [ { "name" : paint, "amount" : float( amount ) } for paint, amount in zip( paint_set, weights ) ] }
+    if len( recipe ) > 4:
+        result["delta_e"] = float( recipe[4] )
+    return result
+
+
+def parse_target( target ):
+    # anything malformed is a ValueError, so a bad job becomes an error record instead of taking its batch down
+    if isinstance( target, str ):
+        target = target.lstrip( "#" )
+        if len( target ) != 6:
+            raise ValueError( "target colour has to be #rrggbb" )
+        return [ int( target[i:i + 2], 16 ) for i in ( 0, 2, 4 ) ]
+
+    if not isinstance( target, ( list, tuple ) ) or len( target ) != 3:
+        raise ValueError( "target colour has to be #rrggbb or three values in 0-255" )
+
+    if any( isinstance( component, bool ) or not isinstance( component, numbers.Real ) or not ( 0 <= component <= 255 ) for component in target ):
+        raise ValueError( "target colour has to be three values in 0-255" )
+
+    return [ float( component ) for component in target ]
+
+
+class RecipeRequestHandler( BaseHTTPRequestHandler ):
+    protocol_version = "HTTP/1.1"
+
+    # set by serve()
+    service = None
+
+    def send_json( self, status, data ):
+        body = json.dumps( data ).encode( "utf-8" )
+        self.send_response( status )
+        self.send_header( "Content-Type", "application/json" )
+        self.send_header( "Content-Length", str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+
+    def send_chunk( self, data ):
+        line = ( json.dumps( data ) + "\n" ).encode( "utf-8" )
+        self.wfile.write( "{:X}\r\n".format( len( line ) ).encode( "ascii" ) + line + b"\r\n" )
+        self.wfile.flush()
+
+    def do_GET( self ):
+        if self.path == "/paints":
+            library = self.service.library
+            self.send_json( 200, { "paints" : library.get_base_paints(), "hash" : library.get_hash() } )
+        elif self.path == "/stats":
+            self.send_json( 200, self.service.get_stats() )
+        else:
+            self.send_json( 404, { "error" : "unknown endpoint" } )
+
+    def do_POST( self ):
+        if self.path != "/solve":
+            self.send_json( 404, { "error" : "unknown endpoint" } )
+            return
+
+        try:
+            request = json.loads( self.rfile.read( int( self.headers.get( "Content-Length", 0 ) ) ) )
+
+            target = parse_target( request["target"] )
+            paints = request.get( "paints", self.service.library.get_base_paints() )
+            max_num_paints = int( request.get( "max_paints", 4 ) )
+            num_best = int( request.get( "top_k", 3 ) )
+
+            unknown_paints = [ paint for paint in paints if paint not in self.service.library.get_base_paints() ]
+            if unknown_paints:
+                raise ValueError( "unknown paints: {}".format( ", ".join( unknown_paints ) ) )
+            if max_num_paints < 1 or num_best < 1:
+                raise ValueError( "max_paints and top_k have to be positive" )
+        except ( KeyError, TypeError, ValueError ) as error:
+            self.send_json( 400, { "error" : str( error ) } )
+            return
+
+        self.send_response( 200 )
+        self.send_header( "Content-Type", "application/x-ndjson" )
+        self.send_header( "Transfer-Encoding", "chunked" )
+        self.end_headers()
+
+        try:
+            for num_paints, recipes in self.service.solve( target, paints, max_num_paints, num_best ):
+                self.send_chunk( { "num_paints" : num_paints, "recipes" : recipes } )
+            self.send_chunk( { "done" : True } )
+        except ( BrokenPipeError, ConnectionResetError ):
+            return
+        except Exception as error:
+            self.send_chunk( { "error" : str( error ) } )
+
+        self.wfile.write( b"0\r\n\r\n" )
+        self.wfile.flush()
+
+    def log_message( self, format, *args ):
+        pass
+
+
+def serve( service, host = "127.0.0.1", port = DEFAULT_PORT ):
+    handler = type( "BoundRecipeRequestHandler", ( RecipeRequestHandler, ), { "service" : service } )
+    return ThreadingHTTPServer( ( host, port ), handler )
+
+
+def main( argv ):
+    bundle_dir = os.path.abspath( os.path.dirname( __file__ ) )
+
+    parser = argparse.ArgumentParser( description = "Local paint recipe solving service" )
+    parser.add_argument( "--host", default = "127.0.0.1" )
+    parser.add_argument( "--port", type = int, default = DEFAULT_PORT )
+    parser.add_argument( "--data", nargs = "+", default = [ os.path.join( bundle_dir, "data/masstone.json" ), os.path.join( bundle_dir, "data/mix1.json" ) ] )
+    parser.add_argument( "--processes", type = int, default = None )
+    parser.add_argument( "--cache-size", type = int, default = DEFAULT_CACHE_SIZE )
+    parser.add_argument( "--quantization", type = int, default = 1, help = "targets are snapped to multiples of this (in 0-255 units) before solving and caching" )
+    parser.add_argument( "--watch", nargs = "*", default = None, metavar = "DIRECTORY", help = "reload measurement files when they change (and pick up new ones from the given directories)" )
+    args = parser.parse_args( argv )
+
+    paint_database = PaintMixing.PaintDatabase( args.data )
+    service = RecipeService( paint_database, args.processes, args.cache_size, args.quantization )
+    server = serve( service, args.host, args.port )
+    watcher = PaintMixing.PaintDatabaseWatcher( paint_database, args.watch, on_change = service.library_changed,
+                                                on_error = lambda message: print( message, file = sys.stderr ) ).start() if args.watch is not None else None
+
+    print( "serving recipes on http://{}:{}".format( *server.server_address ) )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if watcher:
+            watcher.stop()
+        service.close()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main( sys.argv[1:] )
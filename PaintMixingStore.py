@@ -0,0 +1,131 @@
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+import PaintMixing
+
+# persistent store of solved recipes (SQLite); one row per target colour, paint set, library,
+# solver objective and recipe size, so a solve that gets interrupted still keeps the sizes it finished,
+# and a solve with a bigger MAX_NUM_PAINTS_IN_RECIPE can reuse the smaller sizes
+
+DEFAULT_MAX_ENTRIES = 20000
+
+
+class RecipeStore:
+    def __init__( self, path, max_entries = DEFAULT_MAX_ENTRIES, quantization = 1 ):
+        self.max_entries = max_entries
+        self.quantization = quantization
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect( path, check_same_thread = False )
+        self.connection.executescript( """
+            CREATE TABLE IF NOT EXISTS recipes (
+                target_r INTEGER NOT NULL,
+                target_g INTEGER NOT NULL,
+                target_b INTEGER NOT NULL,
+                lab_L REAL NOT NULL,
+                lab_a REAL NOT NULL,
+                lab_b REAL NOT NULL,
+                paints TEXT NOT NULL,
+                library_hash TEXT NOT NULL,
+                objective TEXT NOT NULL,
+                num_paints INTEGER NOT NULL,
+                num_best INTEGER NOT NULL,
+                recipes TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY ( target_r, target_g, target_b, paints, library_hash, objective, num_paints ) );
+            CREATE INDEX IF NOT EXISTS recipes_by_lightness ON recipes ( paints, library_hash, objective, lab_L );
+            CREATE INDEX IF NOT EXISTS recipes_by_use ON recipes ( last_used );
+            """ )
+        self.connection.commit()
+
+    def close( self ):
+        with self.lock:
+            self.connection.close()
+
+    def quantize_target( self, target_rgb ):
+        # target in 0-255
+        step = self.quantization
+        return tuple( int( min( 255, round( round( component / step ) * step ) ) ) for component in target_rgb )
+
+    def paints_key( self, paints ):
+        return json.dumps( sorted( paints ) )
+
+    def lookup( self, target_rgb, paints, max_num_paints, library_hash, objective = "srgb", num_best = 3 ):
+        # returns { num_paints : recipes } for all the sizes up to max_num_paints that are already solved
+        target = self.quantize_target( target_rgb )
+
+        with self.lock:
+            rows = self.connection.execute( """
+                SELECT num_paints, recipes FROM recipes
+                WHERE target_r = ? AND target_g = ? AND target_b = ? AND paints = ? AND library_hash = ? AND objective = ?
+                      AND num_paints <= ? AND num_best >= ?""",
+                ( *target, self.paints_key( paints ), library_hash, objective, max_num_paints, num_best ) ).fetchall()
+
+            if rows:
+                self.connection.execute( """
+                    UPDATE recipes SET last_used = ?
+                    WHERE target_r = ? AND target_g = ? AND target_b = ? AND paints = ? AND library_hash = ? AND objective = ?""",
+                    ( time.time(), *target, self.paints_key( paints ), library_hash, objective ) )
+                self.connection.commit()
+
+        return { num_paints : recipes_from_json( recipes )[:num_best] for num_paints, recipes in rows }
+
+    def store( self, target_rgb, paints, library_hash, num_paints, recipes, objective = "srgb" ):
+        target = self.quantize_target( target_rgb )
+        target_lab = rgb_to_lab( target )
+
+        with self.lock:
+            self.connection.execute( """
+                INSERT OR REPLACE INTO recipes
+                ( target_r, target_g, target_b, lab_L, lab_a, lab_b, paints, library_hash, objective, num_paints, num_best, recipes, last_used )
+                VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )""",
+                ( *target, *target_lab, self.paints_key( paints ), library_hash, objective, num_paints, len( recipes ), recipes_to_json( recipes ), time.time() ) )
+            self.evict()
+            self.connection.commit()
+
+    def evict( self ):
+        # least recently used rows go first
+        num_entries = self.connection.execute( "SELECT COUNT(*) FROM recipes" ).fetchone()[0]
+        if num_entries > self.max_entries:
+            self.connection.execute( "DELETE FROM recipes WHERE rowid IN ( SELECT rowid FROM recipes ORDER BY last_used LIMIT ? )", ( num_entries - self.max_entries, ) )
+
+    def nearest( self, target_rgb, paints, library_hash, objective = "srgb", max_delta_e = 5.0, limit = 1 ):
+        # closest already solved targets for the same paints and library, as [ ( target_rgb, delta_e, { num_paints : recipes } ) ]
+        target_lab = np.array( rgb_to_lab( self.quantize_target( target_rgb ) ) )
+
+        with self.lock:
+            rows = self.connection.execute( """
+                SELECT target_r, target_g, target_b, lab_L, lab_a, lab_b, num_paints, recipes FROM recipes
+                WHERE paints = ? AND library_hash = ? AND objective = ? AND lab_L BETWEEN ? AND ?
+                      AND lab_a BETWEEN ? AND ? AND lab_b BETWEEN ? AND ?""",
+                ( self.paints_key( paints ), library_hash, objective,
+                  target_lab[0] - max_delta_e, target_lab[0] + max_delta_e,
+                  target_lab[1] - max_delta_e, target_lab[1] + max_delta_e,
+                  target_lab[2] - max_delta_e, target_lab[2] + max_delta_e ) ).fetchall()
+
+        matches = {}
+        for r, g, b, lab_L, lab_a, lab_b, num_paints, recipes in rows:
+            delta_e = float( np.linalg.norm( np.array( ( lab_L, lab_a, lab_b ) ) - target_lab ) )
+            if delta_e <= max_delta_e:
+                matches.setdefault( ( r, g, b ), ( delta_e, {} ) )[1][num_paints] = recipes_from_json( recipes )
+
+        nearest = sorted( matches.items(), key = lambda match: match[1][0] )[:limit]
+        return [ ( target, delta_e, recipes ) for target, ( delta_e, recipes ) in nearest ]
+
+
+def rgb_to_lab( target_rgb ):
+    r, g, b = PaintMixing.Colorimetry.rgb_int_to_float( *np.array( target_rgb, dtype = float ) )
+    x, y, z = PaintMixing.Colorimetry.rgb_to_xyz( r, g, b )
+    return tuple( float( value ) for value in PaintMixing.Colorimetry.xyz_to_Lab( x * 100.0, y * 100.0, z * 100.0 ) )
+
+
+def recipes_to_json( recipes ):
+    # a parts recipe's delta E (its fifth item) is stored after the weights
+    return json.dumps( [ [ [ float( c ) for c in mixed_rgb ], float( diff ), list( paint_set ), [ float( w ) for w in weights ], *( float( extra ) for extra in extras ) ]
+                         for mixed_rgb, diff, paint_set, weights, *extras in recipes ] )
+
+
+def recipes_from_json( text ):
+    return [ ( np.array( mixed_rgb ), diff, tuple( paint_set ), np.array( weights ), *extras ) for mixed_rgb, diff, paint_set, weights, *extras in json.loads( text ) ]
@@ -0,0 +1,22 @@
+import os
+import pytest
+import PaintMixing
+
+DATA_DIR = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), "data" )
+
+
+@pytest.fixture( scope = "session" )
+def paint_database():
+    return PaintMixing.PaintDatabase( [ os.path.join( DATA_DIR, "masstone.json" ), os.path.join( DATA_DIR, "mix1.json" ) ] )
+
+
+@pytest.fixture( scope = "session" )
+def mapped_library_root( tmp_path_factory ):
+    return str( tmp_path_factory.mktemp( "libraries" ) )
+
+
+@pytest.fixture( autouse = True )
+def mapped_library_directory( mapped_library_root, monkeypatch ):
+    # exported libraries go to a temporary directory rather than the user's ~/.paintmixing
+    monkeypatch.setattr( PaintMixing, "MAPPED_LIBRARY_DIRECTORY", mapped_library_root )
+    return mapped_library_root
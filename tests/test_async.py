@@ -0,0 +1,86 @@
+import time
+import asyncio
+import threading
+import numpy as np
+import pytest
+import PaintMixing
+import PaintMixingAsync
+from concurrent.futures import ThreadPoolExecutor
+
+PAINTS = [ "white", "violet", "cold yellow", "magenta", "black", "blue green shade" ]
+TARGET = np.array( [ 0.5, 0.25, 0.63 ] )
+
+
+class CountingExecutor( ThreadPoolExecutor ):
+    # how many submitted chunks haven't finished yet, and the most there ever were
+    def __init__( self, max_workers ):
+        super().__init__( max_workers )
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.finished = 0
+
+    def submit( self, *args, **kwargs ):
+        with self.lock:
+            self.in_flight = self.in_flight + 1
+            self.peak = max( self.peak, self.in_flight )
+        future = super().submit( *args, **kwargs )
+        future.add_done_callback( self.chunk_done )
+        return future
+
+    def chunk_done( self, future ):
+        with self.lock:
+            self.in_flight = self.in_flight - 1
+            self.finished = self.finished + ( not future.cancelled() )
+
+
+@pytest.fixture
+def slow_chunks( monkeypatch ):
+    optimize_chunk = PaintMixingAsync.optimize_chunk
+
+    def slow_optimize_chunk( optimizer, paint_combinations ):
+        time.sleep( 0.05 )
+        return optimize_chunk( optimizer, paint_combinations )
+
+    monkeypatch.setattr( PaintMixingAsync, "optimize_chunk", slow_optimize_chunk )
+
+
+def test_results_match_solve_recipes( paint_database ):
+    async def solve():
+        with CountingExecutor( 2 ) as executor:
+            async with PaintMixingAsync.AsyncRecipeSolver( paint_database, executor, max_in_flight = 3, chunk_size = 4 ) as solver:
+                return await solver.solve( TARGET, PAINTS, 3, 2 ), executor.peak
+
+    results, peak = asyncio.run( solve() )
+    expected = list( PaintMixing.solve_recipes( TARGET, paint_database, PAINTS, 3, 2 ) )
+
+    assert peak <= 3
+    assert [ num_paints for num_paints, _ in results ] == [ num_paints for num_paints, _ in expected ]
+    for ( _, best ), ( _, expected_best ) in zip( results, expected ):
+        assert [ tuple( recipe[2] ) for recipe in best ] == [ tuple( recipe[2] ) for recipe in expected_best ]
+        # solve_recipes takes single paints' colours from the library's colorimetry, integrated a little differently
+        np.testing.assert_allclose( [ recipe[1] for recipe in best ], [ recipe[1] for recipe in expected_best ], atol = 1e-3 )
+
+
+def test_cancelling_keeps_running_chunks_counted( paint_database, slow_chunks ):
+    async def solve():
+        with CountingExecutor( 2 ) as executor:
+            solver = PaintMixingAsync.AsyncRecipeSolver( paint_database, executor, max_in_flight = 3, chunk_size = 1 )
+            cancelled = asyncio.create_task( solver.solve( TARGET, PAINTS, 3, 1 ) )
+            while executor.in_flight < 3:
+                await asyncio.sleep( 0.001 )
+
+            cancelled.cancel()
+            with pytest.raises( asyncio.CancelledError ):
+                await cancelled
+
+            # the two chunks that were already running still count against max_in_flight for the next solve
+            results = await solver.solve( TARGET, PAINTS[:3], 2, 1 )
+            return results, executor.peak, executor.finished
+
+    results, peak, finished = asyncio.run( solve() )
+
+    assert peak <= 3
+    assert [ num_paints for num_paints, _ in results ] == [ 1, 2 ]
+    # the cancelled solve stopped submitting: its chunks that ran plus the second solve's 6 is far fewer than its own 41
+    assert finished < 6 + 10
@@ -0,0 +1,36 @@
+import json
+import PaintMixingCLI
+
+
+def test_bad_target_becomes_an_error_record( tmp_path, capsys ):
+    targets_path = tmp_path / "targets.jsonl"
+    targets_path.write_text( json.dumps( { "id" : "a", "target" : "#8040a0" } ) + "\n" + json.dumps( { "id" : "b", "target" : 5 } ) + "\n" )
+    out_path = tmp_path / "recipes.jsonl"
+
+    PaintMixingCLI.main( [ str( targets_path ), "--max-num-paints", "2", "--num-best", "2", "--processes", "0", "--out", str( out_path ) ] )
+
+    records = { record["id"] : record for record in ( json.loads( line ) for line in out_path.read_text().splitlines() ) }
+    assert sorted( records.keys() ) == [ "a", "b" ]
+
+    assert records["a"]["target"] == "#8040a0"
+    assert "error" not in records["a"]
+    assert sorted( records["a"]["recipes"].keys() ) == [ "1", "2" ]
+    assert all( len( recipes ) == 2 for recipes in records["a"]["recipes"].values() )
+
+    assert "recipes" not in records["b"]
+    assert records["b"]["error"].startswith( "ValueError" )
+    assert "solved 2 targets" in capsys.readouterr().err
+
+
+def test_pool_and_inline_runs_agree( tmp_path ):
+    targets_path = tmp_path / "targets.csv"
+    targets_path.write_text( "id,hex\nx,#3c6e46\ny,#e6d2aa\n" )
+
+    outputs = []
+    for processes in ( "0", "2" ):
+        out_path = tmp_path / "recipes{}.jsonl".format( processes )
+        PaintMixingCLI.main( [ str( targets_path ), "--max-num-paints", "2", "--processes", processes, "--out", str( out_path ) ] )
+        outputs.append( [ { key : value for key, value in json.loads( line ).items() if key != "seconds" } for line in out_path.read_text().splitlines() ] )
+
+    assert outputs[0] == outputs[1]
+    assert [ record["id"] for record in outputs[0] ] == [ "x", "y" ]
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+TARGETS = [ "#8040a0", "#3c6e46", "#e6d2aa", "#283c78" ]
+
+
+def parse_color( text ):
+    return np.array( [ int( text[i:i + 2], 16 ) for i in ( 1, 3, 5 ) ] ) / 255.0
+
+
+def test_threshold_zero_is_the_identity( paint_database ):
+    paints = paint_database.get_base_paints()
+    clusters = PaintMixing.PigmentClusters( paint_database.get_mixing_model(), paints, 0.0 )
+
+    assert clusters.representatives == paints
+    assert clusters.clusters == [ [ paint ] for paint in paints ]
+    assert clusters.expand( [ ( paints[0], paints[1] ) ] ) == []
+
+
+def test_clusters_merge_as_the_threshold_grows( paint_database ):
+    paints = paint_database.get_base_paints()
+    sizes = [ len( PaintMixing.PigmentClusters( paint_database.get_mixing_model(), paints, threshold ).clusters ) for threshold in ( 0.0, 0.1, 0.5, 1.0, 100.0 ) ]
+
+    assert sizes == sorted( sizes, reverse = True )
+    assert sizes[-1] == 1
+
+
+@pytest.mark.parametrize( "target", TARGETS )
+def test_clustered_search_at_threshold_zero_is_exhaustive( paint_database, target ):
+    paints = paint_database.get_base_paints()
+    target_rgb = parse_color( target )
+    exhaustive = dict( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 3, 1 ) )
+    clustered = dict( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 3, 1, search = "clustered", cluster_threshold = 0.0 ) )
+
+    for num_paints in ( 1, 2, 3 ):
+        assert sorted( clustered[num_paints][0][2] ) == sorted( exhaustive[num_paints][0][2] )
+        assert clustered[num_paints][0][1] == pytest.approx( exhaustive[num_paints][0][1], rel = 1e-2, abs = 1e-9 )
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+PAINTS = [ "white", "violet", "cold yellow", "blue green shade" ]
+
+
+def test_batched_xyz_matches_the_scalar_path_on_the_cmf_grid():
+    wavelengths = PaintMixing.Colorimetry.predefined_spectra["X"].wavelengths
+    reflectances = np.stack( [ 0.5 + 0.4 * np.sin( wavelengths / period ) for period in ( 20.0, 40.0, 80.0 ) ] )
+
+    batched = PaintMixing.Colorimetry.reflectances_to_xyz( reflectances, illuminants = ( "D65", ) )[:, 0]
+    scalar = [ PaintMixing.Colorimetry.reflectance_to_xyz( PaintMixing.Spectrum( wavelengths, reflectance ) ) for reflectance in reflectances ]
+    np.testing.assert_allclose( batched, scalar, atol = 1e-12 )
+
+
+def test_batched_xyz_matches_the_scalar_path_on_the_paints( paint_database ):
+    # the scalar path multiplies spectra on their merged grid, so the two integrate slightly differently
+    mixing_model = paint_database.get_mixing_model()
+    for paint in PAINTS:
+        reflectance = mixing_model.mix( [ ( paint_database.get_all_paints()[paint], 1.0 ) ] )
+        batched = PaintMixing.Colorimetry.reflectances_to_xyz( reflectance.values, reflectance.wavelengths, ( "D65", ) )[0]
+        np.testing.assert_allclose( batched, PaintMixing.Colorimetry.reflectance_to_xyz( reflectance ), atol = 1e-3 )
+
+
+@pytest.mark.parametrize( "illuminant_error", [ "mean", "max" ] )
+def test_cross_illuminant_error_matches_a_loop_over_illuminants( paint_database, illuminant_error ):
+    illuminants = ( "D65", "A", "F11" )
+    target_rgb = np.array( [ 0.5, 0.25, 0.63 ] )
+    paints = paint_database.get_all_paints()
+    mixing_model = paint_database.get_mixing_model()
+
+    optimizer = PaintMixing.RecipeOptimizer( paints, target_rgb, mixing_model, illuminants, illuminant_error )
+    single = [ PaintMixing.RecipeOptimizer( paints, target_rgb, mixing_model, ( illuminant, ) ) for illuminant in illuminants ]
+
+    mixed_paint = optimizer.mix_current_set( ( "white", "violet", "magenta" ), np.array( [ 0.3, 0.5, 0.2 ] ) )
+    delta_e = [ optimizer.mix_error( mixed_paint ) for optimizer in single ]
+    expected = max( delta_e ) if illuminant_error == "max" else np.mean( delta_e )
+    assert optimizer.mix_error( mixed_paint ) == pytest.approx( expected, rel = 1e-12 )
+
+
+def test_illuminant_weights_cache_is_bounded( monkeypatch ):
+    monkeypatch.setattr( PaintMixing, "ILLUMINANT_WEIGHTS_CACHE_SIZE", 4 )
+    grids = [ np.linspace( 400.0, 700.0, num_bands ) for num_bands in range( 8, 16 ) ]
+    for wavelengths in grids:
+        PaintMixing.Colorimetry.illuminant_weights( ( "D65", "A" ), wavelengths )
+
+    assert len( PaintMixing.illuminant_weights_cache ) <= 4
+    # the most recent grids are kept, and come back as the same array
+    weights = PaintMixing.Colorimetry.illuminant_weights( ( "D65", "A" ), grids[-1].copy() )
+    assert weights is PaintMixing.Colorimetry.illuminant_weights( ( "D65", "A" ), grids[-1] )
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+# the mix on the sliders, and targets a little way off it: more of a paint that's in it, and a paint that isn't
+CURRENT_PAINTS = [ "white", "violet" ]
+CURRENT_AMOUNTS = [ 0.7, 0.3 ]
+TARGETS = [ ( ( "white", "violet" ), [ 0.6, 0.4 ] ), ( ( "white", "violet", "cold yellow" ), [ 0.7, 0.3, 0.05 ] ) ]
+
+
+def mix_rgb( paint_database, paint_set, amounts ):
+    mixed = paint_database.get_mixing_model().mix( [ ( paint_database.get_all_paints()[paint], amount ) for paint, amount in zip( paint_set, amounts ) ] )
+    return np.array( PaintMixing.Colorimetry.reflectance_to_rgb( mixed ), dtype = float )
+
+
+@pytest.mark.parametrize( "target_paints, target_amounts", TARGETS )
+def test_nudge_only_adds_and_gets_closer( paint_database, target_paints, target_amounts ):
+    target_rgb = mix_rgb( paint_database, target_paints, target_amounts )
+    optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), target_rgb, paint_database.get_mixing_model() )
+    start_error = optimizer.mix_error( optimizer.mix_current_set( CURRENT_PAINTS, np.array( CURRENT_AMOUNTS ) ) )
+
+    corrections = PaintMixing.MixCorrector( optimizer, paint_database.get_base_paints(), max_extra_paints = 1 )( CURRENT_PAINTS, CURRENT_AMOUNTS )
+    assert len( corrections ) > 0
+
+    for mixed_rgb, diff, paint_set, amounts, additions in corrections:
+        # the current paints come first and paint is never taken out
+        assert list( paint_set[:len( CURRENT_PAINTS )] ) == CURRENT_PAINTS
+        assert np.all( additions >= 0.0 )
+        np.testing.assert_allclose( amounts[:len( CURRENT_PAINTS )] - additions[:len( CURRENT_PAINTS )], CURRENT_AMOUNTS )
+
+    assert corrections[0][1] < 0.5 * start_error
+
+
+def test_nothing_to_nudge( paint_database ):
+    optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), np.array( [ 0.5, 0.4, 0.6 ] ), paint_database.get_mixing_model() )
+    corrector = PaintMixing.MixCorrector( optimizer, paint_database.get_base_paints() )
+    assert corrector( [], [] ) == []
+    assert corrector( CURRENT_PAINTS, [ 0.0, 0.0 ] ) == []
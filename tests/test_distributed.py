@@ -0,0 +1,79 @@
+import threading
+import numpy as np
+import pytest
+import PaintMixing
+import PaintMixingDistributed
+
+TARGETS = [ [ 128, 64, 160 ], [ 60, 110, 70 ] ]
+
+
+class QuietWorkerServer( PaintMixingDistributed.WorkerServer ):
+    def handle_error( self, request, client_address ):
+        pass
+
+
+class DyingWorkerService( PaintMixingDistributed.WorkerService ):
+    # solves a couple of shards, then goes down in the middle of the next one
+    def __init__( self, paint_database, processes, shards_to_live ):
+        super().__init__( paint_database, processes )
+        self.shards_to_live = shards_to_live
+        self.server = None
+
+    def solve( self, request ):
+        if self.shards_to_live == 0:
+            threading.Thread( target = self.server.shutdown, daemon = True ).start()
+            raise ConnectionAbortedError( "worker killed" )
+        self.shards_to_live = self.shards_to_live - 1
+        return super().solve( request )
+
+
+def start_worker( service ):
+    handler = type( "BoundWorkerRequestHandler", ( PaintMixingDistributed.WorkerRequestHandler, ), { "service" : service } )
+    server = QuietWorkerServer( ( "127.0.0.1", 0 ), handler )
+    threading.Thread( target = server.serve_forever, daemon = True ).start()
+    return server, "{}:{}".format( *server.server_address )
+
+
+def test_shards_of_a_dead_worker_are_solved_by_the_others( paint_database ):
+    paints = paint_database.get_base_paints()
+    healthy = PaintMixingDistributed.WorkerService( paint_database, 1 )
+    dying = DyingWorkerService( paint_database, 1, 2 )
+
+    healthy_server, healthy_address = start_worker( healthy )
+    dying.server, dying_address = start_worker( dying )
+    try:
+        solver = PaintMixingDistributed.DistributedSolver( [ healthy_address, dying_address ], paint_database.get_hash(), shard_size = 16, timeout = 60 )
+        solved = solver.solve_many( TARGETS, paints, 3, 3 )
+    finally:
+        for server, service in ( ( healthy_server, healthy ), ( dying.server, dying ) ):
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+    assert solver.stats["reissued"] >= 1
+    assert [ address for address, _ in solver.stats["failed_workers"] ] == [ dying_address ]
+
+    for target, sizes in zip( TARGETS, solved ):
+        expected = list( PaintMixing.solve_recipes( np.array( target ) / 255.0, paint_database, paints, 3, 3 ) )
+        assert [ num_paints for num_paints, _ in sizes ] == [ num_paints for num_paints, _ in expected ]
+
+        for ( num_paints, best ), ( _, expected_best ) in zip( sizes, expected ):
+            assert [ tuple( recipe[2] ) for recipe in best ] == [ tuple( recipe[2] ) for recipe in expected_best ]
+            # solve_recipes takes single paints' colours from the library's colorimetry, integrated a little differently
+            tolerance = { "atol" : 1e-3 } if num_paints == 1 else { "rtol" : 1e-9, "atol" : 1e-15 }
+            np.testing.assert_allclose( [ recipe[1] for recipe in best ], [ recipe[1] for recipe in expected_best ], **tolerance )
+            for recipe, expected_recipe in zip( best, expected_best ):
+                np.testing.assert_allclose( recipe[3], expected_recipe[3], **tolerance )
+
+
+def test_no_workers_left_is_an_error( paint_database ):
+    dying = DyingWorkerService( paint_database, 1, 0 )
+    dying.server, dying_address = start_worker( dying )
+    try:
+        solver = PaintMixingDistributed.DistributedSolver( [ dying_address ], paint_database.get_hash(), shard_size = 16, timeout = 60 )
+        with pytest.raises( RuntimeError, match = "no workers left" ):
+            solver.solve( TARGETS[0], paint_database.get_base_paints(), 2, 3 )
+    finally:
+        dying.server.shutdown()
+        dying.server.server_close()
+        dying.close()
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+PAINT_SETS = [ ( "white", "violet" ), ( "white", "cold yellow", "blue green shade" ), ( "white", "magenta", "orange", "black" ) ]
+TARGETS = [ ( 0.5, 0.25, 0.63 ), ( 0.24, 0.43, 0.27 ), ( 0.82, 0.63, 0.44 ) ]
+
+
+def central_differences( evaluator, weights, step = 1e-6 ):
+    gradient = np.zeros( len( weights ) )
+    for i in range( len( weights ) ):
+        offset = np.zeros( len( weights ) )
+        offset[i] = step
+        gradient[i] = ( evaluator( weights + offset )[0] - evaluator( weights - offset )[0] ) / ( 2.0 * step )
+    return gradient
+
+
+@pytest.mark.parametrize( "illuminants", [ None, ( "D65", ), ( "D65", "A" ) ] )
+@pytest.mark.parametrize( "paint_set", PAINT_SETS )
+@pytest.mark.parametrize( "target_rgb", TARGETS )
+def test_gradient_matches_central_differences( paint_database, illuminants, paint_set, target_rgb ):
+    optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), np.array( target_rgb ), paint_database.get_mixing_model(), illuminants )
+    evaluator = PaintMixing.MixEvaluator( optimizer, paint_set )
+
+    rng = np.random.default_rng( len( paint_set ) )
+    for _ in range( 3 ):
+        weights = rng.uniform( 0.1, 1.0, len( paint_set ) )
+        objective, gradient = evaluator( weights )
+
+        mixed_R = PaintMixing.TwoDiffuseFluxesModel.mix_arrays( evaluator.K, evaluator.S, weights )
+        assert objective == pytest.approx( optimizer.mix_errors( mixed_R, evaluator.wavelengths ), rel = 1e-9 )
+        np.testing.assert_allclose( gradient, central_differences( evaluator, weights ), rtol = 1e-4, atol = 1e-7 * max( 1.0, abs( objective ) ) )
+
+
+def test_pinned_gradient_is_the_free_part_of_the_gradient( paint_database ):
+    optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), np.array( TARGETS[0] ), paint_database.get_mixing_model() )
+    evaluator = PaintMixing.MixEvaluator( optimizer, PAINT_SETS[1] )
+
+    evaluator.pin( 1 )
+    ratios = np.array( [ 0.3, 0.7 ] )
+    objective, gradient = evaluator.pinned( ratios )
+    full_objective, full_gradient = evaluator( np.array( [ 0.3, 1.0, 0.7 ] ) )
+
+    assert objective == pytest.approx( full_objective )
+    np.testing.assert_allclose( gradient, full_gradient[[ 0, 2 ]] )
@@ -0,0 +1,76 @@
+import time
+import pytest
+import PaintMixing
+
+
+def square( x ):
+    return x * x
+
+
+def slow_square( x ):
+    time.sleep( 0.02 )
+    return x * x
+
+
+def test_plan_follows_the_costs( monkeypatch ):
+    monkeypatch.setattr( PaintMixing, "FREE_THREADED", False )
+    executor = PaintMixing.AdaptiveExecutor( max_workers = 4 )
+
+    # nothing to spread, or cheaper to just do than to hand out
+    assert executor.plan( 1, 1.0 )[0] == "inline"
+    assert executor.plan( 100, 1e-6 )[0] == "inline"
+
+    # a pool that still has to start has to pay for itself
+    assert executor.plan( 8, 0.01 )[0] == "inline"
+    strategy, workers, chunk_size, seconds = executor.plan( 1000, 0.01 )
+    assert ( strategy, workers ) == ( "processes", 4 )
+    assert seconds < 1000 * 0.01
+
+    # chunks of about chunk_seconds of work, but at least four per worker
+    assert chunk_size == 2
+    assert executor.plan( 100000, 1e-4 )[2] == 200
+    assert executor.plan( 400, 1.0 )[2] == 1
+    assert executor.plan( 4000, 1e-3 )[2] == 20
+
+    # threads only where they run in parallel
+    monkeypatch.setattr( PaintMixing, "FREE_THREADED", True )
+    assert executor.plan( 1000, 0.01 )[:3] == ( "threads", 4, 1 )
+    assert executor.plan( 100, 1e-7 )[0] == "inline"
+
+
+@pytest.mark.parametrize( "free_threaded, function, num_items, expected", [ ( False, square, 50, "inline" ),
+                                                                             ( False, slow_square, 64, "processes" ),
+                                                                             ( True, slow_square, 64, "threads" ) ] )
+def test_every_strategy_gives_the_same_results( monkeypatch, free_threaded, function, num_items, expected ):
+    monkeypatch.setattr( PaintMixing, "FREE_THREADED", free_threaded )
+    items = list( range( num_items ) )
+
+    with PaintMixing.AdaptiveExecutor( max_workers = 4 ) as executor:
+        assert executor( function, items ) == [ item * item for item in items ]
+        run = executor.telemetry[-1]
+
+    assert run["strategy"] == expected
+    assert run["tasks"] == num_items
+    assert run["workers"] == ( 1 if expected == "inline" else 4 )
+
+
+def test_solver_recipes_do_not_depend_on_the_strategy( paint_database, monkeypatch ):
+    paints = paint_database.get_base_paints()
+    target_rgb = paint_database.get_colorimetry( "violet" )["rgb"] * 0.5 + 0.25
+    expected = list( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 2, 3 ) )
+
+    # a fresh executor, then one whose pool is up and looks free, so the combinations go to the processes
+    library = paint_database.get_mapped_library()
+    with PaintMixing.AdaptiveExecutor( max_workers = 2 ) as executor:
+        inline = list( PaintMixing.solve_recipes( target_rgb, library, paints, 2, 3, executor ) )
+        executor.get_process_pool()
+        executor.process_startup_seconds = 0.0
+        executor.process_chunk_seconds = 0.0
+        pooled = list( PaintMixing.solve_recipes( target_rgb, library, paints, 2, 3, executor ) )
+        strategies = [ run["strategy"] for run in executor.telemetry ]
+
+    assert "processes" in strategies
+    for solved in ( inline, pooled ):
+        for ( num_paints, best ), ( _, expected_best ) in zip( solved, expected ):
+            assert [ tuple( recipe[2] ) for recipe in best ] == [ tuple( recipe[2] ) for recipe in expected_best ]
+            assert [ recipe[1] for recipe in best ] == pytest.approx( [ recipe[1] for recipe in expected_best ], rel = 1e-9 )
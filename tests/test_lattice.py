@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import scipy.special
+import PaintMixing
+from itertools import combinations
+
+
+@pytest.mark.parametrize( "num_items, num_picked", [ ( 5, 1 ), ( 6, 3 ), ( 13, 4 ), ( 4, 4 ) ] )
+def test_combination_indices_match_itertools( num_items, num_picked ):
+    indices = PaintMixing.combination_indices( num_items, num_picked )
+
+    assert indices.shape == ( scipy.special.comb( num_items, num_picked, exact = True ), num_picked )
+    assert [ tuple( row ) for row in indices ] == list( combinations( range( num_items ), num_picked ) )
+
+
+@pytest.mark.parametrize( "num_paints, max_total_parts", [ ( 1, 5 ), ( 2, 7 ), ( 3, 10 ), ( 4, 4 ) ] )
+def test_integer_lattice_is_every_positive_vector_up_to_the_total( num_paints, max_total_parts ):
+    parts = PaintMixing.integer_lattice( num_paints, max_total_parts )
+
+    assert ( parts >= 1 ).all()
+    assert ( parts.sum( -1 ) <= max_total_parts ).all()
+    assert len( set( map( tuple, parts ) ) ) == len( parts ) == scipy.special.comb( max_total_parts, num_paints, exact = True )
+
+
+def test_parts_window_is_the_pruned_lattice():
+    lattice = PaintMixing.integer_lattice( 3, 12 )
+    proportions = np.array( [ 0.55, 0.3, 0.15 ] )
+    near = lattice[np.abs( lattice / lattice.sum( -1, keepdims = True ) - proportions ).max( -1 ) <= 0.2]
+
+    window = np.concatenate( [ block for total_parts in range( 3, 13 ) for block in PaintMixing.parts_window( 3, total_parts, proportions, 0.2 ) ] )
+    everything = np.concatenate( [ block for total_parts in range( 3, 13 ) for block in PaintMixing.parts_window( 3, total_parts ) ] )
+
+    assert set( map( tuple, window ) ) == set( map( tuple, near ) )
+    assert set( map( tuple, everything ) ) == set( map( tuple, lattice ) )
+
+
+def test_nearest_parts_keeps_every_paint_and_the_total():
+    np.testing.assert_array_equal( PaintMixing.nearest_parts( [ 0.97, 0.01, 0.01, 0.01 ], 5 ), [ 2, 1, 1, 1 ] )
+    np.testing.assert_array_equal( PaintMixing.nearest_parts( [ 0.5, 0.25, 0.25 ], 8 ), [ 4, 2, 2 ] )
+    assert PaintMixing.nearest_parts( [ 0.2, 0.3, 0.5 ], 7 ).sum() == 7
+
+
+@pytest.mark.parametrize( "num_items, num_picked", [ ( 13, 4 ), ( 9, 1 ), ( 7, 7 ), ( 20, 3 ) ] )
+def test_combinations_range_is_a_slice_of_itertools( num_items, num_picked ):
+    items = [ "paint {}".format( i ) for i in range( num_items ) ]
+    everything = list( combinations( items, num_picked ) )
+
+    for start in range( 0, len( everything ), max( 1, len( everything ) // 37 ) ):
+        for stop in ( start + 1, start + 50, len( everything ) + 5 ):
+            assert list( PaintMixing.combinations_range( items, num_picked, start, stop ) ) == everything[start:stop]
@@ -0,0 +1,95 @@
+import os
+import time
+import pickle
+import numpy as np
+import pytest
+import PaintMixing
+
+PAINT_SETS = [ ( "white", "violet" ), ( "white", "cold yellow", "blue green shade" ), ( "magenta", "black", "orange" ) ]
+
+
+@pytest.fixture
+def library_directory( tmp_path, monkeypatch ):
+    # a home directory of its own, so nothing from other tests (or the user's cache) is in there
+    monkeypatch.setenv( "HOME", str( tmp_path ) )
+    directory = os.path.join( str( tmp_path ), ".paintmixing", "libraries" )
+    monkeypatch.setattr( PaintMixing, "MAPPED_LIBRARY_DIRECTORY", directory )
+    return directory
+
+
+def test_mapped_library_mixes_like_the_database( paint_database, library_directory ):
+    library = paint_database.get_mapped_library()
+    assert os.path.dirname( library.get_mixing_model().path ) == library_directory
+    assert library.get_base_paints() == paint_database.get_base_paints()
+    assert library.get_hash() == paint_database.get_hash()
+
+    mixing_model = paint_database.get_mixing_model()
+    mapped_model = library.get_mixing_model()
+    weights = np.array( [ 0.2, 0.5, 0.3 ] )
+    for paint_set in PAINT_SETS:
+        assert library.get_hash( paint_set ) == paint_database.get_hash( paint_set )
+        for expected, mapped in zip( mixing_model.get_parameter_arrays( paint_set ), mapped_model.get_parameter_arrays( paint_set ) ):
+            np.testing.assert_array_equal( expected, mapped )
+
+        components = [ ( paint_database.get_all_paints()[paint], weight ) for paint, weight in zip( paint_set, weights ) ]
+        mapped_components = [ ( library.get_all_paints()[paint], weight ) for paint, weight in zip( paint_set, weights ) ]
+        expected = mixing_model.mix( components )
+        mixed = mapped_model.mix( mapped_components )
+        np.testing.assert_allclose( mixed.resample( expected.wavelengths ).values, expected.values, atol = 1e-12 )
+
+    for paint in paint_database.get_base_paints():
+        expected = paint_database.get_colorimetry( paint )
+        mapped = library.get_colorimetry( paint )
+        assert mapped.keys() == expected.keys()
+        for key in expected:
+            np.testing.assert_allclose( np.asarray( mapped[key], dtype = float ), np.asarray( expected[key], dtype = float ) )
+
+
+def test_mapped_library_solves_like_the_database_and_pickles_as_its_path( paint_database, library_directory ):
+    library = paint_database.get_mapped_library()
+    unpickled = pickle.loads( pickle.dumps( library ) )
+    assert len( pickle.dumps( library ) ) < 10000
+    assert unpickled.get_hash() == library.get_hash()
+
+    paints = paint_database.get_base_paints()
+    target_rgb = np.array( [ 0.24, 0.43, 0.27 ] )
+    expected = list( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 3, 2 ) )
+    mapped = list( PaintMixing.solve_recipes( target_rgb, unpickled, paints, 3, 2 ) )
+    for ( num_paints, best ), ( mapped_num_paints, mapped_best ) in zip( expected, mapped ):
+        assert num_paints == mapped_num_paints
+        assert [ tuple( recipe[2] ) for recipe in best ] == [ tuple( recipe[2] ) for recipe in mapped_best ]
+        np.testing.assert_allclose( [ recipe[1] for recipe in best ], [ recipe[1] for recipe in mapped_best ], rtol = 1e-9, atol = 1e-12 )
+
+
+def make_stale_library( directory, name, age ):
+    path = os.path.join( directory, name )
+    for file_path in ( path, path + ".json" ):
+        with open( file_path, "w" ) as stale_file:
+            stale_file.write( "{}" )
+        os.utime( file_path, ( time.time() - age, time.time() - age ) )
+    return path
+
+
+def test_pruning_keeps_the_current_library( paint_database, library_directory ):
+    os.makedirs( library_directory )
+    old = make_stale_library( library_directory, "paintmixing-v1-0123.npy", 2 * PaintMixing.MAPPED_LIBRARY_MAX_AGE )
+    recent = make_stale_library( library_directory, "paintmixing-v2-4567.npy", 60 )
+    unrelated = make_stale_library( library_directory, "notes.npy", 2 * PaintMixing.MAPPED_LIBRARY_MAX_AGE )
+
+    # exporting the library prunes what nobody asked for in a while
+    path = paint_database.get_mapped_library().get_mixing_model().path
+    assert os.path.exists( path ) and os.path.exists( path + ".json" )
+    assert not os.path.exists( old ) and not os.path.exists( old + ".json" )
+    assert os.path.exists( recent ) and os.path.exists( unrelated )
+
+    # the current library survives even when it's the oldest file there
+    for file_path in ( path, path + ".json" ):
+        os.utime( file_path, ( time.time() - 3 * PaintMixing.MAPPED_LIBRARY_MAX_AGE, time.time() - 3 * PaintMixing.MAPPED_LIBRARY_MAX_AGE ) )
+    PaintMixing.prune_mapped_libraries( library_directory, path, max_age = 0 )
+    assert os.path.exists( path ) and os.path.exists( path + ".json" )
+    assert not os.path.exists( recent + ".json" )
+
+    # and asking for it again marks it as used, no temporary files are left behind
+    paint_database.get_mapped_library()
+    assert time.time() - os.path.getmtime( path + ".json" ) < 60
+    assert not [ name for name in os.listdir( library_directory ) if name.endswith( ".tmp" ) ]
@@ -0,0 +1,56 @@
+import json
+import numpy as np
+import pytest
+import PaintMixing
+
+WAVELENGTHS = np.linspace( 400.0, 700.0, 31 )
+
+
+def make_readings( corrupted = False ):
+    # four readings of one sample a little apart, the last one smudged if corrupted
+    rng = np.random.default_rng( 7 )
+    spectrum = 0.4 + 0.3 * np.sin( WAVELENGTHS / 50.0 )
+    values = spectrum + rng.normal( 0.0, 0.002, ( 4, len( WAVELENGTHS ) ) )
+    if corrupted:
+        values[3] *= 0.6
+    readings = [ { "name": "white", "type": "masstone" } for _ in range( 4 ) ]
+    return readings, values
+
+
+def test_corrupted_reading_is_dropped():
+    readings, values = make_readings( corrupted = True )
+    assert PaintMixing.outlier_readings( values ).tolist() == [ False, False, False, True ]
+
+    sample = PaintMixing.average_measurements( readings, values, WAVELENGTHS )["white"]
+    assert sample["outliers"] == [ 3 ]
+    assert sample["num_readings"] == 4
+    np.testing.assert_allclose( sample["reflectance"].values, values[:3].mean( 0 ), atol = 1e-12 )
+
+
+def test_consistent_readings_give_the_plain_mean():
+    readings, values = make_readings()
+    assert not PaintMixing.outlier_readings( values ).any()
+
+    sample = PaintMixing.average_measurements( readings, values, WAVELENGTHS )["white"]
+    assert sample["outliers"] == []
+    np.testing.assert_allclose( sample["reflectance"].values, values.mean( 0 ), atol = 1e-12 )
+
+
+def test_outlier_rejection_can_be_turned_off():
+    readings, values = make_readings( corrupted = True )
+    sample = PaintMixing.average_measurements( readings, values, WAVELENGTHS, outlier_threshold = None )["white"]
+    assert sample["outliers"] == []
+    np.testing.assert_allclose( sample["reflectance"].values, values.mean( 0 ), atol = 1e-12 )
+
+
+@pytest.mark.parametrize( "statistic", [ "mean", "median", "trimmed" ] )
+def test_loaded_samples_leave_the_outlier_out( tmp_path, statistic ):
+    readings, values = make_readings( corrupted = True )
+    datasets = [ { "type": "wavelengths", "values": WAVELENGTHS.tolist() } ]
+    datasets += [ dict( reading, reflectance = ( 100.0 * value ).tolist() ) for reading, value in zip( readings, values ) ]
+    file_path = tmp_path / "masstone.json"
+    file_path.write_text( json.dumps( datasets ) )
+
+    sample = PaintMixing.load_measurments( str( file_path ), statistic )["white"]
+    assert sample["outliers"] == [ 3 ]
+    np.testing.assert_allclose( sample["reflectance"].values, values[:3].mean( 0 ), atol = 0.01 )
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+TARGETS = [ "#8040a0", "#c8a070", "#3c6e46", "#e6d2aa", "#965a32", "#a0b4be" ]
+
+
+def parse_color( text ):
+    return np.array( [ int( text[i:i + 2], 16 ) for i in ( 1, 3, 5 ) ] ) / 255.0
+
+
+@pytest.fixture( scope = "module" )
+def targets_rgb():
+    return [ parse_color( target ) for target in TARGETS ]
+
+
+@pytest.mark.parametrize( "max_paints", [ 3, 5 ] )
+def test_selection_covers_what_it_estimates( paint_database, targets_rgb, max_paints ):
+    paints = paint_database.get_base_paints()
+    selector = PaintMixing.PaletteSelector( paint_database, paints, targets_rgb, max_paints, delta_e = 3.0 )
+    chosen = selector.select()
+
+    assert 0 < len( chosen ) <= max_paints
+    assert set( chosen ) <= set( paints )
+
+    # every target the prescreen puts within delta_e is within it when solved properly on the chosen paints
+    estimated = selector.best_delta_e( np.isin( paints, chosen ) )
+    solved = np.array( [ delta_e for _, delta_e in selector.solve( chosen ) ] )
+    assert ( estimated <= 3.0 ).any()
+    assert ( solved[estimated <= 3.0] <= 3.0 ).all()
+
+
+def test_more_paints_cover_at_least_as_many_targets( paint_database, targets_rgb ):
+    paints = paint_database.get_base_paints()
+    covered = []
+    for max_paints in ( 2, 4, len( paints ) ):
+        selector = PaintMixing.PaletteSelector( paint_database, paints, targets_rgb, max_paints, delta_e = 3.0 )
+        covered.append( selector.score( np.isin( paints, selector.select() ) )[0] )
+
+    assert covered == sorted( covered )
+    assert covered[-1] == selector.score( np.ones( len( paints ), dtype = bool ) )[0]
+
+
+def test_palette_limits_are_validated( paint_database, targets_rgb ):
+    paints = paint_database.get_base_paints()
+    with pytest.raises( ValueError ):
+        PaintMixing.PaletteSelector( paint_database, paints, targets_rgb, 0 )
+    with pytest.raises( ValueError ):
+        PaintMixing.PaletteSelector( paint_database, paints, [], 3 )
+
+
+def test_no_paints_leave_every_target_uncovered( paint_database, targets_rgb ):
+    selector = PaintMixing.PaletteSelector( paint_database, paint_database.get_base_paints(), targets_rgb[:2], 3 )
+    assert selector.solve( [] ) == [ ( None, np.inf ), ( None, np.inf ) ]
+
+
+def test_solving_on_the_mapped_library_matches_the_database( paint_database, targets_rgb ):
+    paints = paint_database.get_base_paints()
+    selector = PaintMixing.PaletteSelector( paint_database, paints, targets_rgb[:2], 3 )
+    chosen = selector.select()
+
+    direct = selector.solve( chosen )
+    mapped = selector.solve( chosen, paint_library = paint_database.get_mapped_library() )
+    assert [ recipe[2] for recipe, _ in mapped ] == [ recipe[2] for recipe, _ in direct ]
+    assert np.allclose( [ delta_e for _, delta_e in mapped ], [ delta_e for _, delta_e in direct ] )
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+TARGETS = [ "#8040a0", "#c8a070", "#3c6e46", "#d2343c", "#e6d2aa", "#283c78", "#965a32", "#a0b4be" ]
+
+
+def parse_color( text ):
+    return np.array( [ int( text[i:i + 2], 16 ) for i in ( 1, 3, 5 ) ] ) / 255.0
+
+
+@pytest.mark.parametrize( "target", TARGETS )
+def test_top_m_contains_the_exhaustive_best( paint_database, target ):
+    paints = paint_database.get_base_paints()
+    target_rgb = parse_color( target )
+    exhaustive = dict( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 3, 1 ) )
+
+    optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), target_rgb, paint_database.get_mixing_model() )
+    prescreener = PaintMixing.RecipePrescreener( optimizer, paints )
+    for num_paints in ( 2, 3 ):
+        assert tuple( exhaustive[num_paints][0][2] ) in prescreener.best_combinations( num_paints, 10 )
+
+    # and so the prescreened solve ends up with the same recipes
+    prescreened = dict( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 3, 1, prescreen_top_m = 10 ) )
+    for num_paints in ( 1, 2, 3 ):
+        assert tuple( prescreened[num_paints][0][2] ) == tuple( exhaustive[num_paints][0][2] )
+        assert prescreened[num_paints][0][1] == pytest.approx( exhaustive[num_paints][0][1], rel = 1e-6, abs = 1e-12 )
@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import numpy as np
+import pytest
+import PaintMixing
+from conftest import DATA_DIR
+
+
+@pytest.fixture
+def library( tmp_path ):
+    # the bundled measurements copied somewhere they can be edited, a database on them and a watcher for it
+    paths = []
+    for name in ( "masstone.json", "mix1.json" ):
+        shutil.copy( os.path.join( DATA_DIR, name ), str( tmp_path / name ) )
+        paths.append( str( tmp_path / name ) )
+
+    paint_database = PaintMixing.PaintDatabase( paths )
+    errors = []
+    watcher = PaintMixing.PaintDatabaseWatcher( paint_database, on_error = errors.append )
+    return paint_database, watcher, paths, errors
+
+
+def rewrite( path, edit ):
+    with open( path ) as measurement_file:
+        datasets = json.load( measurement_file )
+    with open( path, "w" ) as measurement_file:
+        json.dump( edit( datasets ), measurement_file )
+
+    # make sure the watcher sees a new modification time even on coarse file systems
+    stamp = os.stat( path ).st_mtime_ns + 10 ** 9
+    os.utime( path, ns = ( stamp, stamp ) )
+
+
+def snapshot( paint_database ):
+    paints = paint_database.get_base_paints()
+    _, K, S = paint_database.get_mixing_model().get_parameter_arrays( paints )
+    return { "hash" : paint_database.get_hash(), "paint_hashes" : { paint : paint_database.get_paint_hash( paint ) for paint in paints },
+             "K" : dict( zip( paints, np.array( K ) ) ), "S" : dict( zip( paints, np.array( S ) ) ) }
+
+
+def scale_paint( name, factor ):
+    def edit( datasets ):
+        for dataset in datasets:
+            if dataset.get( "name" ) == name:
+                dataset["reflectance"] = [ value * factor for value in dataset["reflectance"] ]
+        return datasets
+    return edit
+
+
+def test_changed_measurement_refits_only_its_paint( library ):
+    paint_database, watcher, paths, errors = library
+    before = snapshot( paint_database )
+
+    rewrite( paths[0], scale_paint( "violet", 0.97 ) )
+    assert watcher.poll() == { "violet" }
+    assert errors == []
+
+    after = snapshot( paint_database )
+    assert after["hash"] != before["hash"]
+    assert [ paint for paint in before["paint_hashes"] if after["paint_hashes"][paint] != before["paint_hashes"][paint] ] == [ "violet" ]
+    for paint in before["K"]:
+        changed = paint == "violet"
+        assert np.array_equal( after["K"][paint], before["K"][paint] ) != changed
+        assert np.array_equal( after["S"][paint], before["S"][paint] ) != changed
+
+    # the same as loading the edited files from scratch
+    reloaded = PaintMixing.PaintDatabase( paths )
+    assert reloaded.get_hash() == after["hash"]
+
+    # nothing changed, nothing to do
+    assert watcher.poll() == set()
+
+
+def test_library_without_white_keeps_the_previous_one( library ):
+    paint_database, watcher, paths, errors = library
+    before = snapshot( paint_database )
+
+    rewrite( paths[0], lambda datasets: [ dataset for dataset in datasets if dataset.get( "name" ) != "white" ] )
+    assert watcher.poll() == set()
+    assert len( errors ) == 1 and "white" in errors[0]
+
+    after = snapshot( paint_database )
+    assert after["hash"] == before["hash"]
+    assert all( np.array_equal( after["K"][paint], before["K"][paint] ) for paint in before["K"] )
+
+
+def test_failing_fit_rolls_back( library, monkeypatch ):
+    paint_database, watcher, paths, errors = library
+    before = snapshot( paint_database )
+    mixing_model = paint_database.get_mixing_model()
+    update_K_S = mixing_model.update_K_S
+
+    def failing_update_K_S( *args, **kwargs ):
+        # gets halfway, then fails
+        update_K_S( *args, **kwargs )
+        raise np.linalg.LinAlgError( "singular matrix" )
+
+    monkeypatch.setattr( mixing_model, "update_K_S", failing_update_K_S )
+    rewrite( paths[0], scale_paint( "violet", 0.97 ) )
+    assert watcher.poll() == set()
+    assert len( errors ) == 1 and "LinAlgError" in errors[0]
+
+    after = snapshot( paint_database )
+    assert after["hash"] == before["hash"]
+    assert after["paint_hashes"] == before["paint_hashes"]
+    assert all( np.array_equal( after["K"][paint], before["K"][paint] ) and np.array_equal( after["S"][paint], before["S"][paint] ) for paint in before["K"] )
+
+
+def test_half_written_file_is_picked_up_once_complete( library ):
+    paint_database, watcher, paths, errors = library
+    before = snapshot( paint_database )
+
+    with open( paths[0] ) as measurement_file:
+        text = measurement_file.read()
+    with open( paths[0], "w" ) as measurement_file:
+        measurement_file.write( text[:len( text ) // 2] )
+    assert watcher.poll() == set()
+    assert snapshot( paint_database )["hash"] == before["hash"]
+
+    with open( paths[0], "w" ) as measurement_file:
+        measurement_file.write( text )
+    rewrite( paths[0], scale_paint( "black", 1.02 ) )
+    assert watcher.poll() == { "black" }
+    assert errors == []
@@ -0,0 +1,27 @@
+import numpy as np
+import scipy.interpolate
+import PaintMixing
+
+
+def test_resampling_matches_linear_interpolation():
+    source = np.array( [ 400.0, 410.0, 425.0, 450.0, 500.0, 560.0, 700.0 ] )
+    target = np.linspace( 380.0, 730.0, 71 )
+    values = np.random.default_rng( 0 ).uniform( 0.0, 1.0, len( source ) )
+
+    expected = scipy.interpolate.interp1d( source, values, bounds_error = False, fill_value = 0.0 )( target )
+    np.testing.assert_allclose( PaintMixing.resampling_operator( source, target ) @ values, expected, atol = 1e-12 )
+
+
+def test_resampling_handles_unsorted_and_batched_sources():
+    source = np.array( [ 500.0, 400.0, 450.0 ] )
+    target = np.array( [ 400.0, 425.0, 475.0, 500.0, 510.0 ] )
+    values = np.array( [ [ 3.0, 1.0, 2.0 ], [ 30.0, 10.0, 20.0 ] ] )
+
+    resampled = ( PaintMixing.resampling_operator( source, target ) @ values.T ).T
+    np.testing.assert_allclose( resampled, [ [ 1.0, 1.5, 2.5, 3.0, 0.0 ], [ 10.0, 15.0, 25.0, 30.0, 0.0 ] ] )
+
+
+def test_resampling_operators_are_cached():
+    source = np.linspace( 400.0, 700.0, 31 )
+    target = np.linspace( 380.0, 730.0, 8 )
+    assert PaintMixing.resampling_operator( source, target ) is PaintMixing.resampling_operator( source.copy(), target.copy() )
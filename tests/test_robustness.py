@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+RECIPES = [ ( ( "white", "violet" ), [ 0.7, 0.3 ] ), ( ( "white", "cold yellow", "blue green shade" ), [ 0.5, 0.3, 0.2 ] ) ]
+
+
+@pytest.mark.parametrize( "paint_set, weights", RECIPES )
+def test_no_weighing_error_moves_nothing( paint_database, paint_set, weights ):
+    robustness = PaintMixing.recipe_robustness( paint_database.get_mixing_model(), paint_set, weights, relative_noise = 0.0, num_samples = 200 )
+
+    assert robustness["median"] < 1e-9
+    assert robustness["max"] < 1e-9
+    assert robustness["jacobian"].shape == ( 3, len( paint_set ) )
+
+
+@pytest.mark.parametrize( "paint_set, weights", RECIPES )
+def test_spread_grows_with_the_weighing_error( paint_database, paint_set, weights ):
+    results = [ PaintMixing.recipe_robustness( paint_database.get_mixing_model(), paint_set, weights, relative_noise = noise, num_samples = 500 ) for noise in ( 0.01, 0.05, 0.2 ) ]
+
+    medians = [ result["median"] for result in results ]
+    p95s = [ result["p95"] for result in results ]
+    assert 0.0 < medians[0] < medians[1] < medians[2]
+    assert 0.0 < p95s[0] < p95s[1] < p95s[2]
+    assert all( result["median"] <= result["p95"] <= result["max"] for result in results )
+
+    # the nominal colour is the recipe's, and for small errors the linearization predicts the spread
+    mixed = paint_database.get_mixing_model().mix( [ ( paint_database.get_all_paints()[paint], weight ) for paint, weight in zip( paint_set, weights ) ] )
+    np.testing.assert_allclose( results[0]["lab"], PaintMixing.Colorimetry.reflectances_to_Lab( mixed.values, mixed.wavelengths )[0], atol = 1e-6 )
+    assert results[0]["median"] <= 2.0 * np.sqrt( ( results[0]["sensitivity"] ** 2 ).sum() )
@@ -0,0 +1,99 @@
+import json
+import time
+import threading
+import http.client
+import numpy as np
+import pytest
+import PaintMixing
+import PaintMixingServer
+
+PAINTS = [ "white", "violet", "cold yellow", "magenta", "black" ]
+
+
+@pytest.fixture( scope = "module" )
+def service( paint_database, mapped_library_root ):
+    directory = PaintMixing.MAPPED_LIBRARY_DIRECTORY
+    PaintMixing.MAPPED_LIBRARY_DIRECTORY = mapped_library_root
+    service = PaintMixingServer.RecipeService( paint_database, processes = 2 )
+    yield service
+    service.close()
+    PaintMixing.MAPPED_LIBRARY_DIRECTORY = directory
+
+
+@pytest.mark.parametrize( "target", [ 5, None, 1.5, "#12345", "#12345g", [ 1, 2 ], [ 1, 2, 3, 4 ], [ 1, 2, "3" ], [ True, 0, 0 ], [ 0, 0, 256 ], [ -1, 0, 0 ], { "r" : 1 } ] )
+def test_parse_target_rejects_malformed_targets( target ):
+    with pytest.raises( ValueError ):
+        PaintMixingServer.parse_target( target )
+
+
+def test_parse_target_reads_hex_and_triples():
+    assert PaintMixingServer.parse_target( "#8040a0" ) == [ 128, 64, 160 ]
+    assert PaintMixingServer.parse_target( "8040a0" ) == [ 128, 64, 160 ]
+    assert PaintMixingServer.parse_target( [ 128, 64.5, 160 ] ) == [ 128.0, 64.5, 160.0 ]
+
+
+def test_identical_concurrent_requests_share_one_solve( service, monkeypatch ):
+    # hold the solve until both requests are in, so the second one has to find the first one's job
+    release = threading.Event()
+    solve_recipes = PaintMixing.solve_recipes
+
+    def gated_solve_recipes( *args, **kwargs ):
+        release.wait( 30 )
+        yield from solve_recipes( *args, **kwargs )
+
+    monkeypatch.setattr( PaintMixing, "solve_recipes", gated_solve_recipes )
+
+    before = service.get_stats()
+    answers = [ None, None ]
+
+    def request( i ):
+        answers[i] = list( service.solve( [ 110, 90, 150 ], PAINTS, 2, 2 ) )
+
+    threads = [ threading.Thread( target = request, args = ( i, ) ) for i in range( 2 ) ]
+    for thread in threads:
+        thread.start()
+    for _ in range( 3000 ):
+        if service.get_stats()["requests"] - before["requests"] == 2:
+            break
+        time.sleep( 0.01 )
+
+    assert service.get_stats()["in_flight"] == 1
+    release.set()
+    for thread in threads:
+        thread.join( 60 )
+
+    after = service.get_stats()
+    assert after["solves"] - before["solves"] == 1
+    assert after["coalesced"] - before["coalesced"] == 1
+    assert answers[0] == answers[1]
+    assert [ num_paints for num_paints, _ in answers[0] ] == [ 1, 2 ]
+
+    # and now it's cached
+    assert list( service.solve( [ 110, 90, 150 ], PAINTS, 2, 2 ) ) == answers[0]
+    assert service.get_stats()["cache_hits"] - after["cache_hits"] == 1
+
+
+def test_solve_streams_one_json_line_per_recipe_size( service ):
+    server = PaintMixingServer.serve( service, "127.0.0.1", 0 )
+    thread = threading.Thread( target = server.serve_forever, daemon = True )
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection( *server.server_address, timeout = 60 )
+        connection.request( "POST", "/solve", json.dumps( { "target" : "#3c6e46", "paints" : PAINTS, "max_paints" : 3, "top_k" : 2 } ) )
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.getheader( "Transfer-Encoding" ) == "chunked"
+
+        lines = [ json.loads( line ) for line in response.read().decode( "utf-8" ).splitlines() ]
+        assert [ line["num_paints"] for line in lines[:-1] ] == [ 1, 2, 3 ]
+        assert all( len( line["recipes"] ) == 2 for line in lines[:-1] )
+        assert lines[-1] == { "done" : True }
+
+        connection.request( "POST", "/solve", json.dumps( { "target" : [ 1, 2 ] } ) )
+        response = connection.getresponse()
+        assert response.status == 400
+        assert "error" in json.loads( response.read() )
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
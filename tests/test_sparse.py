@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+TARGETS = [ "#8040a0", "#c8a070", "#3c6e46", "#d2343c", "#e6d2aa", "#283c78", "#965a32", "#a0b4be" ]
+
+
+def parse_color( text ):
+    return np.array( [ int( text[i:i + 2], 16 ) for i in ( 1, 3, 5 ) ] ) / 255.0
+
+
+@pytest.mark.parametrize( "target", TARGETS )
+def test_beam_finds_the_best_pair( paint_database, target ):
+    paints = paint_database.get_base_paints()
+    target_rgb = parse_color( target )
+    exhaustive = dict( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 2, 1 ) )
+
+    optimizer = PaintMixing.RecipeOptimizer( paint_database.get_all_paints(), target_rgb, paint_database.get_mixing_model() )
+    solver = PaintMixing.SparseRecipeSolver( optimizer, paints, beam_width = 8 )
+    assert tuple( exhaustive[2][0][2] ) in solver.candidate_combinations( 2 )[2]
+
+    sparse = dict( PaintMixing.solve_recipes( target_rgb, paint_database, paints, 2, 1, search = "sparse", beam_width = 8 ) )
+    assert tuple( sparse[2][0][2] ) == tuple( exhaustive[2][0][2] )
+    assert sparse[2][0][1] == pytest.approx( exhaustive[2][0][1], rel = 1e-6, abs = 1e-12 )
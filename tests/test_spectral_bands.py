@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import PaintMixing
+
+
+@pytest.mark.parametrize( "max_delta_e", [ 0.5, 1.0, 2.0 ] )
+def test_band_grid_stays_within_its_delta_e_bound( paint_database, max_delta_e ):
+    paints = paint_database.get_base_paints()
+    mixing_model = paint_database.get_mixing_model()
+    full_wavelengths, K, S = mixing_model.get_parameter_arrays( paints )
+    wavelengths, band_K, band_S = PaintMixing.reduced_parameter_arrays( mixing_model, paints, max_delta_e )
+
+    assert len( wavelengths ) in PaintMixing.SPECTRAL_LEVELS
+    assert len( wavelengths ) < len( full_wavelengths )
+    assert wavelengths[0] == full_wavelengths[0] and wavelengths[-1] == full_wavelengths[-1]
+
+    # on the mixes it was chosen on, and on mixes it has never seen
+    assert PaintMixing.band_delta_e( full_wavelengths, K, S, len( wavelengths ) ).max() <= max_delta_e
+    unseen = np.random.default_rng( 1 ).dirichlet( np.full( len( paints ), 0.3 ), 500 )
+    assert PaintMixing.band_delta_e( full_wavelengths, K, S, len( wavelengths ), weights = unseen ).max() <= max_delta_e
+
+    # a tighter bound never gets a coarser grid
+    finer = PaintMixing.reduced_parameter_arrays( mixing_model, paints, max_delta_e / 2 )[0]
+    assert len( finer ) >= len( wavelengths )
+
+
+def test_no_bound_is_the_full_grid( paint_database ):
+    paints = paint_database.get_base_paints()
+    mixing_model = paint_database.get_mixing_model()
+    full = mixing_model.get_parameter_arrays( paints )
+    reduced = PaintMixing.reduced_parameter_arrays( mixing_model, paints, None )
+
+    for full_array, reduced_array in zip( full, reduced ):
+        np.testing.assert_array_equal( full_array, reduced_array )
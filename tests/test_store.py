@@ -0,0 +1,44 @@
+import numpy as np
+import PaintMixingStore
+
+
+def recipe( paint_set, weights, diff = 0.01 ):
+    return ( np.array( [ 0.2, 0.4, 0.6 ] ), diff, tuple( paint_set ), np.array( weights ) )
+
+
+def test_recipes_round_trip( tmp_path ):
+    store = PaintMixingStore.RecipeStore( str( tmp_path / "recipes.sqlite" ) )
+    recipes = [ recipe( [ "white", "violet" ], [ 0.7, 0.3 ] ), recipe( [ "white", "magenta" ], [ 0.6, 0.4 ], 0.02 ) ]
+    parts_recipes = [ recipe( [ "white", "violet" ], [ 2.0, 1.0 ] ) + ( 1.5, ) ]
+
+    store.store( ( 128, 64, 160 ), [ "violet", "white", "magenta" ], "library", 2, recipes )
+    store.store( ( 128, 64, 160 ), [ "violet", "white", "magenta" ], "library", 2, parts_recipes, "srgb:parts3" )
+
+    # the paint order doesn't matter, the library and the objective do
+    found = store.lookup( ( 128, 64, 160 ), [ "white", "magenta", "violet" ], 4, "library", num_best = 2 )
+    assert list( found.keys() ) == [ 2 ]
+    for stored, original in zip( found[2], recipes ):
+        np.testing.assert_allclose( stored[0], original[0] )
+        assert stored[1] == original[1] and stored[2] == original[2]
+        np.testing.assert_allclose( stored[3], original[3] )
+
+    assert store.lookup( ( 128, 64, 160 ), [ "white", "magenta", "violet" ], 4, "other library", num_best = 2 ) == {}
+    assert store.lookup( ( 128, 64, 160 ), [ "white", "magenta", "violet" ], 4, "library", num_best = 3 ) == {}
+    assert store.lookup( ( 128, 64, 160 ), [ "white", "magenta", "violet" ], 4, "library", "srgb:parts3", num_best = 1 )[2][0][4] == 1.5
+    store.close()
+
+
+def test_least_recently_used_are_evicted( tmp_path, monkeypatch ):
+    clock = iter( range( 1000 ) )
+    monkeypatch.setattr( PaintMixingStore.time, "time", lambda: float( next( clock ) ) )
+
+    store = PaintMixingStore.RecipeStore( str( tmp_path / "recipes.sqlite" ), max_entries = 3 )
+    for red in range( 3 ):
+        store.store( ( red, 0, 0 ), [ "white" ], "library", 1, [ recipe( [ "white" ], [ 1.0 ] ) ] )
+
+    # touching the first one makes the second the least recently used
+    assert store.lookup( ( 0, 0, 0 ), [ "white" ], 1, "library", num_best = 1 )
+    store.store( ( 3, 0, 0 ), [ "white" ], "library", 1, [ recipe( [ "white" ], [ 1.0 ] ) ] )
+
+    assert [ bool( store.lookup( ( red, 0, 0 ), [ "white" ], 1, "library", num_best = 1 ) ) for red in range( 4 ) ] == [ True, False, True, True ]
+    store.close()